@@ -1,20 +1,62 @@
 from __future__ import absolute_import, unicode_literals, division
 
+import hashlib
 import json
+import time
 import types
 
 from django import forms
 from django.conf import settings
 from django.conf.urls import url
-from django.urls import reverse
+from django.contrib import admin, messages
+from django.contrib.admin.utils import flatten_fieldsets, quote, unquote
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections, models, router, transaction
+from django.forms.models import _get_foreign_key
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
 from django.shortcuts import render
-from django.utils.safestring import mark_safe
+from django.utils.encoding import force_bytes, force_text
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from django.utils.http import urlencode
 from django.utils.translation import ugettext as _
 
-from .models import Lock
-from .settings import DEFAULT_PING_SECONDS, DEFAULT_SHARE_ADMIN_JQUERY
+from . import leases
+from .api import json_encoder
+from .cache import note_opened
+from .hierarchy import register_parent
+from .models import Lock, _object_key
+from .routers import lock_database
+from .timeouts import statement_timeout
+from .timing import request_timing
+from .settings import (DEFAULT_EXPIRATION_SECONDS, DEFAULT_MAX_WAIT_SECONDS, DEFAULT_PING_SECONDS,
+                       DEFAULT_SHARE_ADMIN_JQUERY)
 
-__all__ = ('LockingValidationError', 'LockingAdminMixin')
+__all__ = ('LockingValidationError', 'LockingStaleValidationError',
+           'LockingUnavailableValidationError', 'LockingAdminMixin', 'LockAdmin', 'OPTIMISTIC',
+           'PESSIMISTIC')
+
+# Locking modes, see `LockingAdminMixin.locking_mode`
+PESSIMISTIC = 'pessimistic'
+OPTIMISTIC = 'optimistic'
+
+# Name of the change form field holding the version of the object being edited
+VERSION_FIELD = '_locking_version'
+
+
+def _display_name(user):
+    if user.first_name and user.last_name:
+        return '%s %s' % (user.first_name, user.last_name)
+    return user.username
+
+
+def version_token(obj):
+    """A token that changes whenever any of the values stored in `obj`'s row changes"""
+    values = [force_text(field.value_to_string(obj)) for field in obj._meta.concrete_fields]
+    return hashlib.sha1(force_bytes(json.dumps(values))).hexdigest()
 
 
 class LockingValidationError(forms.ValidationError):
@@ -22,20 +64,47 @@ class LockingValidationError(forms.ValidationError):
 
     def __init__(self, lock, action):
         locked_by = lock.locked_by
-        if locked_by.first_name and locked_by.last_name:
-            locked_by_name = '%s %s' % (locked_by.first_name, locked_by.last_name)
-        else:
-            locked_by_name = locked_by.username
         super(LockingValidationError, self).__init__(
-            self.msg.format(action=action, name=locked_by_name, email=locked_by.email))
+            self.msg.format(action=action, name=_display_name(locked_by), email=locked_by.email))
+
+
+class LockingStaleValidationError(forms.ValidationError):
+    msg = _('You cannot {action} this object because someone else changed it after you '
+            'opened it. Reload the page to see their changes.')
+
+    def __init__(self, action):
+        super(LockingStaleValidationError, self).__init__(self.msg.format(action=action))
+
+
+class LockingUnavailableValidationError(forms.ValidationError):
+    msg = _('You cannot {action} this object right now because its lock could not be '
+            'checked. Please try again in a moment.')
+
+    def __init__(self, action):
+        super(LockingUnavailableValidationError, self).__init__(self.msg.format(action=action))
 
 
 class LockingAdminMixin(object):
 
+    # PESSIMISTIC locks change forms while they are open, which takes a request every
+    # `LOCKING_PING_SECONDS`. OPTIMISTIC makes no requests, and instead rejects saves
+    # of objects that were changed after their form was opened.
+    locking_mode = PESSIMISTIC
+
+    # How long locks last and how often change forms renew them, if not
+    # `LOCKING_EXPIRATION_SECONDS` and `LOCKING_PING_SECONDS`. Locks should last
+    # a few pings, so a lost request or two doesn't lose the lock.
+    locking_expiration_seconds = None
+    locking_ping_seconds = None
+
+    # Whether the lock of an object also covers the objects of its inlines, so
+    # that they can't be edited elsewhere (see `locking.hierarchy`)
+    locking_cover_inlines = False
+
     def __init__(self, *args, **kwargs):
         """Appends the "is_locked" column to this admin's list_display"""
         super(LockingAdminMixin, self).__init__(*args, **kwargs)
-        if 'is_locked' not in self.list_display:
+        if self.locking_mode == PESSIMISTIC and 'is_locked' not in self.list_display:
             if hasattr(self.list_display, 'append'):
                 self.list_display.append('is_locked', )
             else:
@@ -44,8 +113,19 @@ class LockingAdminMixin(object):
         opts = self.model._meta
         self._model_info = (opts.app_label, opts.model_name)
 
+        if self.locking_cover_inlines:
+            for inline in self.inlines:
+                try:
+                    fk = _get_foreign_key(self.model, inline.model, fk_name=inline.fk_name)
+                # Such as generic inlines
+                except ValueError:
+                    continue
+                register_parent(inline.model, fk.name)
+
     @property
     def media(self):
+        if self.locking_mode == OPTIMISTIC:
+            return super(LockingAdminMixin, self).media
         media = super(LockingAdminMixin, self).media + forms.Media(
             js=('locking/js/locking.js',
                 'locking/js/locking.admin.js',
@@ -58,6 +138,8 @@ class LockingAdminMixin(object):
 
     def get_list_display_links(self, *args, **kwargs):
         links = super(LockingAdminMixin, self).get_list_display_links(*args, **kwargs)
+        if self.locking_mode == OPTIMISTIC:
+            return links
         if not links:
             return ('is_locked', )
         elif isinstance(links, list):
@@ -71,25 +153,146 @@ class LockingAdminMixin(object):
         The forms clean method will now raise a validation error if the form
         is locked by someone else.
         """
+        if self.locking_mode == OPTIMISTIC:
+            return self._get_optimistic_form(request, obj, **kwargs)
         form = super(LockingAdminMixin, self).get_form(request, obj, **kwargs)
-        if request.method == 'POST' and obj and Lock.is_locked(obj, for_user=request.user):
-            lock = Lock.objects.for_object(obj)[0]
-
+        if request.method != 'POST' or not obj:
+            return form
+        try:
+            lock = self.get_other_users_lock(request, obj)
+        # Saves aren't let through unchecked when locks can't be read
+        except DatabaseError:
+            def clean(self, *args, **kwargs):
+                raise LockingUnavailableValidationError('save')
+            form.clean = types.MethodType(clean, form)
+            return form
+        if lock is not None:
             def clean(self, *args, **kwargs):
                 raise LockingValidationError(lock, 'save')
             form.clean = types.MethodType(clean, form)
         return form
 
+    def _get_optimistic_form(self, request, obj, **kwargs):
+        """Adds a hidden field with the object's version to the form, and makes the
+        clean method of a submitted form reject a version that isn't current"""
+        if not self._has_version_field(request, obj):
+            return super(LockingAdminMixin, self).get_form(request, obj, **kwargs)
+        if 'fields' not in kwargs:
+            kwargs['fields'] = flatten_fieldsets(self.get_fieldsets(request, obj))
+        if kwargs['fields'] is not None:
+            kwargs['fields'] = [f for f in kwargs['fields'] if f != VERSION_FIELD]
+        form = super(LockingAdminMixin, self).get_form(request, obj, **kwargs)
+        version_field = forms.CharField(widget=forms.HiddenInput, required=False,
+                                        initial=version_token(obj))
+        form = type(form.__name__, (form, ), {VERSION_FIELD: version_field})
+        if (request.method == 'POST' and
+                request.POST.get(VERSION_FIELD) != self.get_current_version(request, obj)):
+            def clean(self, *args, **kwargs):
+                raise LockingStaleValidationError('save')
+            form.clean = types.MethodType(clean, form)
+        return form
+
+    def _has_version_field(self, request, obj):
+        return (self.locking_mode == OPTIMISTIC and obj is not None and
+                self.has_change_permission(request, obj))
+
+    def get_fieldsets(self, request, obj=None):
+        """Adds the version field of optimistic locking to declared fieldsets"""
+        fieldsets = super(LockingAdminMixin, self).get_fieldsets(request, obj)
+        if (self._has_version_field(request, obj) and
+                VERSION_FIELD not in flatten_fieldsets(fieldsets)):
+            name, options = fieldsets[-1]
+            options = dict(options, fields=tuple(options['fields']) + (VERSION_FIELD, ))
+            fieldsets = list(fieldsets[:-1]) + [(name, options)]
+        return fieldsets
+
+    def get_current_version(self, request, obj):
+        """
+        The version of `obj` as it's stored now, for optimistic locking.
+
+        The row is locked until the end of the request's transaction, so that
+        nobody else can change it between this check and the save. Like
+        `get_other_users_lock`, the result is remembered on the request.
+        """
+        checked = request.__dict__.setdefault('_locking_versions', {})
+        key = (self._model_info, obj.pk)
+        if key not in checked:
+            with request_timing(request).measure():
+                objects = self.model._base_manager.db_manager(router.db_for_write(self.model))
+                checked[key] = version_token(objects.select_for_update().get(pk=obj.pk))
+        return checked[key]
+
+    def warn_of_other_editors(self, request, obj):
+        """
+        For optimistic locking, warns the user if someone else opened `obj`'s form
+        in the last `LOCKING_EXPIRATION_SECONDS` (or `locking_expiration_seconds`).
+
+        Who opened a form is remembered in the `LOCKING_CACHE` rather than with a
+        lock, which would stop others from locking the object. If the cache can't
+        be read, no warning is shown.
+        """
+        seconds = self.locking_expiration_seconds
+        if seconds is None:
+            seconds = getattr(settings, 'LOCKING_EXPIRATION_SECONDS', DEFAULT_EXPIRATION_SECONDS)
+        user = request.user
+        with request_timing(request).measure():
+            content_type = ContentType.objects.get_for_model(self.model)
+            object_key = _object_key(content_type, obj.pk)[0]
+            opener = {'pk': user.pk, 'name': _display_name(user), 'email': user.email}
+            try:
+                other = note_opened(content_type.pk, object_key, opener, seconds)
+            # From a DatabaseCache, whose queries `note_opened` runs in a savepoint
+            except DatabaseError:
+                return
+        if other is not None:
+            messages.warning(request, _(
+                '{name} ({email}) opened this form recently and may be editing it. '
+                'If they save first, your changes will be rejected.').format(
+                    name=other['name'], email=other['email']),
+                fail_silently=True)
+
+    def get_other_users_lock(self, request, obj):
+        """
+        The unexpired lock another user holds on `obj`, or None.
+
+        The admin checks this several times per request (get_form is called once
+        for the fieldsets and once for the form, then the delete permission is
+        checked), so the result is remembered on the request. So is the `DatabaseError`
+        raised when locks can't be read within `LOCKING_STATEMENT_TIMEOUT_SECONDS`.
+        """
+        checked = request.__dict__.setdefault('_locking_other_users_locks', {})
+        key = (self._model_info, obj.pk)
+        if key not in checked:
+            with request_timing(request).measure():
+                using = router.db_for_read(Lock)
+                try:
+                    # In a savepoint, so that a failed query doesn't break the
+                    # transaction of the admin view
+                    with transaction.atomic(using=using), statement_timeout(using):
+                        checked[key] = (Lock.objects.for_object(obj)
+                                                    .exclude(locked_by=request.user)
+                                                    .with_owner()
+                                                    .first())
+                except DatabaseError as e:
+                    checked[key] = e
+        if isinstance(checked[key], DatabaseError):
+            raise checked[key]
+        return checked[key]
+
     def has_delete_permission(self, request, obj=None):
-        if obj and Lock.is_locked(obj, for_user=request.user):
-            return False
+        if obj and self.locking_mode == PESSIMISTIC:
+            try:
+                if self.get_other_users_lock(request, obj) is not None:
+                    return False
+            except DatabaseError:
+                return False
         return super(LockingAdminMixin, self).has_delete_permission(request, obj)
 
     def is_locked(self, obj):
         """List Display column to show lock status"""
         html = ('<span id="locking-{obj_id}" data-object-id="{obj_id}" class="locking-status">'
                 '</span>')
-        return mark_safe(html.format(obj_id=obj.pk))
+        return format_html(html, obj_id=obj.pk)
     is_locked.short_description = _('Lock')
 
     @property
@@ -100,12 +303,26 @@ class LockingAdminMixin(object):
     def locking_admin_changelist_js_url_name(self):
         return 'admin_changelist_%s_%s_js' % self._model_info
 
+    def get_object_id_pattern(self):
+        """The regex matching this admin's object ids in URLs, after the primary key type
+        like Django's `int`, `uuid` and `str` path converters"""
+        pk = self.model._meta.pk
+        if isinstance(pk, models.ForeignKey):
+            pk = pk.target_field
+        if isinstance(pk, (models.AutoField, models.IntegerField)):
+            return r'-?[0-9]+'
+        if isinstance(pk, models.UUIDField):
+            return r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'
+        # Other ids are quoted, see `django.contrib.admin.utils.quote`
+        return r'[^/]+'
+
     def get_urls(self):
         """Adds 'locking_admin_form_js' script to the available URLs"""
         urls = super(LockingAdminMixin, self).get_urls()
         locking_urls = [
             # URL For Locking admin form JavaScript
-            url(r'^locking_form.%s_%s_(?P<object_id>[0-9]+).js$' % self._model_info,
+            url(r'^locking_form.%s_%s_(?P<object_id>%s).js$' % (
+                self._model_info + (self.get_object_id_pattern(), )),
                 self.admin_site.admin_view(self.locking_admin_form_js),
                 name=self.locking_admin_form_js_url_name),
 
@@ -123,20 +340,32 @@ class LockingAdminMixin(object):
             'app': app_label,
             'model': model_name,
         }
-        if object_id is not None:
-            reverse_kwargs['object_id'] = object_id
+        if object_id is None:
+            return reverse('locking-api', kwargs=reverse_kwargs)
+
+        reverse_kwargs['object_id'] = quote(object_id)
+        url = reverse('locking-api', kwargs=reverse_kwargs)
+        # The lock API can't know which admin a lock is for, so its lifetime is in the URL
+        if self.locking_expiration_seconds is not None:
+            url += '?' + urlencode({'ttl': self.locking_expiration_seconds})
+        return url
 
-        return reverse('locking-api', kwargs=reverse_kwargs)
+    def get_locking_ping_seconds(self):
+        if self.locking_ping_seconds is not None:
+            return self.locking_ping_seconds
+        return getattr(settings, 'LOCKING_PING_SECONDS', DEFAULT_PING_SECONDS)
 
     def get_json_options(self, request, object_id=None):
         app_label, model_name = self._model_info
 
         return json.dumps({
+            'initialLock': self.get_initial_lock(request, object_id),
             'currentUser': request.user.username,
             'appLabel': app_label,
             'apiURL': self.get_api_url(object_id),
             'modelName': model_name,
-            'ping': getattr(settings, 'LOCKING_PING_SECONDS', DEFAULT_PING_SECONDS),
+            'ping': self.get_locking_ping_seconds(),
+            'wait': getattr(settings, 'LOCKING_MAX_WAIT_SECONDS', DEFAULT_MAX_WAIT_SECONDS),
             'messages': {
                 'lockedByMeText': _('You are currently editing this'),
                 'lockedByUserText': _('Locked by'),
@@ -148,34 +377,102 @@ class LockingAdminMixin(object):
                                         'or a server error, you may not be able '
                                         'to submit this form.'),
             },
-        })
+        }, cls=json_encoder())
+
+    def get_initial_lock(self, request, object_id):
+        """
+        The state the form script of `object_id` starts in, so that it doesn't have to
+        ask the lock API first, or None for it to ask
+
+        Change forms take their lock while they are rendered, see `take_lock`, so by
+        the time their script is loaded either the user holds the lock, which comes
+        with a lease to renew it, or another user's lock covers the object. If locks
+        can't be read, the script asks the lock API.
+        """
+        if object_id is None or self.locking_mode != PESSIMISTIC:
+            return None
+        content_type = ContentType.objects.get_for_model(self.model)
+        try:
+            _, object_id = _object_key(content_type, object_id)
+        except (ValidationError, ValueError):
+            return None
+        try:
+            locks = list(Lock.objects.covering(content_type, object_id).unexpired()
+                                     .with_owner())
+        except DatabaseError:
+            return None
+        others = [lock for lock in locks if lock.locked_by_id != request.user.pk]
+        if others:
+            return {'lockedByMe': False, 'locks': [others[0].to_dict()]}
+        for lock in locks:
+            if lock.content_type_id == content_type.pk and lock.object_id == object_id:
+                return {'lockedByMe': True, 'lease': leases.issue_lease(lock)}
+        return None
+
+    def _render_locking_js(self, request, template_name, object_id=None):
+        timing = request_timing(request)
+        with timing.measure():
+            start = time.time()
+            response = render(request, template_name,
+                              {'options': self.get_json_options(request, object_id)},
+                              content_type="application/javascript")
+            timing.record('serialize', time.time() - start)
+        return timing.apply(response)
 
     def locking_admin_form_js(self, request, object_id):
         """Render out JS code for locking a form for a given object_id on this admin"""
-        return render(request,
-                      'locking/admin_form.js',
-                      {'options': self.get_json_options(request, object_id)},
-                      content_type="application/javascript")
+        return self._render_locking_js(request, 'locking/admin_form.js', unquote(object_id))
 
     def locking_admin_form_js_url(self, object_id):
         """Get the URL for the locking admin form js for a given object_id on this admin"""
         return reverse('admin:' + self.locking_admin_form_js_url_name,
-                       kwargs={'object_id': object_id})
+                       kwargs={'object_id': quote(object_id)})
 
     def locking_admin_changelist_js(self, request):
         """Render out JS code for locking a form for a given object_id on this admin"""
-        return render(request, 'locking/admin_changelist.js',
-                      {'options': self.get_json_options(request)},
-                      content_type="application/javascript")
+        return self._render_locking_js(request, 'locking/admin_changelist.js')
 
     def locking_admin_changelist_js_url(self):
         """Get the URL for the locking admin form js for a given object_id on this admin"""
         return reverse('admin:' + self.locking_admin_changelist_js_url_name)
 
+    def take_lock(self, request, obj):
+        """
+        Try to lock `obj` for the user while rendering its change form, which spares
+        the form script a request to the lock API, see `get_initial_lock`
+
+        Users who may only view the object don't lock it. If the lock can't be taken
+        because of a `DatabaseError`, the error is remembered like in
+        `get_other_users_lock`, so that the form fails closed.
+        """
+        if not self.has_change_permission(request, obj):
+            return
+        # Either way, `get_other_users_lock` needn't check again
+        checked = request.__dict__.setdefault('_locking_other_users_locks', {})
+        key = (self._model_info, obj.pk)
+        with request_timing(request).measure():
+            try:
+                # In a savepoint, like in `get_other_users_lock`
+                with transaction.atomic(using=router.db_for_write(Lock)):
+                    Lock.objects.lock_object_for_user(obj, request.user,
+                                                      seconds=self.locking_expiration_seconds)
+            except Lock.ObjectLockedError as e:
+                checked[key] = e.lock
+            except DatabaseError as e:
+                checked[key] = e
+            else:
+                checked[key] = None
+
     def render_change_form(self, request, context, add=False, obj=None, **kwargs):
         """If editing an existing object, add form locking media to the media context"""
-        if not add and getattr(obj, 'pk', False):
-            locking_media = forms.Media(js=(self.locking_admin_form_js_url(obj.pk), ))
+        if self.locking_mode == OPTIMISTIC:
+            if not add and getattr(obj, 'pk', False) and request.method == 'GET':
+                self.warn_of_other_editors(request, obj)
+        elif not add and getattr(obj, 'pk', False):
+            if request.method == 'GET':
+                self.take_lock(request, obj)
+            with request_timing(request).measure():
+                locking_media = forms.Media(js=(self.locking_admin_form_js_url(obj.pk), ))
             try:
                 str_type = basestring
             except NameError:  # basestring does not exist in Python3
@@ -185,3 +482,154 @@ class LockingAdminMixin(object):
             context['media'] += locking_media
         return super(LockingAdminMixin, self).render_change_form(
             request, context, add=add, obj=obj, **kwargs)
+
+    def change_view(self, request, object_id, *args, **kwargs):
+        """Reports the time and queries locking added to the change form when
+        `LOCKING_SERVER_TIMING` is on"""
+        response = super(LockingAdminMixin, self).change_view(request, object_id, *args, **kwargs)
+        return request_timing(request).apply(response)
+
+
+def estimated_count(queryset):
+    """
+    The number of rows in `queryset`'s table according to the database's statistics,
+    without reading the table, or None if the database doesn't keep any
+    """
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                           [connection.ops.quote_name(table)])
+        elif connection.vendor == 'mysql':
+            cursor.execute('SELECT table_rows FROM information_schema.tables '
+                           'WHERE table_schema = DATABASE() AND table_name = %s', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts unfiltered lists of more than `estimate_above` rows from the database's
+    statistics, as COUNT(*) reads the whole table
+    """
+
+    estimate_above = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if hasattr(queryset, 'query') and not queryset.query.where:
+            estimate = estimated_count(queryset)
+            if estimate is not None and estimate > self.estimate_above:
+                return estimate
+        return super(EstimatedCountPaginator, self).count
+
+
+class ExpiredListFilter(admin.SimpleListFilter):
+    title = _('expired')
+    parameter_name = 'expired'
+
+    def lookups(self, request, model_admin):
+        return (('yes', _('Yes')), ('no', _('No')))
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.filter(date_expires__lt=timezone.now())
+        if self.value() == 'no':
+            return queryset.unexpired()
+        return queryset
+
+
+class RelatedOnlyListFilter(admin.RelatedOnlyFieldListFilter):
+    """Lists the users or content types that hold locks, looked up apart from them, as
+    locks may be kept in another database"""
+
+    def field_choices(self, field, request, model_admin):
+        pks = set(model_admin.get_queryset(request).order_by()
+                             .values_list(self.field_path, flat=True).distinct())
+        return field.get_choices(include_blank=False, limit_choices_to={'pk__in': pks})
+
+
+class LockAdmin(admin.ModelAdmin):
+    """
+    Lists locks for operators to clear stuck ones, and is fit for tables of
+    millions of locks: the list takes a single query, the count of an unfiltered
+    list is estimated, and the "expire now" and "release" actions take a single
+    UPDATE or DELETE for the whole selection. Taking actions needs the
+    `can_unlock` permission. Locks can't be added or edited here.
+    """
+
+    list_display = ('object_id', 'locked_object', 'locked_by', 'date_expires', 'has_expired')
+    list_display_links = None
+    list_filter = (ExpiredListFilter,
+                   ('content_type', RelatedOnlyListFilter),
+                   ('locked_by', RelatedOnlyListFilter))
+    list_select_related = ('locked_by', 'content_type')
+    search_fields = ('=object_id', )
+    ordering = ('-pk', )
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ('expire_now', 'release')
+
+    def __init__(self, *args, **kwargs):
+        super(LockAdmin, self).__init__(*args, **kwargs)
+        # Locks in their own database can't be joined with users and content types,
+        # see `get_queryset`
+        if lock_database() is not None:
+            self.list_select_related = False
+
+    def get_queryset(self, request):
+        locks = super(LockAdmin, self).get_queryset(request)
+        if lock_database() is not None:
+            locks = locks.with_owner()
+        return locks
+
+    def get_actions(self, request):
+        actions = super(LockAdmin, self).get_actions(request)
+        # Loads every selected lock, and its confirmation page lists them all
+        actions.pop('delete_selected', None)
+        if not request.user.has_perm('locking.can_unlock'):
+            return type(actions)()
+        return actions
+
+    def has_add_permission(self, request, *args):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return request.user.has_perm('locking.can_unlock')
+
+    def get_readonly_fields(self, request, obj=None):
+        return [field.name for field in self.model._meta.fields]
+
+    def locked_object(self, lock):
+        """The model of the locked object, linked to its change form"""
+        content_type = ContentType.objects.get_for_id(lock.content_type_id)
+        label = '%s.%s' % (content_type.app_label, content_type.model)
+        try:
+            url = reverse('admin:%s_%s_change' % (content_type.app_label, content_type.model),
+                          args=(quote(lock.object_id), ))
+        except NoReverseMatch:
+            return label
+        return format_html('<a href="{}">{}</a>', url, label)
+    locked_object.short_description = _('Locked object')
+
+    def has_expired(self, lock):
+        return lock.has_expired
+    has_expired.boolean = True
+    has_expired.short_description = _('Expired')
+
+    def expire_now(self, request, queryset):
+        count = queryset.expire_now()
+        self.message_user(request, _('Expired %d locks.') % count, messages.SUCCESS)
+    expire_now.short_description = _('Expire the selected locks now')
+
+    def release(self, request, queryset):
+        count = queryset.release()
+        self.message_user(request, _('Released %d locks.') % count, messages.SUCCESS)
+    release.short_description = _('Release the selected locks')
+
+
+admin.site.register(Lock, LockAdmin)
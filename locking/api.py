@@ -1,29 +1,123 @@
 from __future__ import absolute_import, unicode_literals, division
 
+import time
 from collections import Iterable
 
 from django.conf import settings
+from django.contrib.admin.utils import unquote
 from django.contrib.auth.decorators import login_required
 from django.contrib.contenttypes.models import ContentType
-from django.core.serializers.json import DjangoJSONEncoder
-from django.http import HttpResponse, JsonResponse
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.module_loading import import_string
 from django.views.generic import View
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 
-from .models import Lock
-from .settings import DEFAULT_DELETE_TIMEOUT_SECONDS
+from . import hierarchy, leases, metrics
+from .breaker import circuit_breaker
+from .cache import cached_lock_list, list_cache_enabled, reads_pinned
+from .models import Lock, _object_key
+from .ratelimit import rate_limited, too_many_requests
+from .routers import read_database
+from .timing import request_timing
+from .settings import (DEFAULT_DELETE_TIMEOUT_SECONDS, DEFAULT_JSON_ENCODER,
+                       DEFAULT_MAX_EXPIRATION_SECONDS, DEFAULT_MAX_PAGE_SIZE,
+                       DEFAULT_STREAM_LISTS)
 
-__all__ = ('LockAPIView', )
+__all__ = ('LockAPIView', 'LockListAPIView')
+
+
+def json_encoder():
+    """The JSON encoder class lock API responses are serialized with"""
+    return import_string(getattr(settings, 'LOCKING_JSON_ENCODER', DEFAULT_JSON_ENCODER))
 
 
 class LockingJsonResponse(JsonResponse):
-    def __init__(self, data, encoder=DjangoJSONEncoder, safe=False, **kwargs):
+    def __init__(self, data, encoder=None, safe=False, **kwargs):
+        start = time.time()
+        if encoder is None:
+            encoder = json_encoder()
+        # Lists may have been serialized already, see `cached_lock_list`
         if isinstance(data, Iterable):
-            data = [d.to_dict() for d in data]
+            data = [d if isinstance(d, dict) else d.to_dict() for d in data]
         else:
             data = data.to_dict()
         super(LockingJsonResponse, self).__init__(data, encoder, safe, **kwargs)
+        self.serialization_time = time.time() - start
+
+
+class LockingStreamingJsonResponse(StreamingHttpResponse):
+    """
+    The JSON array of `locks`, fetched and serialized a page of `page_size` locks
+    at a time, so that the whole list is never held in memory
+
+    Pages are fetched in primary key order. Locks gained while the response is
+    streamed may or may not be part of it.
+    """
+
+    def __init__(self, locks, page_size=1000, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super(LockingStreamingJsonResponse, self).__init__(
+            self._chunks(locks.order_by('pk'), page_size), **kwargs)
+
+    def _chunks(self, locks, page_size):
+        encoder = json_encoder()()
+        yield '['
+        separator = ''
+        last_pk = None
+        while True:
+            page = locks if last_pk is None else locks.filter(pk__gt=last_pk)
+            # Sliced querysets fetch related objects, unlike `iterator()`
+            page = list(page[:page_size])
+            if not page:
+                break
+            yield separator + ','.join(encoder.encode(lock.to_dict()) for lock in page)
+            separator = ','
+            last_pk = page[-1].pk
+        yield ']'
+
+
+def _for_reading(locks, user):
+    """Unexpired `locks` with their owners. Lock lists are only informative, so
+    they may come from a replica"""
+    alias = read_database(user)
+    if alias is not None:
+        locks = locks.using(alias)
+    return locks.unexpired().with_owner()
+
+
+def _list_response(request, locks, cached=None):
+    """
+    The response to a request for a list of `locks`
+
+    With a `limit` query parameter, the list is paginated: the response holds
+    up to `limit` locks in primary key order, and a `Link` header points to the
+    next page, which starts after the lock given in its `cursor` parameter.
+    Without it, all the locks are returned, served by `cached()` if given, or
+    streamed with `LOCKING_STREAM_LISTS`.
+    """
+    if 'limit' not in request.GET:
+        if cached is not None:
+            return LockingJsonResponse(cached())
+        if getattr(settings, 'LOCKING_STREAM_LISTS', DEFAULT_STREAM_LISTS):
+            return LockingStreamingJsonResponse(locks)
+        return LockingJsonResponse(locks)
+    try:
+        limit = int(request.GET['limit'])
+        cursor = int(request.GET.get('cursor', 0))
+    except ValueError:
+        return HttpResponse(status=400)
+    if limit < 1:
+        return HttpResponse(status=400)
+    limit = min(limit, getattr(settings, 'LOCKING_MAX_PAGE_SIZE', DEFAULT_MAX_PAGE_SIZE))
+    page = list(locks.filter(pk__gt=cursor).order_by('pk')[:limit + 1])
+    response = LockingJsonResponse(page[:limit])
+    if len(page) > limit:
+        query = request.GET.copy()
+        query['cursor'] = page[limit - 1].pk
+        response['Link'] = '<%s?%s>; rel="next"' % (request.path, query.urlencode())
+    return response
 
 
 class LockAPIView(View):
@@ -31,8 +125,63 @@ class LockAPIView(View):
     http_method_names = ['get', 'post', 'delete', 'put']
 
     @method_decorator(csrf_exempt)
-    @method_decorator(login_required)
+    @method_decorator(circuit_breaker)
     def dispatch(self, request, app, model, object_id=None):
+        timing = request_timing(request)
+        with metrics.timer('locking_api_request_seconds', method=request.method):
+            with timing.measure():
+                response = self._dispatch_lease(request, app, model, object_id)
+                if response is None:
+                    response = self._dispatch(request, app, model, object_id)
+        if hasattr(response, 'serialization_time'):
+            timing.record('serialize', response.serialization_time)
+        return timing.apply(response)
+
+    def _dispatch_lease(self, request, app, model, object_id=None):
+        """
+        Renew or release a lock for the owner of the lease presented with the
+        request, without loading the session or the user
+
+        Returns None to fall back to a logged in request when there's no valid
+        lease for the object, or the lease can't do what's asked.
+        """
+        token = request.META.get('HTTP_' + leases.HEADER.upper().replace('-', '_'))
+        if not token or not object_id or request.method not in ('POST', 'DELETE'):
+            return None
+        lease = leases.read_lease(token)
+        if lease is None:
+            return None
+        try:
+            content_type = ContentType.objects.get_by_natural_key(app, model.lower())
+            _, object_id = _object_key(content_type, unquote(object_id))
+            seconds = self.get_expiration_seconds(request)
+        except (ContentType.DoesNotExist, ValidationError, ValueError):
+            return None
+        model_class = content_type.model_class()
+        # Renewing a child's lock checks the locks of its ancestors
+        if (content_type.pk != lease['ct'] or object_id != lease['id'] or
+                model_class is None or hierarchy.has_parents(model_class)):
+            return None
+
+        response = too_many_requests(lease['owner']['pk'], request.method)
+        if response is not None:
+            return response
+        user = leases.lease_user(lease)
+        if request.method == 'DELETE':
+            if Lock.objects.release_for_user(content_type, object_id, user,
+                                             seconds=self.get_release_seconds()):
+                return HttpResponse(status=204)
+            return None
+        if 'wait' in request.POST:
+            return None
+        lock = Lock.objects.renew_for_user(content_type, object_id, user, seconds=seconds)
+        if lock is None:
+            return None
+        return LockingJsonResponse(lock)
+
+    @method_decorator(rate_limited)
+    @method_decorator(login_required)
+    def _dispatch(self, request, app, model, object_id=None):
         model = model.lower()
         # if the usr can't change the object, they shouldn't be allowed to change the lock
         may_change = '%s.change_%s' % (app, model)
@@ -40,38 +189,103 @@ class LockAPIView(View):
             return HttpResponse(status=401)
 
         try:
-            self.lock_ct_type = ContentType.objects.get(app_label=app, model=model)
+            # get_by_natural_key is served from ContentType's cache after the first hit
+            self.lock_ct_type = ContentType.objects.get_by_natural_key(app, model)
         except ContentType.DoesNotExist:
             return HttpResponse(status=404)
 
         if not object_id and request.method != 'GET':
             return HttpResponse(status=405)
 
+        if object_id:
+            # Object ids are quoted in URLs like the admin's, for string primary keys
+            object_id = unquote(object_id)
+            model_class = self.lock_ct_type.model_class()
+            try:
+                if model_class is not None:
+                    model_class._meta.pk.to_python(object_id)
+            except ValidationError:
+                return HttpResponse(status=404)
+
         return super(LockAPIView, self).dispatch(request, app, model, object_id)
 
+    def get_expiration_seconds(self, request):
+        """
+        The lifetime of the lock asked for with the `ttl` query parameter, capped at
+        `LOCKING_MAX_EXPIRATION_SECONDS`, or None for `LOCKING_EXPIRATION_SECONDS`
+
+        Admins put `ttl` in the lock API URLs they hand to their change forms.
+        """
+        if 'ttl' not in request.GET:
+            return None
+        seconds = float(request.GET['ttl'])
+        if not seconds > 0:
+            raise ValueError('ttl must be positive')
+        return min(seconds, getattr(settings, 'LOCKING_MAX_EXPIRATION_SECONDS',
+                                    DEFAULT_MAX_EXPIRATION_SECONDS))
+
+    def get_release_seconds(self):
+        return getattr(settings, 'LOCKING_DELETE_TIMEOUT_SECONDS', DEFAULT_DELETE_TIMEOUT_SECONDS)
+
+    def with_lease(self, response, lock):
+        """Hand the owner of `lock` a lease to renew and release it with, see `locking.leases`"""
+        token = leases.issue_lease(lock)
+        if token is not None:
+            response[leases.HEADER] = token
+        return response
+
     def get(self, request, app, model, object_id=None):
-        locks = (Lock.objects.filter(content_type=self.lock_ct_type)
-                             .unexpired()
-                             .select_related('locked_by'))
         if object_id:
-            locks = locks.filter(object_id=object_id)
-        return LockingJsonResponse(locks)
+            locks = Lock.objects.for_object_id(self.lock_ct_type, object_id)
+            return LockingJsonResponse(_for_reading(locks, request.user))
+        locks = _for_reading(Lock.objects.filter(content_type=self.lock_ct_type), request.user)
+        cached = None
+        # Users reading from the primary to see their own changes skip the cache,
+        # which may hold a list read from a replica
+        if list_cache_enabled() and not reads_pinned(request.user.pk):
+            def cached():
+                return cached_lock_list(self.lock_ct_type.pk,
+                                        lambda: [lock.to_dict() for lock in locks])
+        return _list_response(request, locks, cached)
 
     def post(self, request, app, model, object_id):
-        """Create or maintain a lock on an object if possible"""
+        """
+        Create or maintain a lock on an object if possible
+
+        If a `wait` value (in seconds) is posted and another user holds the lock,
+        the response is held until the lock is freed or `wait` seconds pass.
+        """
+        try:
+            wait = float(request.POST.get('wait', 0))
+            seconds = self.get_expiration_seconds(request)
+        except ValueError:
+            return HttpResponse(status=400)
         try:
-            lock = Lock.objects.lock_for_user(content_type=self.lock_ct_type,
-                                              object_id=object_id,
-                                              user=request.user)
+            if wait > 0:
+                lock = Lock.objects.wait_lock_for_user(content_type=self.lock_ct_type,
+                                                       object_id=object_id,
+                                                       user=request.user,
+                                                       timeout=wait,
+                                                       seconds=seconds)
+            else:
+                lock = Lock.objects.lock_for_user(content_type=self.lock_ct_type,
+                                                  object_id=object_id,
+                                                  user=request.user,
+                                                  seconds=seconds)
         # Another user already has a lock
         except Lock.ObjectLockedError as e:
             return LockingJsonResponse([e.lock], status=409)
-        return LockingJsonResponse(lock)
+        return self.with_lease(LockingJsonResponse(lock), lock)
 
     def put(self, request, app, model, object_id):
         """Create lock on an object, even if it was already locked"""
-        lock = Lock.objects.force_lock_for_user(self.lock_ct_type, object_id, request.user)
-        return LockingJsonResponse(lock, status=200)
+        try:
+            seconds = self.get_expiration_seconds(request)
+        except ValueError:
+            return HttpResponse(status=400)
+        lock = Lock.objects.force_lock_for_user(self.lock_ct_type, object_id, request.user,
+                                                seconds=seconds)
+        return self.with_lease(LockingJsonResponse(lock, status=200), lock)
 
     def delete(self, request, app, model, object_id):
         """
@@ -81,22 +295,41 @@ class LockAPIView(View):
         settings, the lock is set to epxire in that many seconds rather than
         deleted instantly
         """
-        try:
-            lock = Lock.objects.get(content_type=self.lock_ct_type,
-                                    object_id=object_id)
-        # The lock never existed or has already been removed
-        except Lock.DoesNotExist:
-            return HttpResponse(status=204)
-
-        # Check if the lock belongs to the user
-        if lock.locked_by != request.user:
+        released = Lock.objects.release_for_user(self.lock_ct_type, object_id, request.user,
+                                                 seconds=self.get_release_seconds())
+        # The lock belongs to another user
+        if not released:
             return HttpResponse(status=401)
+        return HttpResponse(status=204)
 
-        seconds = getattr(settings,
-                          'LOCKING_DELETE_TIMEOUT_SECONDS',
-                          DEFAULT_DELETE_TIMEOUT_SECONDS)
-        if seconds == 0:
-            lock.delete()
-        else:
-            lock.expire(seconds)
+
+class LockListAPIView(View):
+    """
+    The unexpired locks on objects of every model the user may change
+
+    Takes a single query, however many models are locked.
+    """
+
+    http_method_names = ['get', 'delete']
+
+    @method_decorator(csrf_exempt)
+    @method_decorator(circuit_breaker)
+    @method_decorator(rate_limited)
+    @method_decorator(login_required)
+    def dispatch(self, request):
+        timing = request_timing(request)
+        with metrics.timer('locking_api_request_seconds', method=request.method):
+            with timing.measure():
+                response = super(LockListAPIView, self).dispatch(request)
+        if hasattr(response, 'serialization_time'):
+            timing.record('serialize', response.serialization_time)
+        return timing.apply(response)
+
+    def get(self, request):
+        locks = _for_reading(Lock.objects.visible_to(request.user), request.user)
+        return _list_response(request, locks.order_by('content_type', 'date_expires'))
+
+    def delete(self, request):
+        """Release all the user's locks, such as when they close the last of their forms"""
+        Lock.objects.release_all_for_user(request.user)
         return HttpResponse(status=204)
@@ -3,7 +3,28 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 from django.apps import AppConfig
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import post_delete, post_save
+
+from .settings import DEFAULT_RELEASE_ON_LOGOUT
 
 
 class LockingConfig(AppConfig):
     name = 'locking'
+
+    def ready(self):
+        from . import audit, metrics, receivers, routers
+        if metrics.enabled():
+            metrics.connect()
+        if audit.enabled():
+            audit.connect()
+        if routers.lock_database() is not None:
+            post_delete.connect(routers.delete_user_locks, sender=get_user_model(),
+                                dispatch_uid='locking_delete_user_locks')
+        post_save.connect(receivers.release_locks_on_deactivation, sender=get_user_model(),
+                          dispatch_uid='locking_release_locks_on_deactivation')
+        if getattr(settings, 'LOCKING_RELEASE_ON_LOGOUT', DEFAULT_RELEASE_ON_LOGOUT):
+            user_logged_out.connect(receivers.release_locks_on_logout,
+                                    dispatch_uid='locking_release_locks_on_logout')
@@ -0,0 +1,186 @@
+from __future__ import absolute_import, unicode_literals, division
+
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DatabaseError, connections, router, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import signals
+from .models import LockEvent
+from .settings import (DEFAULT_AUDIT_BUFFER_SIZE, DEFAULT_AUDIT_ENABLED,
+                       DEFAULT_AUDIT_FLUSH_SECONDS)
+
+__all__ = ('buffer', 'connect', 'disconnect', 'enabled')
+
+logger = logging.getLogger('locking.audit')
+
+
+def enabled():
+    return getattr(settings, 'LOCKING_AUDIT_ENABLED', DEFAULT_AUDIT_ENABLED)
+
+
+def _flush_seconds():
+    return getattr(settings, 'LOCKING_AUDIT_FLUSH_SECONDS', DEFAULT_AUDIT_FLUSH_SECONDS)
+
+
+class AuditBuffer(object):
+    """
+    Lock events waiting to be written
+
+    Events are written with a single `bulk_create` once `LOCKING_AUDIT_BUFFER_SIZE`
+    of them were recorded, or the oldest of them is `LOCKING_AUDIT_FLUSH_SECONDS`
+    old, and when the process exits. While the buffer is started, they are written
+    by a background thread, every `LOCKING_AUDIT_FLUSH_SECONDS` and as soon as the
+    buffer is full, so that requests recording events never write them in their
+    own transaction. Events of a process that is killed are lost.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = []
+        self._oldest = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, event):
+        with self._lock:
+            if not self._events:
+                self._oldest = time.time()
+            self._events.append(event)
+            full = (len(self._events) >=
+                    getattr(settings, 'LOCKING_AUDIT_BUFFER_SIZE', DEFAULT_AUDIT_BUFFER_SIZE) or
+                    time.time() - self._oldest >= _flush_seconds())
+        # Threads don't survive a fork, so forked processes start their own
+        if self._thread is not None and not self._thread.is_alive() and not self._stop.is_set():
+            self.start()
+        if full:
+            if self._thread is not None:
+                self._wake.set()
+            else:
+                self.flush()
+
+    def start(self):
+        """Start the background thread, unless it's running already"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._wake.clear()
+            self._thread = threading.Thread(target=self._flush_until_stopped,
+                                            name='locking-audit-flush')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background thread. Buffered events stay in the buffer."""
+        self._stop.set()
+        self._wake.set()
+        thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            thread.join()
+
+    def _flush_until_stopped(self):
+        connection = connections[router.db_for_write(LockEvent)]
+        try:
+            while True:
+                self._wake.wait(_flush_seconds())
+                self._wake.clear()
+                if self._stop.is_set():
+                    return
+                # The database may have closed the connection since the last round
+                connection.close_if_unusable_or_obsolete()
+                self.flush()
+        finally:
+            # Each thread has its own connections
+            connection.close()
+
+    def flush(self):
+        """Write all buffered events, returning how many were written"""
+        with self._lock:
+            events, self._events = self._events, []
+        if not events:
+            return 0
+        try:
+            # In a savepoint, not to break the transaction of whoever flushes
+            with transaction.atomic(using=router.db_for_write(LockEvent)):
+                LockEvent.objects.bulk_create(events)
+        # The audit log must never break locking
+        except DatabaseError:
+            logger.exception('Could not write %d lock events', len(events))
+            return 0
+        return len(events)
+
+    def __len__(self):
+        return len(self._events)
+
+
+buffer = AuditBuffer()
+
+
+def _record(action, content_type_id, object_id, user_id, date=None):
+    buffer.add(LockEvent(action=action, content_type_id=content_type_id, object_id=object_id,
+                         user_id=user_id, date=date or timezone.now()))
+
+
+def _on_acquired(sender, lock, user, **kwargs):
+    _record(LockEvent.ACQUIRED, lock.content_type_id, lock.object_id, user.pk)
+
+
+def _on_contended(sender, lock, user, **kwargs):
+    _record(LockEvent.CONTENDED, lock.content_type_id, lock.object_id, user.pk)
+
+
+def _on_forced(sender, lock, user, **kwargs):
+    _record(LockEvent.FORCED, lock.content_type_id, lock.object_id, user.pk)
+
+
+def _on_released(sender, content_type, object_id, user, **kwargs):
+    _record(LockEvent.RELEASED, content_type.pk, object_id, user.pk)
+
+
+def _on_expired(sender, lock, **kwargs):
+    _record(LockEvent.EXPIRED, lock.content_type_id, lock.object_id, lock.locked_by_id,
+            date=lock.date_expires)
+
+
+RECEIVERS = (
+    (signals.lock_acquired, _on_acquired),
+    (signals.lock_contended, _on_contended),
+    (signals.lock_forced, _on_forced),
+    (signals.lock_released, _on_released),
+    (signals.lock_expired, _on_expired),
+)
+
+
+def connect():
+    """Start recording lock events, and writing them from a background thread. Only
+    connected when the audit log is enabled, so that expired locks aren't looked up
+    before being deleted otherwise."""
+    for signal, func in RECEIVERS:
+        signal.connect(func, dispatch_uid='locking.audit.%s' % func.__name__)
+    buffer.start()
+
+
+def disconnect():
+    for signal, func in RECEIVERS:
+        signal.disconnect(func, dispatch_uid='locking.audit.%s' % func.__name__)
+    buffer.stop()
+
+
+atexit.register(buffer.flush)
+
+
+@receiver(setting_changed)
+def _audit_setting_changed(sender, setting, value, **kwargs):
+    if setting == 'LOCKING_AUDIT_ENABLED':
+        if value:
+            connect()
+        else:
+            disconnect()
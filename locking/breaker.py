@@ -0,0 +1,111 @@
+from __future__ import absolute_import, unicode_literals, division
+
+import logging
+import math
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.http import HttpResponse
+
+from .settings import (DEFAULT_BREAKER_FAILURES, DEFAULT_BREAKER_RESET_SECONDS,
+                       DEFAULT_BREAKER_SLOW_SECONDS)
+
+__all__ = ('breaker', 'circuit_breaker')
+
+logger = logging.getLogger('locking.breaker')
+
+
+class CircuitBreaker(object):
+    """
+    Tracks whether lock requests are failing, in the current process
+
+    After `LOCKING_BREAKER_FAILURES` requests in a row failed with a database
+    error or took longer than `LOCKING_BREAKER_SLOW_SECONDS`, the breaker opens
+    for `LOCKING_BREAKER_RESET_SECONDS`. Then a single request is let through to
+    probe the database: if it succeeds the breaker closes, otherwise it opens
+    again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def retry_after(self):
+        """Seconds until requests may be tried again if the breaker is open, otherwise
+        None, letting the request through"""
+        with self._lock:
+            if self.opened_at is None:
+                return None
+            reset_seconds = getattr(settings, 'LOCKING_BREAKER_RESET_SECONDS',
+                                    DEFAULT_BREAKER_RESET_SECONDS)
+            remaining = self.opened_at + reset_seconds - time.time()
+            if remaining > 0 or self.probing:
+                return max(int(math.ceil(remaining)), 1)
+            self.probing = True
+            return None
+
+    def record(self, succeeded):
+        with self._lock:
+            self.probing = False
+            if succeeded:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if (self.opened_at is not None or self.failures >=
+                    getattr(settings, 'LOCKING_BREAKER_FAILURES', DEFAULT_BREAKER_FAILURES)):
+                if self.opened_at is None:
+                    logger.warning('Lock requests failed %d times in a row, refusing them for '
+                                   'a while', self.failures)
+                self.opened_at = time.time()
+
+
+breaker = CircuitBreaker()
+
+
+def service_unavailable(retry_after):
+    response = HttpResponse(status=503)
+    response['Retry-After'] = retry_after
+    return response
+
+
+def circuit_breaker(view_func):
+    """
+    Answers with 503 and a `Retry-After` header while the breaker is open, without
+    touching the database, and turns database errors into the same response
+
+    Requests waiting for a lock to be released are slow on purpose, so only their
+    errors are counted. Does nothing unless `LOCKING_BREAKER_FAILURES` is set.
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if not getattr(settings, 'LOCKING_BREAKER_FAILURES', DEFAULT_BREAKER_FAILURES):
+            return view_func(request, *args, **kwargs)
+        retry_after = breaker.retry_after()
+        if retry_after is not None:
+            return service_unavailable(retry_after)
+        started = time.time()
+        succeeded = False
+        try:
+            response = view_func(request, *args, **kwargs)
+            succeeded = response.status_code < 500 and (
+                time.time() - started <
+                getattr(settings, 'LOCKING_BREAKER_SLOW_SECONDS', DEFAULT_BREAKER_SLOW_SECONDS) or
+                'wait' in request.POST)
+        except DatabaseError:
+            logger.exception('Lock request failed')
+            response = service_unavailable(
+                getattr(settings, 'LOCKING_BREAKER_RESET_SECONDS', DEFAULT_BREAKER_RESET_SECONDS))
+        finally:
+            breaker.record(succeeded)
+        return response
+    return _wrapped_view
@@ -0,0 +1,148 @@
+from __future__ import absolute_import, unicode_literals, division
+
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.db import router, transaction
+
+from .settings import DEFAULT_CACHE, DEFAULT_LIST_CACHE_SECONDS, DEFAULT_WAIT_POLL_SECONDS
+
+__all__ = ('cached_lock_list', 'get_cache', 'invalidate_lock_list', 'list_cache_enabled',
+           'note_opened', 'notify_released', 'pin_reads', 'reads_pinned', 'release_version')
+
+
+def get_cache():
+    return caches[getattr(settings, 'LOCKING_CACHE', DEFAULT_CACHE)]
+
+
+def _release_key(content_type_id, object_key):
+    return 'locking:released:%s:%s' % (content_type_id, object_key)
+
+
+def release_version(content_type_id, object_key):
+    """A value that changes every time the lock on an object is released"""
+    return get_cache().get(_release_key(content_type_id, object_key), 0)
+
+
+def _bump(key):
+    """Change the value of a version key"""
+    cache = get_cache()
+    # add() is a no-op if the key already exists, so incr() always has a key to work on
+    cache.add(key, 0)
+    try:
+        cache.incr(key)
+    # The key was evicted between add() and incr()
+    except ValueError:
+        cache.set(key, 1)
+
+
+def notify_released(content_type_id, object_key):
+    """Wake up any requests waiting for the lock on an object"""
+    _bump(_release_key(content_type_id, object_key))
+
+
+@contextmanager
+def _savepoint(cache):
+    """Runs the block in a savepoint if `cache` is a `DatabaseCache`, so that its errors
+    don't break the transaction of the caller"""
+    if isinstance(cache, DatabaseCache):
+        with transaction.atomic(using=router.db_for_write(cache.cache_model_class)):
+            yield
+    else:
+        yield
+
+
+def _opened_key(content_type_id, object_key):
+    return 'locking:opened:%s:%s' % (content_type_id, object_key)
+
+
+def note_opened(content_type_id, object_key, opener, seconds):
+    """
+    Remember for `seconds` that `opener`, a dict of a user's `pk`, `name` and
+    `email`, opened the form of an object, and return who had opened it before
+    them in that time if it was someone else, or None
+    """
+    cache = get_cache()
+    key = _opened_key(content_type_id, object_key)
+    with _savepoint(cache):
+        previous = cache.get(key)
+        cache.set(key, opener, seconds)
+    if previous is None or previous['pk'] == opener['pk']:
+        return None
+    return previous
+
+
+def _pin_key(user_pk):
+    return 'locking:pinned:%s' % user_pk
+
+
+def pin_reads(user_pk, seconds):
+    """Mark a user's reads as needing the primary database for `seconds`"""
+    get_cache().set(_pin_key(user_pk), True, seconds)
+
+
+def reads_pinned(user_pk):
+    return get_cache().get(_pin_key(user_pk), False)
+
+
+def _list_cache_seconds():
+    return getattr(settings, 'LOCKING_LIST_CACHE_SECONDS', DEFAULT_LIST_CACHE_SECONDS)
+
+
+def list_cache_enabled():
+    return bool(_list_cache_seconds())
+
+
+def _list_version_key(content_type_id):
+    return 'locking:list-version:%s' % content_type_id
+
+
+def invalidate_lock_list(content_type_id):
+    """Drop the cached lock list of a content type, after a lock was gained or lost"""
+    if _list_cache_seconds():
+        _bump(_list_version_key(content_type_id))
+
+
+# How many times requests check the cache for a list another request computes
+_FILL_WAIT_POLLS = 10
+
+
+def cached_lock_list(content_type_id, compute):
+    """
+    The serialized lock list of a content type, from the cache or `compute()`
+
+    Lists are kept for `LOCKING_LIST_CACHE_SECONDS`, under the version of the
+    content type's list, so a list computed before a lock changed is never
+    served after it. Only one request computes a missing list; the others wait
+    for it to be cached, for up to `_FILL_WAIT_POLLS` rounds of
+    `LOCKING_WAIT_POLL_SECONDS`, before computing it themselves.
+    """
+    seconds = _list_cache_seconds()
+    if not seconds:
+        return compute()
+    cache = get_cache()
+    version = cache.get(_list_version_key(content_type_id), 0)
+    key = 'locking:list:%s:%s' % (content_type_id, version)
+    data = cache.get(key)
+    if data is not None:
+        return data
+    filling_key = key + ':filling'
+    if not cache.add(filling_key, True, seconds):
+        poll = getattr(settings, 'LOCKING_WAIT_POLL_SECONDS', DEFAULT_WAIT_POLL_SECONDS)
+        deadline = time.time() + min(seconds, poll * _FILL_WAIT_POLLS)
+        while time.time() < deadline:
+            time.sleep(poll)
+            data = cache.get(key)
+            if data is not None:
+                return data
+        return compute()
+    try:
+        data = compute()
+        cache.set(key, data, seconds)
+    finally:
+        # Whether or not the list could be computed, so that others don't wait for it
+        cache.delete(filling_key)
+    return data
@@ -0,0 +1,119 @@
+from __future__ import absolute_import, unicode_literals, division
+
+__all__ = ('ancestors', 'ancestors_in_bulk', 'descendants', 'has_children', 'has_parents',
+           'register_parent')
+
+# Child model -> names of its foreign keys to the parents whose locks cover it
+_parents = {}
+
+
+def register_parent(model, field_name):
+    """
+    Make locks on the object that `model`'s `field_name` foreign key points to
+    cover `model`'s objects too.
+
+    A child of a locked parent is reported as locked by `Lock.is_locked` and
+    `LockingManager.for_object`, and other users can't lock it. Only the parent's
+    lock is stored and renewed. Likewise, a parent can't be locked while another
+    user holds the lock of one of its children.
+    """
+    field = model._meta.get_field(field_name)
+    if not field.many_to_one:
+        raise ValueError('%s.%s is not a foreign key' % (model._meta.label, field_name))
+    names = _parents.setdefault(model, [])
+    if field_name not in names:
+        names.append(field_name)
+
+
+def has_parents(model):
+    return bool(_parents.get(model))
+
+
+def has_children(model):
+    return any(child._meta.get_field(field_name).related_model is model
+               for child, names in _parents.items() for field_name in names)
+
+
+def _ancestor_paths(model, prefix='', seen=()):
+    """(lookup path, model) of all ancestors of `model`. Self-referencing
+    models only cover their direct children."""
+    seen += (model, )
+    for field_name in _parents.get(model, ()):
+        parent = model._meta.get_field(field_name).related_model
+        path = prefix + field_name
+        yield path, parent
+        if parent not in seen:
+            for ancestor in _ancestor_paths(parent, path + '__', seen):
+                yield ancestor
+
+
+def ancestors(model, object_id, instance=None):
+    """
+    (model, primary key) of the objects whose locks cover object `object_id` of `model`
+
+    Parents are read from `instance` when it's given. Grandparents and beyond,
+    or parents without an `instance`, take one query.
+    """
+    result = []
+    deep = []
+    for path, parent in _ancestor_paths(model):
+        if instance is not None and '__' not in path:
+            result.append((parent, getattr(instance, model._meta.get_field(path).attname)))
+        else:
+            deep.append((path, parent))
+    if deep:
+        values = (model._base_manager.filter(pk=object_id)
+                                     .values_list(*[path for path, _ in deep])
+                                     .first())
+        if values is not None:
+            result.extend((parent, pk) for (_, parent), pk in zip(deep, values))
+    return [(parent, pk) for parent, pk in result if pk is not None]
+
+
+def ancestors_in_bulk(model, instances):
+    """
+    {primary key: [(model, primary key), ...]} of the objects whose locks cover
+    each of `instances` of `model`
+
+    Like `ancestors`, but grandparents and beyond of all the instances are looked
+    up with a single query.
+    """
+    paths = list(_ancestor_paths(model))
+    deep = [(path, parent) for path, parent in paths if '__' in path]
+    result = dict((obj.pk, [(parent, getattr(obj, model._meta.get_field(path).attname))
+                            for path, parent in paths if '__' not in path])
+                  for obj in instances)
+    if deep and result:
+        rows = (model._base_manager.filter(pk__in=list(result))
+                                   .values_list('pk', *[path for path, _ in deep]))
+        for row in rows:
+            result[row[0]].extend((parent, pk) for (_, parent), pk in zip(deep, row[1:]))
+    return dict((obj_pk, [(parent, pk) for parent, pk in parents if pk is not None])
+                for obj_pk, parents in result.items())
+
+
+def _descendant_paths(model, suffix='', seen=()):
+    """(lookup path, model) of all descendants of `model`, the path leading from
+    the descendant to `model`. Self-referencing models only cover their direct
+    children."""
+    seen += (model, )
+    for child, names in list(_parents.items()):
+        for field_name in names:
+            if child._meta.get_field(field_name).related_model is not model:
+                continue
+            path = field_name + suffix
+            yield path, child
+            if child not in seen:
+                for descendant in _descendant_paths(child, '__' + path, seen):
+                    yield descendant
+
+
+def descendants(model, object_id):
+    """
+    (model, queryset) of the objects covered by the lock of object `object_id` of
+    `model`, one per descendant model
+
+    The querysets aren't evaluated, so that they can be used as subqueries.
+    """
+    return [(child, child._base_manager.filter(**{path: object_id}))
+            for path, child in _descendant_paths(model)]
@@ -0,0 +1,50 @@
+from __future__ import absolute_import, unicode_literals, division
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+
+from .settings import DEFAULT_LEASE_SECONDS
+
+__all__ = ('HEADER', 'issue_lease', 'lease_user', 'read_lease')
+
+# Leases are handed out and presented in this header
+HEADER = 'X-Locking-Lease'
+_SALT = 'locking.lease'
+_OWNER_FIELDS = ('username', 'first_name', 'last_name', 'email')
+
+
+def _lease_seconds():
+    return getattr(settings, 'LOCKING_LEASE_SECONDS', DEFAULT_LEASE_SECONDS)
+
+
+def issue_lease(lock):
+    """
+    A signed token that lets the owner of `lock` renew and release it for the next
+    `LOCKING_LEASE_SECONDS` without logging in, or None if leases are disabled
+
+    The lease names the lock's owner, so that responses to renewals can show them
+    without loading the user.
+    """
+    if not _lease_seconds():
+        return None
+    owner = dict((field, getattr(lock.locked_by, field)) for field in _OWNER_FIELDS)
+    owner['pk'] = lock.locked_by_id
+    return signing.dumps({'ct': lock.content_type_id, 'id': lock.object_id, 'owner': owner},
+                         salt=_SALT, compress=True)
+
+
+def read_lease(token):
+    """The contents of a lease token, or None if it's forged, expired or disabled"""
+    max_age = _lease_seconds()
+    if not max_age:
+        return None
+    try:
+        return signing.loads(token, salt=_SALT, max_age=max_age)
+    except signing.BadSignature:
+        return None
+
+
+def lease_user(lease):
+    """An unsaved user with the primary key and names of the lease's owner"""
+    return get_user_model()(**lease['owner'])
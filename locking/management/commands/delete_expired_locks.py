@@ -4,5 +4,14 @@ from locking.models import Lock
 
 
 class Command(BaseCommand):
-    def handle(self):
-        Lock.objects.delete_expired()
+    help = 'Delete expired locks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Locks deleted per statement, see locking_stats for a '
+                                 'suggestion. Default: all at once')
+
+    def handle(self, *args, **options):
+        count = Lock.objects.delete_expired(batch_size=options['batch_size'])
+        if options['verbosity'] > 1:
+            self.stdout.write('Deleted %d expired locks' % count)
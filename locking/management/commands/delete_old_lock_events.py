@@ -0,0 +1,34 @@
+from __future__ import absolute_import, unicode_literals, division
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from locking.models import LockEvent
+from locking.settings import DEFAULT_AUDIT_RETENTION_DAYS
+
+
+class Command(BaseCommand):
+    help = 'Delete lock events older than LOCKING_AUDIT_RETENTION_DAYS from the audit log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=None,
+                            help='Keep this many days of events. '
+                                 'Default: LOCKING_AUDIT_RETENTION_DAYS')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Events deleted per statement, so that the table is never '
+                                 'locked for long. Default: 10000')
+
+    def handle(self, *args, **options):
+        days = options['days']
+        if days is None:
+            days = getattr(settings, 'LOCKING_AUDIT_RETENTION_DAYS', DEFAULT_AUDIT_RETENTION_DAYS)
+        old = LockEvent.objects.filter(date__lt=timezone.now() - timezone.timedelta(days=days))
+        deleted = 0
+        while True:
+            pks = list(old.values_list('pk', flat=True)[:options['batch_size']])
+            if not pks:
+                break
+            count, _ = LockEvent.objects.filter(pk__in=pks).delete()
+            deleted += count
+        self.stdout.write('Deleted %d lock events' % deleted)
@@ -0,0 +1,88 @@
+from __future__ import absolute_import, unicode_literals, division
+
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db.models import Case, Count, IntegerField, When
+from django.utils import timezone
+
+from locking.models import LockEvent
+
+
+def _model_name(content_type_id):
+    content_type = ContentType.objects.get_for_id(content_type_id)
+    return '%s.%s' % (content_type.app_label, content_type.model)
+
+
+def hold_durations(events):
+    """
+    {content type id: [seconds]} of the time each lock was held, from `events`
+    ordered by object and date
+
+    A hold starts when a user acquires or takes over a lock, and ends when they
+    release it, it expires or someone else takes it over.
+    """
+    durations = defaultdict(list)
+    holder = None
+    for event in events:
+        key = (event.content_type_id, event.object_id)
+        if holder is not None and holder[0] != key:
+            holder = None
+        if holder is not None and event.action in (LockEvent.RELEASED, LockEvent.EXPIRED,
+                                                   LockEvent.FORCED):
+            _, user_id, start = holder
+            if event.action == LockEvent.FORCED or event.user_id == user_id:
+                durations[key[0]].append((event.date - start).total_seconds())
+                holder = None
+        if event.action in (LockEvent.ACQUIRED, LockEvent.FORCED):
+            holder = (key, event.user_id, event.date)
+    return durations
+
+
+class Command(BaseCommand):
+    help = 'Summarize the lock audit log: transitions per model, hold times and contended objects'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=7,
+                            help='Report on this many days of events. Default: 7')
+        parser.add_argument('--top', type=int, default=10,
+                            help='Number of most contended objects to list. Default: 10')
+
+    def handle(self, *args, **options):
+        write = self.stdout.write
+        since = timezone.now() - timezone.timedelta(days=options['days'])
+        events = LockEvent.objects.filter(date__gte=since)
+
+        counts = defaultdict(lambda: defaultdict(int))
+        for row in events.values('content_type', 'action').annotate(count=Count('pk')):
+            counts[row['content_type']][row['action']] = row['count']
+        transitions = (events.exclude(action=LockEvent.CONTENDED)
+                             .order_by('content_type', 'object_id', 'date', 'pk'))
+        durations = hold_durations(transitions.iterator())
+
+        write('Lock events since %s' % since.strftime('%Y-%m-%d %H:%M'))
+        write('')
+        write('%-30s %9s %9s %9s %9s %9s %10s %10s' % (
+            'model', 'acquired', 'forced', 'contended', 'released', 'expired',
+            'mean hold', 'max hold'))
+        for content_type_id in sorted(counts, key=_model_name):
+            actions = counts[content_type_id]
+            held = durations.get(content_type_id, [])
+            write('%-30s %9d %9d %9d %9d %9d %9.0fs %9.0fs' % (
+                _model_name(content_type_id), actions[LockEvent.ACQUIRED],
+                actions[LockEvent.FORCED], actions[LockEvent.CONTENDED],
+                actions[LockEvent.RELEASED], actions[LockEvent.EXPIRED],
+                sum(held) / len(held) if held else 0, max(held) if held else 0))
+
+        contended = (events.filter(action__in=(LockEvent.CONTENDED, LockEvent.FORCED))
+                           .values('content_type', 'object_id')
+                           .annotate(total=Count('pk'),
+                                     forced=Count(Case(When(action=LockEvent.FORCED, then=1),
+                                                       output_field=IntegerField())))
+                           .order_by('-total')[:options['top']])
+        write('')
+        write('Most contended objects (refused lock requests and takeovers):')
+        for row in contended:
+            write('%-30s %-20s %6d %6d forced' % (
+                _model_name(row['content_type']), row['object_id'], row['total'], row['forced']))
@@ -0,0 +1,247 @@
+from __future__ import absolute_import, unicode_literals, division
+
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections
+from django.test import Client
+from django.urls import reverse
+
+from locking.models import Lock
+from locking.settings import DEFAULT_PING_SECONDS
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0.0
+    index = int(math.ceil(percent / 100 * len(values))) - 1
+    return values[min(max(index, 0), len(values) - 1)]
+
+
+class Stats(object):
+    """Latencies, status codes and query counts gathered by all editors"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(int)
+        self.queries = 0
+        self.errors = []
+
+    def record(self, method, status, seconds, queries):
+        with self._lock:
+            self.latencies[method].append(seconds)
+            self.statuses[(method, status)] += 1
+            self.queries += queries
+
+    def error(self, exc):
+        with self._lock:
+            self.errors.append(exc)
+
+
+class Editor(threading.Thread):
+    """
+    A simulated editor following the admin's client protocol: open a change form
+    and ping it with POST every `ping` seconds, poll the changelist with GET,
+    occasionally take over a lock with PUT, and DELETE the lock on leaving.
+    """
+
+    def __init__(self, client, model, stats, options, deadline):
+        super(Editor, self).__init__()
+        self.daemon = True
+        self.client = client
+        self.model = model
+        self.stats = stats
+        self.options = options
+        self.deadline = deadline
+        self.random = random.Random()
+        self.queries = 0
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def url(self, object_id=None):
+        kwargs = {'app': self.model._meta.app_label, 'model': self.model._meta.model_name}
+        if object_id is not None:
+            kwargs['object_id'] = object_id
+        return reverse('locking-api', kwargs=kwargs)
+
+    def request(self, method, object_id=None):
+        self.queries = 0
+        start = time.time()
+        try:
+            status = getattr(self.client, method.lower())(self.url(object_id)).status_code
+        # Such as SQLite's "database is locked", which is worth reporting rather than dying on
+        except DatabaseError:
+            status = 'error'
+        self.stats.record(method, status, time.time() - start, self.queries)
+        return status
+
+    def sleep(self, seconds):
+        time.sleep(max(0, min(seconds, self.deadline - time.time())))
+
+    def run(self):
+        # Connections are per thread, so this only counts this editor's queries
+        wrapped = [c for c in connections.all() if hasattr(c, 'execute_wrappers')]
+        for connection in wrapped:
+            connection.execute_wrappers.append(self._count_query)
+        try:
+            # Spread out the first requests like editors arriving over a ping interval
+            self.sleep(self.random.uniform(0, self.options['ping']))
+            while time.time() < self.deadline:
+                self.edit()
+        except Exception as e:
+            self.stats.error(e)
+        finally:
+            for connection in wrapped:
+                connection.execute_wrappers.remove(self._count_query)
+            connections.close_all()
+
+    def edit(self):
+        """Open one change form, keep it open for a few pings, then leave it"""
+        object_id = self.random.randint(1, self.options['objects'])
+        has_lock = False
+        for _ in range(self.random.randint(1, self.options['pings_per_form'] * 2)):
+            if time.time() >= self.deadline:
+                break
+            status = self.request('POST', object_id)
+            if status == 409 and self.random.random() < self.options['takeover_rate']:
+                status = self.request('PUT', object_id)
+            has_lock = status == 200
+            if self.random.random() < self.options['changelist_rate']:
+                self.request('GET')
+            self.sleep(self.options['ping'])
+        # Like the browser, only unlock on leaving if the form held the lock
+        if has_lock:
+            self.request('DELETE', object_id)
+
+
+class Command(BaseCommand):
+    help = ('Simulate a fleet of editors against the locking API and report throughput, '
+            'latency, contention and database queries.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help='The model to lock, as app_label.ModelName. '
+                                          'Objects do not need to exist.')
+        parser.add_argument('--editors', type=int, default=20,
+                            help='Number of simulated editors (threads). Default: 20')
+        parser.add_argument('--duration', type=float, default=30,
+                            help='Seconds to run for. Default: 30')
+        parser.add_argument('--objects', type=int, default=None,
+                            help='Number of distinct object ids editors choose from. Fewer '
+                                 'objects means more contention. Default: the number of editors')
+        parser.add_argument('--ping', type=float, default=None,
+                            help='Seconds between pings. Default: LOCKING_PING_SECONDS')
+        parser.add_argument('--pings-per-form', type=int, default=4,
+                            help='Average number of pings before an editor leaves a form. '
+                                 'Default: 4')
+        parser.add_argument('--takeover-rate', type=float, default=0.05,
+                            help='Chance that an editor takes over a lock held by someone '
+                                 'else. Default: 0.05')
+        parser.add_argument('--changelist-rate', type=float, default=0.25,
+                            help='Chance of a changelist poll after each ping. Default: 0.25')
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options['model'])
+        except (LookupError, ValueError) as e:
+            raise CommandError(e)
+        if options['objects'] is None:
+            options['objects'] = options['editors']
+        if options['ping'] is None:
+            options['ping'] = getattr(settings, 'LOCKING_PING_SECONDS', DEFAULT_PING_SECONDS)
+
+        content_type = ContentType.objects.get_for_model(model)
+        users = self.create_users(model, options['editors'])
+        stats = Stats()
+        clients = []
+        # Don't log a warning for every 409
+        request_logger = logging.getLogger('django.request')
+        log_level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        try:
+            host = self.host()
+            for user in users:
+                client = Client(HTTP_HOST=host)
+                client.force_login(user)
+                clients.append(client)
+            start = time.time()
+            deadline = start + options['duration']
+            editors = [Editor(client, model, stats, options, deadline) for client in clients]
+            for editor in editors:
+                editor.start()
+            for editor in editors:
+                editor.join()
+            elapsed = time.time() - start
+        finally:
+            request_logger.setLevel(log_level)
+            for client in clients:
+                client.logout()
+            Lock.objects.filter(content_type=content_type, locked_by__in=users).delete()
+            get_user_model().objects.filter(pk__in=[u.pk for u in users]).delete()
+
+        self.report(stats, elapsed, options)
+
+    def host(self):
+        """A host name the test client can use that passes ALLOWED_HOSTS"""
+        for host in settings.ALLOWED_HOSTS:
+            if '*' not in host:
+                return host.lstrip('.')
+        return 'localhost' if not settings.ALLOWED_HOSTS else 'testserver'
+
+    def create_users(self, model, count):
+        """Create temporary staff users that may change `model`"""
+        opts = model._meta
+        permission = Permission.objects.get(content_type__app_label=opts.app_label,
+                                            codename='change_%s' % opts.model_name)
+        prefix = 'locking-loadtest-%s' % uuid.uuid4().hex[:8]
+        users = []
+        for i in range(count):
+            user = get_user_model().objects.create_user('%s-%d' % (prefix, i))
+            user.is_staff = True
+            user.save()
+            user.user_permissions.add(permission)
+            users.append(user)
+        return users
+
+    def report(self, stats, elapsed, options):
+        write = self.stdout.write
+        total = sum(len(v) for v in stats.latencies.values())
+        write('Database: %s' % connections[Lock.objects.db].vendor)
+        write('Editors: %d, objects: %d, ping: %ss, duration: %.1fs'
+              % (options['editors'], options['objects'], options['ping'], elapsed))
+        write('Requests: %d (%.1f/s), queries per request: %.2f'
+              % (total, total / elapsed if elapsed else 0, stats.queries / total if total else 0))
+        write('')
+        write('%-8s %8s %10s %10s %10s %8s' % ('method', 'requests', 'p50 ms', 'p95 ms',
+                                               'p99 ms', 'status'))
+        for method in ('POST', 'PUT', 'GET', 'DELETE'):
+            latencies = sorted(stats.latencies.get(method, []))
+            statuses = ' '.join('%s:%d' % (status, count)
+                                for (m, status), count in stats.statuses.items()
+                                if m == method)
+            write('%-8s %8d %10.2f %10.2f %10.2f %s' % (
+                method, len(latencies), percentile(latencies, 50) * 1000,
+                percentile(latencies, 95) * 1000, percentile(latencies, 99) * 1000, statuses))
+
+        posts = len(stats.latencies.get('POST', []))
+        if posts:
+            write('')
+            write('409 rate: %.1f%% of POSTs' % (100 * stats.statuses[('POST', 409)] / posts))
+        if stats.errors:
+            write('')
+            write(self.style.ERROR('%d editors failed, first error: %r'
+                                   % (len(stats.errors), stats.errors[0])))
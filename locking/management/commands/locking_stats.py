@@ -0,0 +1,137 @@
+from __future__ import absolute_import, unicode_literals, division
+
+import json
+import math
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db.models import (Avg, Case, Count, DateTimeField, DurationField, ExpressionWrapper,
+                              F, IntegerField, Max, Min, Value, When)
+from django.utils import timezone
+
+from locking.models import Lock
+from locking.settings import DEFAULT_EXPIRATION_SECONDS
+
+# Bounds of the suggested `delete_expired_locks --batch-size`
+MIN_BATCH_SIZE = 100
+MAX_BATCH_SIZE = 10000
+# Shortest suggested interval between runs of `delete_expired_locks`
+MIN_INTERVAL_SECONDS = 10
+
+
+def suggest_reaper(expired, oldest_expired, now, expiration_seconds):
+    """
+    (rate of expiry in locks per second, batch size, interval in seconds) to run
+    `delete_expired_locks` with
+
+    Expired locks accumulate at `expired` locks since the `oldest_expired` of them.
+    Reaping once per lock lifetime keeps them under a lifetime's worth, in batches
+    of twice what accumulates in between, unless that's too many for one batch,
+    in which case the reaper should run more often.
+    """
+    rate = 0.0
+    if expired and oldest_expired is not None:
+        rate = expired / max((now - oldest_expired).total_seconds(), 1)
+    interval = expiration_seconds
+    if rate * interval * 2 > MAX_BATCH_SIZE:
+        interval = max(MAX_BATCH_SIZE / (rate * 2), MIN_INTERVAL_SECONDS)
+    batch_size = int(min(max(math.ceil(rate * interval * 2), MIN_BATCH_SIZE), MAX_BATCH_SIZE))
+    return rate, batch_size, int(math.ceil(interval))
+
+
+def _model_name(content_type_id):
+    content_type = ContentType.objects.get_for_id(content_type_id)
+    return '%s.%s' % (content_type.app_label, content_type.model)
+
+
+def _isoformat(date):
+    return date.isoformat() if date is not None else None
+
+
+class Command(BaseCommand):
+    help = ('Report on the size and health of the lock table, with a few aggregate queries, '
+            'and suggest how to run delete_expired_locks')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=('table', 'json'), default='table',
+                            help='Output format. Default: table')
+        parser.add_argument('--top', type=int, default=10,
+                            help='Number of models with the most locks to list. Default: 10')
+
+    def gather(self, top):
+        now = timezone.now()
+        locks = Lock.objects.all()
+        is_expired = When(date_expires__lt=now, then=1)
+        expired = (locks.filter(date_expires__lt=now)
+                        .aggregate(count=Count('pk'), oldest=Min('date_expires')))
+        remaining = ExpressionWrapper(F('date_expires') - Value(now, output_field=DateTimeField()),
+                                      output_field=DurationField())
+        live = (locks.filter(date_expires__gte=now)
+                     .aggregate(count=Count('pk'), ttl=Avg(remaining),
+                                latest=Max('date_expires')))
+        # Primary keys grow, so the lowest is the longest-standing lock. Locks don't
+        # record when they were gained, so this is as far as the table tells
+        oldest = (locks.filter(date_expires__gte=now).order_by('pk')
+                       .values('pk', 'content_type', 'object_id', 'locked_by', 'date_expires')
+                       .first())
+        per_model = (locks.values('content_type')
+                          .annotate(count=Count('pk'),
+                                    expired=Count(Case(is_expired, output_field=IntegerField())))
+                          .order_by('-count')[:top])
+        expiration_seconds = getattr(settings, 'LOCKING_EXPIRATION_SECONDS',
+                                     DEFAULT_EXPIRATION_SECONDS)
+        rate, batch_size, interval = suggest_reaper(expired['count'], expired['oldest'], now,
+                                                    expiration_seconds)
+        total = expired['count'] + live['count']
+        return {
+            'date': _isoformat(now),
+            'total': total,
+            'live': live['count'],
+            'expired': expired['count'],
+            'expired_ratio': expired['count'] / total if total else 0.0,
+            'oldest_expired': _isoformat(expired['oldest']),
+            'mean_ttl_seconds': live['ttl'].total_seconds() if live['ttl'] is not None else None,
+            'latest_expiration': _isoformat(live['latest']),
+            'oldest_live': oldest and {
+                'id': oldest['pk'],
+                'model': _model_name(oldest['content_type']),
+                'object_id': oldest['object_id'],
+                'locked_by': oldest['locked_by'],
+                'date_expires': _isoformat(oldest['date_expires']),
+            },
+            'models': [{'model': _model_name(row['content_type']), 'locks': row['count'],
+                        'expired': row['expired']} for row in per_model],
+            'expiry_rate_per_minute': rate * 60,
+            'suggested_batch_size': batch_size,
+            'suggested_interval_seconds': interval,
+        }
+
+    def handle(self, *args, **options):
+        stats = self.gather(options['top'])
+        if options['format'] == 'json':
+            self.stdout.write(json.dumps(stats, indent=2, sort_keys=True))
+            return
+
+        write = self.stdout.write
+        write('Locks:                %d' % stats['total'])
+        write('  live:               %d' % stats['live'])
+        write('  expired:            %d (%.1f%%)' % (
+            stats['expired'], stats['expired_ratio'] * 100))
+        write('Oldest expired lock:  %s' % (stats['oldest_expired'] or '-'))
+        if stats['mean_ttl_seconds'] is not None:
+            write('Mean remaining TTL:   %.0fs' % stats['mean_ttl_seconds'])
+        oldest = stats['oldest_live']
+        if oldest:
+            write('Oldest live lock:     #%d on %s %s by user %s, expires %s' % (
+                oldest['id'], oldest['model'], oldest['object_id'], oldest['locked_by'],
+                oldest['date_expires']))
+        write('')
+        write('%-40s %10s %10s' % ('model', 'locks', 'expired'))
+        for row in stats['models']:
+            write('%-40s %10d %10d' % (row['model'], row['locks'], row['expired']))
+        write('')
+        write('Expiry rate:          %.1f locks per minute' % stats['expiry_rate_per_minute'])
+        write('Suggested reaper:     python manage.py delete_expired_locks --batch-size %d, '
+              'every %d seconds' % (stats['suggested_batch_size'],
+                                    stats['suggested_interval_seconds']))
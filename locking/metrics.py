@@ -0,0 +1,207 @@
+from __future__ import absolute_import, unicode_literals, division
+
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+
+from . import signals
+from .settings import DEFAULT_METRICS_ENABLED
+
+__all__ = ('registry', 'timed', 'timer', 'prometheus_metrics')
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+HELP = {
+    'locking_acquisitions_total': ('counter', 'Locks gained on free or expired objects'),
+    'locking_renewals_total': ('counter', 'Locks extended by their owner'),
+    'locking_contentions_total': ('counter', 'Lock requests refused because of another owner'),
+    'locking_takeovers_total': ('counter', 'Existing locks taken over with force_lock_for_user'),
+    'locking_releases_total': ('counter', 'Locks released by their owner'),
+    'locking_expired_deleted_total': ('counter', 'Expired locks deleted by delete_expired'),
+    'locking_operation_seconds': ('histogram', 'Time spent in LockingManager operations'),
+    'locking_api_request_seconds': ('histogram', 'Time spent in LockAPIView requests'),
+}
+
+
+def enabled():
+    return getattr(settings, 'LOCKING_METRICS_ENABLED', DEFAULT_METRICS_ENABLED)
+
+
+class Registry(object):
+    """A process local store of counters and histograms"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = defaultdict(float)
+            self.histograms = {}
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self.counters[key] += value
+
+    def observe(self, name, value, labels=None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+            histogram = self.histograms[key]
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((k, dict(v, buckets=list(v['buckets'])))
+                                for k, v in self.histograms.items())
+        lines = []
+        described = set()
+
+        def describe(name):
+            if name not in described:
+                described.add(name)
+                metric_type, help_text = HELP[name]
+                lines.append('# HELP %s %s' % (name, help_text))
+                lines.append('# TYPE %s %s' % (name, metric_type))
+
+        for (name, labels), value in counters:
+            describe(name)
+            lines.append('%s%s %s' % (name, _format_labels(labels), _format_value(value)))
+        for (name, labels), histogram in histograms:
+            describe(name)
+            for bound, count in zip(BUCKETS, histogram['buckets']):
+                bucket_labels = labels + (('le', _format_value(bound)), )
+                lines.append('%s_bucket%s %d' % (name, _format_labels(bucket_labels), count))
+            inf_labels = labels + (('le', '+Inf'), )
+            lines.append('%s_bucket%s %d' % (name, _format_labels(inf_labels),
+                                             histogram['count']))
+            lines.append('%s_sum%s %s' % (name, _format_labels(labels),
+                                          _format_value(histogram['sum'])))
+            lines.append('%s_count%s %d' % (name, _format_labels(labels), histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, v) for k, v in labels)
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else '%d' % value
+
+
+registry = Registry()
+
+
+def timed(operation):
+    """Decorator recording the duration of a `LockingManager` operation"""
+    def decorator(func):
+        @wraps(func)
+        def _wrapped(*args, **kwargs):
+            if not enabled():
+                return func(*args, **kwargs)
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                registry.observe('locking_operation_seconds', time.time() - start,
+                                 {'operation': operation})
+        return _wrapped
+    return decorator
+
+
+@contextmanager
+def timer(name, **labels):
+    """Context manager recording the duration of its block in histogram `name`"""
+    if not enabled():
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        registry.observe(name, time.time() - start, labels)
+
+
+def _model_label(content_type_id):
+    content_type = ContentType.objects.get_for_id(content_type_id)
+    return {'model': '%s.%s' % (content_type.app_label, content_type.model)}
+
+
+def _on_acquired(sender, lock, **kwargs):
+    registry.inc('locking_acquisitions_total', _model_label(lock.content_type_id))
+
+
+def _on_renewed(sender, lock, **kwargs):
+    registry.inc('locking_renewals_total', _model_label(lock.content_type_id))
+
+
+def _on_contended(sender, lock, **kwargs):
+    registry.inc('locking_contentions_total', _model_label(lock.content_type_id))
+
+
+def _on_forced(sender, lock, **kwargs):
+    registry.inc('locking_takeovers_total', _model_label(lock.content_type_id))
+
+
+def _on_released(sender, content_type, **kwargs):
+    registry.inc('locking_releases_total', _model_label(content_type.pk))
+
+
+def _on_expired(sender, count, **kwargs):
+    registry.inc('locking_expired_deleted_total', value=count)
+
+
+RECEIVERS = (
+    (signals.lock_acquired, _on_acquired),
+    (signals.lock_renewed, _on_renewed),
+    (signals.lock_contended, _on_contended),
+    (signals.lock_forced, _on_forced),
+    (signals.lock_released, _on_released),
+    (signals.locks_expired, _on_expired),
+)
+
+
+def connect():
+    """Start counting lock signals. Only connected when metrics are enabled, so
+    that signals without receivers stay free to send."""
+    for signal, func in RECEIVERS:
+        signal.connect(func, dispatch_uid='locking.metrics.%s' % func.__name__)
+
+
+def disconnect():
+    for signal, func in RECEIVERS:
+        signal.disconnect(func, dispatch_uid='locking.metrics.%s' % func.__name__)
+
+
+@receiver(setting_changed)
+def _metrics_setting_changed(sender, setting, value, **kwargs):
+    if setting == 'LOCKING_METRICS_ENABLED':
+        if value:
+            connect()
+        else:
+            disconnect()
+
+
+def prometheus_metrics(request):
+    """Expose the metrics of the current process in the Prometheus text format"""
+    if not enabled():
+        raise Http404
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4')
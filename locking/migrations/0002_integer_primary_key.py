@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# Unexpired locks are held here while the primary key column is changed
+_locks = []
+
+
+def stash_locks(apps, schema_editor):
+    """Set aside unexpired locks and empty the table, as the old "ct.objid" keys
+    can't be converted to integers (and vice versa)"""
+    Lock = apps.get_model('locking', 'Lock')
+    locks = Lock.objects.using(schema_editor.connection.alias)
+    _locks[:] = list(locks.filter(date_expires__gte=timezone.now()).values(
+        'locked_by_id', 'date_expires', 'content_type_id', 'object_id'))
+    locks.all().delete()
+
+
+def restore_locks(apps, schema_editor):
+    Lock = apps.get_model('locking', 'Lock')
+    char_pk = isinstance(Lock._meta.pk, models.CharField)
+    locks = []
+    for values in _locks:
+        if char_pk:
+            values['id'] = '%s.%s' % (values['content_type_id'], values['object_id'])
+        locks.append(Lock(**values))
+    Lock.objects.using(schema_editor.connection.alias).bulk_create(locks)
+    _locks[:] = []
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locking', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(stash_locks, restore_locks, hints={'model_name': 'lock'}),
+        migrations.AlterField(
+            model_name='lock',
+            name='id',
+            field=models.AutoField(auto_created=True, primary_key=True, serialize=False,
+                                   verbose_name='ID'),
+        ),
+        migrations.RunPython(restore_locks, stash_locks, hints={'model_name': 'lock'}),
+    ]
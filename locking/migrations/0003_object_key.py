@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models.functions import Cast
+
+
+def set_object_keys(apps, schema_editor):
+    """Until now only integer primary keys could be locked, and those are their own key"""
+    Lock = apps.get_model('locking', 'Lock')
+    (Lock.objects.using(schema_editor.connection.alias)
+                 .update(object_key=Cast('object_id', models.BigIntegerField())))
+
+
+def delete_non_integer_locks(apps, schema_editor):
+    """Locks on objects with other types of primary keys can't be migrated back"""
+    Lock = apps.get_model('locking', 'Lock')
+    locks = Lock.objects.using(schema_editor.connection.alias)
+    non_integer = [pk for pk, object_id in locks.values_list('pk', 'object_id')
+                   if not object_id.isdigit()]
+    locks.filter(pk__in=non_integer).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locking', '0002_integer_primary_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lock',
+            name='object_key',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='lock',
+            name='object_id',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.RunPython(set_object_keys, delete_non_integer_locks,
+                             hints={'model_name': 'lock'}),
+        migrations.AlterField(
+            model_name='lock',
+            name='object_key',
+            field=models.BigIntegerField(editable=False),
+        ),
+        migrations.AlterUniqueTogether(
+            name='lock',
+            unique_together=set([('content_type', 'object_key')]),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Like `locking.models.Lock`, see `LOCKING_DATABASE`
+SEPARATE_DATABASE = getattr(settings, 'LOCKING_DATABASE', None) is not None
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contenttypes', '0001_initial'),
+        ('locking', '0003_object_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='lock',
+            name='content_type',
+            field=models.ForeignKey(
+                db_constraint=not SEPARATE_DATABASE,
+                on_delete=models.DO_NOTHING if SEPARATE_DATABASE else models.CASCADE,
+                to='contenttypes.ContentType'),
+        ),
+        migrations.AlterField(
+            model_name='lock',
+            name='locked_by',
+            field=models.ForeignKey(
+                db_constraint=not SEPARATE_DATABASE,
+                on_delete=models.DO_NOTHING if SEPARATE_DATABASE else models.CASCADE,
+                to=settings.AUTH_USER_MODEL),
+        ),
+    ]
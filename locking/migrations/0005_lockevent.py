@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Like `locking.models.LockEvent`, see `LOCKING_DATABASE`
+SEPARATE_DATABASE = getattr(settings, 'LOCKING_DATABASE', None) is not None
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contenttypes', '0001_initial'),
+        ('locking', '0004_separate_database'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LockEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False,
+                                        verbose_name='ID')),
+                ('object_id', models.CharField(max_length=255)),
+                ('action', models.CharField(choices=[
+                    ('acquired', 'acquired'),
+                    ('contended', 'refused, locked by someone else'),
+                    ('forced', 'taken over'),
+                    ('released', 'released'),
+                    ('expired', 'expired')], max_length=10)),
+                ('date', models.DateTimeField(db_index=True)),
+                ('content_type', models.ForeignKey(
+                    db_constraint=not SEPARATE_DATABASE,
+                    on_delete=models.DO_NOTHING if SEPARATE_DATABASE else models.CASCADE,
+                    related_name='+', to='contenttypes.ContentType')),
+                ('user', models.ForeignKey(
+                    db_constraint=not SEPARATE_DATABASE,
+                    on_delete=models.DO_NOTHING if SEPARATE_DATABASE else models.CASCADE,
+                    related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locking', '0005_lockevent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='lock',
+            name='date_expires',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
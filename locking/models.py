@@ -1,97 +1,740 @@
 from __future__ import absolute_import, unicode_literals, division
 
+import copy
+import hashlib
+import numbers
+import struct
+import threading
+import time
+from functools import partial
+
+from django.apps import apps
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import DatabaseError, IntegrityError, connections, models, router, transaction
 from django.utils import timezone
+from django.utils.encoding import force_bytes, force_text
 
-from .settings import DEFAULT_EXPIRATION_SECONDS
+from . import hierarchy, signals
+from .cache import invalidate_lock_list, list_cache_enabled, notify_released, release_version
+from .metrics import timed
+from .routers import lock_database, pin_user_reads
+from .timeouts import after_commit, bounded
+from .settings import (DEFAULT_EXPIRATION_SECONDS, DEFAULT_MAX_WAIT_SECONDS,
+                       DEFAULT_WAIT_POLL_SECONDS)
 
 
-__all__ = ('Lock', )
+__all__ = ('Lock', 'LockEvent')
 
 
 class QueryMixin(object):
     def unexpired(self):
         return self.filter(date_expires__gte=timezone.now())
 
+    def for_object_id(self, content_type, object_id):
+        """Locks on the object of type `content_type` with primary key `object_id`"""
+        return self.filter(**_lookup(content_type, object_id))
+
+    def covering(self, content_type, object_id, instance=None):
+        """
+        Locks on the object of type `content_type` with primary key `object_id`, and
+        on its ancestors, see `locking.hierarchy.register_parent`
+
+        The object's parents are read from `instance`, if given.
+        """
+        return self.filter(_covering_q(content_type, object_id, instance))
+
+    def locked_map(self, instances, for_user=None):
+        """
+        {instance: lock} of those of `instances` that are locked, by their own lock
+        or one of their ancestors', other than by `for_user`
+
+        Instances may be of any number of models. Their locks are fetched with a
+        single query, plus one per model with grandparents, see
+        `locking.hierarchy.register_parent`.
+        """
+        by_model = {}
+        for obj in instances:
+            if obj.pk is not None:
+                by_model.setdefault(obj._meta.concrete_model, []).append(obj)
+        # (content type id, object key, object id) of a lock -> the instances it covers
+        covered = {}
+        keys = {}
+        for model, objs in by_model.items():
+            parents = (hierarchy.ancestors_in_bulk(model, objs)
+                       if hierarchy.has_parents(model) else {})
+            content_type = ContentType.objects.get_for_model(model)
+            for obj in objs:
+                for lock_model, pk in [(model, obj.pk)] + parents.get(obj.pk, []):
+                    lock_ct = (content_type if lock_model is model
+                               else ContentType.objects.get_for_model(lock_model))
+                    object_key, object_id = _object_key(lock_ct, pk)
+                    keys.setdefault(lock_ct.pk, set()).add(object_key)
+                    covered.setdefault((lock_ct.pk, object_key, object_id), []).append(obj)
+        if not keys:
+            return {}
+        q = models.Q()
+        for content_type_id, object_keys in keys.items():
+            q |= models.Q(content_type_id=content_type_id, object_key__in=sorted(object_keys))
+        locks = self.filter(q).unexpired()
+        if for_user is not None:
+            locks = locks.exclude(locked_by=for_user)
+        result = {}
+        for lock in locks.with_owner():
+            for obj in covered.get((lock.content_type_id, lock.object_key, lock.object_id), ()):
+                result.setdefault(obj, lock)
+        return result
+
+    def prefetch_for(self, instances, for_user=None, to_attr='lock'):
+        """
+        Set the `to_attr` attribute of each of `instances` to the lock returned for
+        it by `locked_map`, or None, and return the instances
+
+        Lets templates and serializers show which objects are locked without a
+        query per object.
+        """
+        instances = list(instances)
+        locks = self.locked_map(instances, for_user=for_user)
+        for obj in instances:
+            setattr(obj, to_attr, locks.get(obj) if obj.pk is not None else None)
+        return instances
+
+    def visible_to(self, user):
+        """
+        Locks on objects of the models `user` may change, which are the locks the
+        lock API shows them
+
+        The user's permissions are turned into content types in bulk, from the
+        permissions cached on the user and the ContentType cache.
+        """
+        if user.is_active and user.is_superuser:
+            return self.all()
+        changeable = []
+        for perm in user.get_all_permissions():
+            app_label, _, codename = perm.partition('.')
+            if not codename.startswith('change_'):
+                continue
+            try:
+                changeable.append(apps.get_model(app_label, codename[len('change_'):]))
+            except LookupError:
+                continue
+        content_types = ContentType.objects.get_for_models(*changeable, for_concrete_models=False)
+        return self.filter(content_type_id__in=[ct.pk for ct in content_types.values()])
+
+    def expire_now(self):
+        """
+        Expire the locks with a single UPDATE, whoever holds them, returning how
+        many were expired
+
+        Unlike releasing them, this leaves the locks for `delete_expired`, and
+        the audit log, to pick up.
+        """
+        return self._end(lambda locks: locks.update(date_expires=timezone.now()))
+
+    def release(self):
+        """Delete the locks with a single DELETE, whoever holds them, returning how
+        many were released"""
+        return self._end(lambda locks: locks.delete()[0])
+
+    def _end(self, end):
+        """
+        Run `end` on the locks, then wake up the requests waiting for them and
+        invalidate the cached lock lists of their models
+
+        Locks are only looked up if requests may be waiting for them, or lists
+        are cached.
+        """
+        locks = self.all()
+        waited_for = []
+        if getattr(settings, 'LOCKING_MAX_WAIT_SECONDS', DEFAULT_MAX_WAIT_SECONDS):
+            waited_for = list(locks.values_list('content_type', 'object_key'))
+        content_types = set()
+        if list_cache_enabled():
+            content_types = set(locks.order_by().values_list('content_type', flat=True)
+                                     .distinct())
+        count = end(locks)
+        for content_type_id, object_key in waited_for:
+            notify_released(content_type_id, object_key)
+        for content_type_id in content_types:
+            invalidate_lock_list(content_type_id)
+        return count
+
+    def with_owner(self):
+        """
+        Fetch `locked_by` along with the locks: joined if users are kept in the
+        same database as locks, or with a second query if they aren't
+        """
+        user_model = self.model._meta.get_field('locked_by').related_model
+        user_db = router.db_for_read(user_model)
+        if user_db == self.db:
+            return self.select_related('locked_by')
+        return self.prefetch_related(
+            models.Prefetch('locked_by', queryset=user_model._default_manager.using(user_db)))
+
 
 class LockingQuerySet(QueryMixin, models.query.QuerySet):
     pass
 
 
+def _object_key(content_type, object_id):
+    """
+    The 64 bit integer a lock on an object is indexed by, and its normalized id
+
+    Integer primary keys are their own key. Other primary keys (UUIDs, strings)
+    are hashed, and as two ids could share a hash, locks are always looked up by
+    both their key and their id.
+    """
+    model = content_type.model_class()
+    if model is not None:
+        object_id = model._meta.pk.to_python(object_id)
+    if isinstance(object_id, numbers.Integral) and -2 ** 63 <= object_id < 2 ** 63:
+        return int(object_id), force_text(object_id)
+    object_id = force_text(object_id)
+    object_key, = struct.unpack(b'>q', hashlib.sha1(force_bytes(object_id)).digest()[:8])
+    return object_key, object_id
+
+
+# How many keys are matched at once where the database doesn't limit query parameters
+_KEY_BATCH_SIZE = 1000
+
+
+def _lookup(content_type, object_id):
+    object_key, object_id = _object_key(content_type, object_id)
+    return {'content_type': content_type, 'object_key': object_key, 'object_id': object_id}
+
+
+def _covering_q(content_type, object_id, instance=None):
+    """Matches the locks on an object and on its ancestors, in a single query"""
+    q = models.Q(**_lookup(content_type, object_id))
+    model = content_type.model_class()
+    if model is not None and hierarchy.has_parents(model):
+        for parent, pk in hierarchy.ancestors(model, object_id, instance):
+            q |= models.Q(**_lookup(ContentType.objects.get_for_model(parent), pk))
+    return q
+
+
+def _expiration_date(seconds=None):
+    if seconds is None:
+        seconds = getattr(settings, 'LOCKING_EXPIRATION_SECONDS', DEFAULT_EXPIRATION_SECONDS)
+    return timezone.now() + timezone.timedelta(seconds=seconds)
+
+
 class LockingManager(QueryMixin, models.Manager):
 
-    def delete_expired(self):
-        """Delete all expired locks from the database"""
-        self.filter(date_expires__lt=timezone.now()).delete()
+    @property
+    def _write_db(self):
+        """The database locks are written to. Reads deciding on a write are made
+        there too, as a replica may not have seen the latest writes yet"""
+        return self._db or router.db_for_write(self.model)
+
+    @timed('delete_expired')
+    def delete_expired(self, batch_size=None):
+        """
+        Delete all expired locks from the database, returning how many were deleted
+
+        With a `batch_size`, locks are deleted that many at a time, so that a
+        large backlog of expired locks doesn't hold a long-running DELETE on the
+        table every open form writes to.
+        """
+        expired = self.filter(date_expires__lt=timezone.now())
+        if not batch_size:
+            return self._delete_expired(expired)
+        count = 0
+        while True:
+            pks = list(expired.using(self._write_db).values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return count
+            count += self._delete_expired(expired.filter(pk__in=pks))
+
+    def _delete_expired(self, expired):
+        # Only looked up when someone, such as the audit log, wants to know, and
+        # streamed rather than loaded at once when deleting without batches
+        if signals.lock_expired.has_listeners(Lock):
+            for lock in expired.using(self._write_db).iterator():
+                signals.lock_expired.send(sender=Lock, lock=lock)
+        count, _ = expired.delete()
+        signals.locks_expired.send(sender=Lock, count=count)
+        return count
 
-    def lock_for_user(self, content_type, object_id, user):
+    @timed('lock_for_user')
+    @bounded
+    def lock_for_user(self, content_type, object_id, user, seconds=None):
         """
         Try to create a lock for a user for a given content_type / object id.
 
         If a lock does not exist (or has expired) the current user gains a lock
         on this object. If another user already has a valid lock on this object,
-        then Lock.ObjectLockedError is raised.
+        then Lock.ObjectLockedError is raised. The lock expires in `seconds`,
+        `LOCKING_EXPIRATION_SECONDS` by default.
 
+        Renewing a lock the user already holds, which is what nearly every
+        ping does, costs a single UPDATE.
         """
+        lookup = _lookup(content_type, object_id)
+        self._check_ancestors(content_type, object_id, user)
+        lock = self.renew_for_user(content_type, object_id, user, seconds=seconds)
+        if lock is not None:
+            return lock
+        # Only when gaining the lock: while it's held, others can't lock descendants
+        self._check_descendants(content_type, object_id, user)
 
+        # Looked up by key only: an unexpired lock on another object that shares this
+        # object's key (about one chance in 2 ** 64 for hashed keys) counts as locked
+        key_lookup = {'content_type': content_type, 'object_key': lookup['object_key']}
         try:
-            lock = self.get(content_type=content_type, object_id=object_id)
+            lock = self.using(self._write_db).with_owner().get(**key_lookup)
         except Lock.DoesNotExist:
-            lock = Lock(content_type=content_type, object_id=object_id, locked_by=user)
+            lock = Lock(locked_by=user, **lookup)
+            try:
+                with transaction.atomic(using=self._write_db):
+                    lock.save(force_insert=True, using=self._write_db, seconds=seconds)
+            # Another user created the lock between our SELECT and INSERT
+            except IntegrityError:
+                lock = self.using(self._write_db).with_owner().get(**key_lookup)
+                signals.lock_contended.send(sender=Lock, lock=lock, user=user)
+                raise Lock.ObjectLockedError('This object is already locked by another user',
+                                             lock=lock)
         else:
-            if lock.has_expired:
-                lock.locked_by = user
-            elif lock.locked_by.id != user.id:
+            if not lock.has_expired:
+                signals.lock_contended.send(sender=Lock, lock=lock, user=user)
                 raise Lock.ObjectLockedError('This object is already locked by another user',
                                              lock=lock)
-        lock.save()
+            self._after_commit(partial(signals.lock_expired.send, sender=Lock,
+                                       lock=copy.deepcopy(lock)))
+            lock.object_id = lookup['object_id']
+            lock.locked_by = user
+            lock.save(using=self._write_db, seconds=seconds)
+
+        def announce():
+            invalidate_lock_list(content_type.pk)
+            signals.lock_acquired.send(sender=Lock, lock=lock, user=user)
+        self._after_commit(announce)
+        pin_user_reads(user)
         return lock
 
-    def force_lock_for_user(self, content_type, object_id, user):
+    @bounded
+    def renew_for_user(self, content_type, object_id, user, seconds=None):
+        """
+        Extend a lock the user holds to `seconds` from now with a single UPDATE.
+
+        Returns None if the user doesn't hold the lock. Locks of ancestors are not
+        checked, see `lock_for_user` for that.
+        """
+        date_expires = _expiration_date(seconds)
+        lookup = _lookup(content_type, object_id)
+        if not self.filter(locked_by=user, **lookup).update(date_expires=date_expires):
+            return None
+        lock = self._updated_lock(lookup, user, date_expires)
+        self._after_commit(partial(signals.lock_renewed.send, sender=Lock, lock=lock, user=user))
+        return lock
+
+    @timed('force_lock_for_user')
+    @bounded
+    def force_lock_for_user(self, content_type, object_id, user, seconds=None):
         """Like `lock_for_user` but always succeeds (even if locked by another user)"""
-        lock, created = self.get_or_create(content_type=content_type,
-                                           object_id=object_id,
-                                           defaults={'locked_by': user})
-        if not created or lock.locked_by.pk != user.pk:
-            lock.locked_by = user
-            lock.save()
+        date_expires = _expiration_date(seconds)
+        lookup = _lookup(content_type, object_id)
+        updated = self.filter(**lookup).update(locked_by=user, date_expires=date_expires)
+        if updated:
+            lock = self._updated_lock(lookup, user, date_expires)
+
+            def announce_forced():
+                invalidate_lock_list(content_type.pk)
+                signals.lock_forced.send(sender=Lock, lock=lock, user=user)
+            self._after_commit(announce_forced)
+            pin_user_reads(user)
+            return lock
+        lock = Lock(locked_by=user, **lookup)
+        try:
+            with transaction.atomic(using=self._write_db):
+                lock.save(force_insert=True, using=self._write_db, seconds=seconds)
+        # Created since our UPDATE, or the lock of another object with the same key,
+        # which is taken over too
+        except IntegrityError:
+            (self.filter(content_type=content_type, object_key=lookup['object_key'])
+                 .update(locked_by=user, object_id=lookup['object_id'],
+                         date_expires=date_expires))
+            lock = self._updated_lock(lookup, user, date_expires)
+            signal = signals.lock_forced
+        else:
+            signal = signals.lock_acquired
+
+        def announce():
+            invalidate_lock_list(content_type.pk)
+            signal.send(sender=Lock, lock=lock, user=user)
+        self._after_commit(announce)
+        pin_user_reads(user)
         return lock
 
-    def lock_object_for_user(self, obj, user):
+    @timed('wait_lock_for_user')
+    def wait_lock_for_user(self, content_type, object_id, user, timeout, seconds=None):
+        """
+        Like `lock_for_user`, but if another user holds the lock wait up to
+        `timeout` seconds for it to be released or to expire.
+
+        `timeout` is capped at `LOCKING_MAX_WAIT_SECONDS`. Releases are announced
+        through the cache, so while waiting this only polls the cache and the
+        database connection is handed back.
+        """
+        max_wait = getattr(settings, 'LOCKING_MAX_WAIT_SECONDS', DEFAULT_MAX_WAIT_SECONDS)
+        poll = getattr(settings, 'LOCKING_WAIT_POLL_SECONDS', DEFAULT_WAIT_POLL_SECONDS)
+        deadline = time.time() + min(timeout, max_wait)
+        object_key, object_id = _object_key(content_type, object_id)
+        while True:
+            version = release_version(content_type.pk, object_key)
+            try:
+                return self.lock_for_user(content_type, object_id, user, seconds=seconds)
+            except Lock.ObjectLockedError as e:
+                error = e
+            now = time.time()
+            if now >= deadline:
+                raise error
+
+            expires_in = (error.lock.date_expires - timezone.now()).total_seconds()
+            wake_at = min(deadline, now + max(expires_in, 0))
+            connection = connections[self._write_db]
+            if not connection.in_atomic_block:
+                connection.close()
+            while (time.time() < wake_at and
+                   release_version(content_type.pk, object_key) == version):
+                time.sleep(poll)
+
+    @timed('release_for_user')
+    @bounded
+    def release_for_user(self, content_type, object_id, user, seconds=0):
+        """
+        Remove a user's lock on a given content_type / object id.
+
+        If `seconds` is non-zero the lock is set to expire in that many seconds
+        rather than deleted. Returns False if the lock belongs to another user.
+        """
+        lookup = _lookup(content_type, object_id)
+        locks = self.filter(locked_by=user, **lookup)
+        if seconds == 0:
+            released, _ = locks.delete()
+        else:
+            date_expires = timezone.now() + timezone.timedelta(seconds=seconds)
+            released = locks.update(date_expires=date_expires)
+        if released:
+            def announce():
+                notify_released(content_type.pk, lookup['object_key'])
+                invalidate_lock_list(content_type.pk)
+                signals.lock_released.send(sender=Lock, content_type=content_type,
+                                           object_id=lookup['object_id'], user=user)
+            self._after_commit(announce)
+            pin_user_reads(user)
+            return True
+        return not self.using(self._write_db).filter(**lookup).exists()
+
+    @timed('release_all_for_user')
+    @bounded
+    def release_all_for_user(self, user):
+        """
+        Release all of a user's locks with a single DELETE, returning how many
+        were released
+
+        The released locks are looked up first, to wake up the requests waiting
+        for them.
+        """
+        held = list(self.using(self._write_db).filter(locked_by=user)
+                        .values_list('pk', 'content_type', 'object_key', 'object_id'))
+        if not held:
+            return 0
+        # Locks the user gains in the meantime have higher primary keys, and are kept
+        released, _ = self.filter(locked_by=user, pk__lte=max(row[0] for row in held)).delete()
+
+        def announce():
+            for _, content_type_id, object_key, object_id in held:
+                notify_released(content_type_id, object_key)
+                signals.lock_released.send(
+                    sender=Lock, content_type=ContentType.objects.get_for_id(content_type_id),
+                    object_id=object_id, user=user)
+            for content_type_id in set(row[1] for row in held):
+                invalidate_lock_list(content_type_id)
+        self._after_commit(announce)
+        pin_user_reads(user)
+        return released
+
+    def _after_commit(self, func):
+        """
+        Run `func`, which announces a change to the lock table, once the transaction
+        of a `bounded` method commits, so that those woken up by it can see the change
+        """
+        after_commit(self._write_db, func)
+
+    def _check_ancestors(self, content_type, object_id, user):
+        """Raises `Lock.ObjectLockedError` if another user holds the lock of an ancestor"""
+        model = content_type.model_class()
+        if model is None or not hierarchy.has_parents(model):
+            return
+        q = models.Q()
+        for parent, pk in hierarchy.ancestors(model, object_id):
+            q |= models.Q(**_lookup(ContentType.objects.get_for_model(parent), pk))
+        if not q:
+            return
+        lock = (self.using(self._write_db).filter(q).unexpired().exclude(locked_by=user)
+                    .with_owner().first())
+        if lock is not None:
+            signals.lock_contended.send(sender=Lock, lock=lock, user=user)
+            raise Lock.ObjectLockedError('An ancestor of this object is locked by another user',
+                                         lock=lock)
+
+    def _check_descendants(self, content_type, object_id, user):
+        """Raises `Lock.ObjectLockedError` if another user holds the lock of a descendant"""
+        model = content_type.model_class()
+        if model is None or not hierarchy.has_children(model):
+            return
+        for child, objects in hierarchy.descendants(model, object_id):
+            child_type = ContentType.objects.get_for_model(child)
+            for keys in self._object_keys(child_type, objects):
+                lock = (self.using(self._write_db)
+                            .filter(content_type=child_type, object_key__in=keys)
+                            .unexpired().exclude(locked_by=user).with_owner().first())
+                if lock is not None:
+                    signals.lock_contended.send(sender=Lock, lock=lock, user=user)
+                    raise Lock.ObjectLockedError(
+                        'A descendant of this object is locked by another user', lock=lock)
+
+    def _object_keys(self, content_type, objects):
+        """
+        `object_key__in` values matching the locks of `objects`, a queryset of
+        `content_type`'s model
+
+        Integer primary keys are their own key, so when the objects live in the lock
+        database they are matched with a subquery. Other keys are computed, and
+        split in batches for databases that limit query parameters.
+        """
+        model = content_type.model_class()
+        if (isinstance(model._meta.pk, (models.AutoField, models.IntegerField)) and
+                router.db_for_read(model) == self._write_db):
+            yield objects.values('pk')
+            return
+        size = connections[self._write_db].features.max_query_params
+        size = size - 1 if size else _KEY_BATCH_SIZE
+        keys = []
+        for pk in objects.values_list('pk', flat=True).iterator():
+            keys.append(_object_key(content_type, pk)[0])
+            if len(keys) == size:
+                yield keys
+                keys = []
+        if keys:
+            yield keys
+
+    def _updated_lock(self, lookup, user, date_expires):
+        """
+        The `Lock` instance for a row that was just written with `update()`
+
+        Its primary key isn't known without another query, so it is only read when
+        it's needed, such as to save or delete the instance.
+        """
+        lock = Lock(locked_by=user, date_expires=date_expires, **lookup)
+        lock._state.adding = False
+        lock._state.db = self._write_db
+        lock._pk_unread = True
+        return lock
+
+    def hold(self, objects, owner, ttl=None):
+        """
+        Lock `objects` for `owner` while a `with` block runs
+
+        `objects` is a model instance, a queryset or a list of instances of one
+        model. All of them are locked at once with a constant number of
+        statements, or `Lock.ObjectLockedError` is raised if another user holds
+        the lock of any of them. The locks expire in `ttl` seconds
+        (`LOCKING_EXPIRATION_SECONDS` by default) and are renewed from a
+        background thread every third of that, until the block exits and they
+        are released::
+
+            with Lock.objects.hold(Article.objects.filter(feed=feed), owner=bot):
+                ...
+        """
+        if isinstance(objects, models.Model):
+            objects = [objects]
+        if isinstance(objects, models.query.QuerySet):
+            model = objects.model
+            pks = list(objects.values_list('pk', flat=True))
+        else:
+            objects = list(objects)
+            concrete = set(obj._meta.concrete_model for obj in objects)
+            if len(concrete) > 1:
+                raise ValueError('Objects held together must be of the same model')
+            model = concrete.pop() if concrete else None
+            pks = [obj.pk for obj in objects]
+        content_type = ContentType.objects.get_for_model(model) if model else None
+        return LockHold(self.db_manager(self._write_db), content_type, pks, owner, ttl)
+
+    def lock_object_for_user(self, obj, user, seconds=None):
         """Calls `lock_for_user` on a given object and user."""
         ct_type = ContentType.objects.get_for_model(obj)
-        return self.lock_for_user(content_type=ct_type, object_id=obj.pk, user=user)
+        return self.lock_for_user(content_type=ct_type, object_id=obj.pk, user=user,
+                                  seconds=seconds)
 
-    def force_lock_object_for_user(self, obj, user):
+    def force_lock_object_for_user(self, obj, user, seconds=None):
         """Like `lock_object_for_user` but always succeeds (even if locked by another user)"""
         ct_type = ContentType.objects.get_for_model(obj)
-        return self.force_lock_for_user(content_type=ct_type, object_id=obj.pk, user=user)
+        return self.force_lock_for_user(content_type=ct_type, object_id=obj.pk, user=user,
+                                        seconds=seconds)
 
+    @timed('for_object')
     def for_object(self, obj):
         ct_type = ContentType.objects.get_for_model(obj)
-        return self.filter(content_type=ct_type, object_id=obj.pk).unexpired()
+        return self.covering(ct_type, obj.pk, instance=obj).unexpired()
 
     def get_queryset(self):
-        return LockingQuerySet(self.model)
+        return LockingQuerySet(self.model, using=self._db, hints=self._hints)
+
+
+class LockHold(object):
+    """
+    The locks taken by `LockingManager.hold`
+
+    All the locks of a hold are written with the same expiration date, which is
+    how they are found again: renewing them is one UPDATE and releasing them is
+    one DELETE, however many there are. `lost` counts the locks that were taken
+    over by other users while the hold was running.
+    """
+
+    def __init__(self, manager, content_type, pks, owner, ttl=None):
+        self.manager = manager
+        self.content_type = content_type
+        self.owner = owner
+        self.ttl = ttl
+        self.lost = 0
+        lookups = [_lookup(content_type, pk) for pk in pks] if content_type else []
+        # Two ids sharing a hashed key only need (and can only have) one lock
+        self.lookups = list(dict((lookup['object_key'], lookup) for lookup in lookups).values())
+        self.date_expires = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def _held(self):
+        return self.manager.filter(content_type=self.content_type, locked_by=self.owner,
+                                   date_expires=self.date_expires)
+
+    def _key_batches(self):
+        """`object_key__in` filters, split for databases that limit query parameters"""
+        keys = [lookup['object_key'] for lookup in self.lookups]
+        size = connections[self.manager.db].features.max_query_params
+        size = size - 1 if size else len(keys)
+        for start in range(0, len(keys), size):
+            yield {'content_type': self.content_type, 'object_key__in': keys[start:start + size]}
+
+    def _raise_locked(self):
+        for batch in self._key_batches():
+            lock = (self.manager.filter(**batch).unexpired().exclude(locked_by=self.owner)
+                                .with_owner().first())
+            if lock is not None:
+                signals.lock_contended.send(sender=Lock, lock=lock, user=self.owner)
+                raise Lock.ObjectLockedError('This object is already locked by another user',
+                                             lock=lock)
+
+    def acquire(self):
+        if not self.lookups:
+            return
+        self.date_expires = _expiration_date(self.ttl)
+        locks = [Lock(locked_by=self.owner, date_expires=self.date_expires, **lookup)
+                 for lookup in self.lookups]
+        with transaction.atomic(using=self.manager.db):
+            self._raise_locked()
+            # Expired locks, and the owner's own locks, are taken over. Locks other
+            # users gained since our SELECT are kept, and make the INSERT fail
+            replaced = models.Q(date_expires__lt=timezone.now()) | models.Q(locked_by=self.owner)
+            for batch in self._key_batches():
+                self.manager.filter(replaced, **batch).delete()
+            try:
+                with transaction.atomic(using=self.manager.db):
+                    self.manager.bulk_create(locks)
+            # Another user locked one of the objects since our SELECT
+            except IntegrityError:
+                self._raise_locked()
+                raise
+        invalidate_lock_list(self.content_type.pk)
+        for lock in locks:
+            signals.lock_acquired.send(sender=Lock, lock=lock, user=self.owner)
+        pin_user_reads(self.owner)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._renew_until_stopped,
+                                        name='locking-hold-renewal')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def renew(self):
+        """Push the expiration date of all the locks still held `ttl` seconds ahead"""
+        date_expires = _expiration_date(self.ttl)
+        renewed = self._held().update(date_expires=date_expires)
+        self.lost = len(self.lookups) - renewed
+        self.date_expires = date_expires
+        return renewed
+
+    def _renew_until_stopped(self):
+        seconds = self.ttl
+        if seconds is None:
+            seconds = getattr(settings, 'LOCKING_EXPIRATION_SECONDS', DEFAULT_EXPIRATION_SECONDS)
+        try:
+            while not self._stop.wait(seconds / 3):
+                # The database may have closed the connection since the last round
+                connections[self.manager.db].close_if_unusable_or_obsolete()
+                try:
+                    self.renew()
+                # Tried again on the next round, before the locks expire
+                except DatabaseError:
+                    pass
+        finally:
+            # Each thread has its own connections
+            connections[self.manager.db].close()
+
+    def release(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if not self.lookups or self.date_expires is None:
+            return
+        self._held().delete()
+        self.date_expires = None
+        invalidate_lock_list(self.content_type.pk)
+        for lookup in self.lookups:
+            notify_released(self.content_type.pk, lookup['object_key'])
+            signals.lock_released.send(sender=Lock, content_type=self.content_type,
+                                       object_id=lookup['object_id'], user=self.owner)
+        pin_user_reads(self.owner)
+
+
+# Kept in their own database, locks can't have foreign key constraints, and deleting
+# users can't cascade to their locks (see `locking.routers.delete_user_locks`)
+_SEPARATE_DATABASE = lock_database() is not None
 
 
 class Lock(models.Model):
-    id = models.CharField(max_length=15, primary_key=True)
     locked_by = models.ForeignKey(getattr(settings, 'AUTH_USER_MODEL', 'auth.User'),
-                                  on_delete=models.CASCADE)
-    date_expires = models.DateTimeField()
-    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
-    object_id = models.PositiveIntegerField()
+                                  on_delete=models.DO_NOTHING if _SEPARATE_DATABASE
+                                  else models.CASCADE,
+                                  db_constraint=not _SEPARATE_DATABASE)
+    # Indexed for `delete_expired` and `locking_stats` on large tables
+    date_expires = models.DateTimeField(db_index=True)
+    content_type = models.ForeignKey(ContentType,
+                                     on_delete=models.DO_NOTHING if _SEPARATE_DATABASE
+                                     else models.CASCADE,
+                                     db_constraint=not _SEPARATE_DATABASE)
+    object_id = models.CharField(max_length=255)
+    # Locks are indexed by this compact form of `object_id`, see `_object_key`
+    object_key = models.BigIntegerField(editable=False)
     content_object = GenericForeignKey('content_type', 'object_id')
 
     objects = LockingManager()
 
     class Meta:
         db_table = getattr(settings, 'LOCKING_DB_TABLE', 'locking_lock')
-        unique_together = ('content_type', 'object_id', )
+        unique_together = ('content_type', 'object_key', )
         permissions = (("can_unlock", "Can remove other user's locks"), )
 
     class ObjectLockedError(Exception):
@@ -99,19 +742,47 @@ class Lock(models.Model):
             self.lock = lock
             super(Lock.ObjectLockedError, self).__init__(message)
 
+    # Set on locks written with `update()`, whose primary key is read when needed
+    _pk_unread = False
+
+    def _get_pk_val(self, meta=None):
+        pk = super(Lock, self)._get_pk_val(meta)
+        if pk is None and self._pk_unread:
+            self._pk_unread = False
+            pks = list(Lock.objects.using(self._state.db)
+                                   .filter(content_type_id=self.content_type_id,
+                                           object_key=self.object_key, object_id=self.object_id)
+                                   .values_list('pk', flat=True)[:1])
+            if pks:
+                pk = pks[0]
+                self._set_pk_val(pk)
+        return pk
+
+    pk = property(_get_pk_val, models.Model._set_pk_val)
+
     def save(self, *args, **kwargs):
-        "Save lock and renew expiration date"
-        self.id = "%s.%s" % (self.content_type_id, self.object_id)
-        seconds = getattr(settings, 'LOCKING_EXPIRATION_SECONDS', DEFAULT_EXPIRATION_SECONDS)
-        self.date_expires = timezone.now() + timezone.timedelta(seconds=seconds)
+        """Save lock and renew expiration date, to `seconds` from now if given or else
+        `LOCKING_EXPIRATION_SECONDS`"""
+        self.date_expires = _expiration_date(kwargs.pop('seconds', None))
+        self.object_key, self.object_id = _object_key(
+            ContentType.objects.get_for_id(self.content_type_id), self.object_id)
         super(Lock, self).save(*args, **kwargs)
 
     def expire(self, seconds):
         "Set lock to expire in `seconds` from now"
         self.date_expires = timezone.now() + timezone.timedelta(seconds=seconds)
-        Lock.objects.filter(pk=self.pk).update(date_expires=self.date_expires)
+        Lock.objects.filter(content_type_id=self.content_type_id, object_key=self.object_key,
+                            object_id=self.object_id).update(date_expires=self.date_expires)
+        notify_released(self.content_type_id, self.object_key)
+        invalidate_lock_list(self.content_type_id)
 
     def to_dict(self):
+        # Served from ContentType's cache, so serializing many locks doesn't query per lock
+        content_type = ContentType.objects.get_for_id(self.content_type_id)
+        model = content_type.model_class()
+        # Integer primary keys are serialized as numbers, as they were before
+        # `object_id` could hold other types of keys
+        object_id = model._meta.pk.to_python(self.object_id) if model else self.object_id
         return {
             'locked_by': {
                 'username': self.locked_by.username,
@@ -120,9 +791,9 @@ class Lock(models.Model):
                 'email': self.locked_by.email,
             },
             'date_expires': self.date_expires,
-            'app': self.content_type.app_label,
-            'model': self.content_type.model,
-            'object_id': self.object_id,
+            'app': content_type.app_label,
+            'model': content_type.model,
+            'object_id': object_id,
         }
 
     @property
@@ -132,3 +803,36 @@ class Lock(models.Model):
     @classmethod
     def is_locked(cls, obj, for_user=None):
         return cls.objects.for_object(obj=obj).exclude(locked_by=for_user).exists()
+
+
+class LockEvent(models.Model):
+    """
+    A change of hands of a lock, recorded by the audit log (see `locking.audit`)
+
+    Renewals are not recorded.
+    """
+    ACQUIRED = 'acquired'
+    CONTENDED = 'contended'
+    FORCED = 'forced'
+    RELEASED = 'released'
+    EXPIRED = 'expired'
+    ACTIONS = (
+        (ACQUIRED, 'acquired'),
+        (CONTENDED, 'refused, locked by someone else'),
+        (FORCED, 'taken over'),
+        (RELEASED, 'released'),
+        (EXPIRED, 'expired'),
+    )
+
+    # Kept in the same database as locks, with the same constraints
+    content_type = models.ForeignKey(ContentType,
+                                     on_delete=models.DO_NOTHING if _SEPARATE_DATABASE
+                                     else models.CASCADE,
+                                     db_constraint=not _SEPARATE_DATABASE, related_name='+')
+    object_id = models.CharField(max_length=255)
+    user = models.ForeignKey(getattr(settings, 'AUTH_USER_MODEL', 'auth.User'),
+                             on_delete=models.DO_NOTHING if _SEPARATE_DATABASE
+                             else models.CASCADE,
+                             db_constraint=not _SEPARATE_DATABASE, related_name='+')
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    date = models.DateTimeField(db_index=True)
@@ -0,0 +1,79 @@
+from __future__ import absolute_import, unicode_literals, division
+
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.http import HttpResponse
+
+from .cache import get_cache
+from .settings import DEFAULT_RATE_LIMITS
+
+__all__ = ('rate_limited', 'too_many_requests')
+
+
+def _user_id(request):
+    """The logged in user's id, read from the session without loading the user"""
+    session = getattr(request, 'session', None)
+    if session is None:
+        return None
+    return session.get(SESSION_KEY)
+
+
+def take_token(user_id, method):
+    """
+    Take a token from the user's bucket for the given HTTP method.
+
+    Buckets are configured by `LOCKING_RATE_LIMITS` as `{method: (capacity, seconds)}`:
+    a bucket holds up to `capacity` tokens and refills at `capacity` tokens every
+    `seconds`. Returns None if a token was available, otherwise the number of
+    seconds until one will be.
+
+    Buckets live in the locking cache and are updated without a cache lock, so
+    concurrent requests from the same user may occasionally slip past the limit.
+    """
+    limits = getattr(settings, 'LOCKING_RATE_LIMITS', DEFAULT_RATE_LIMITS)
+    if method not in limits:
+        return None
+    capacity, seconds = limits[method]
+    rate = capacity / seconds
+
+    cache = get_cache()
+    key = 'locking:ratelimit:%s:%s' % (method, user_id)
+    now = time.time()
+    tokens, updated = cache.get(key, (capacity, now))
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens < 1:
+        return int(math.ceil((1 - tokens) / rate))
+    cache.set(key, (tokens - 1, now), int(math.ceil(seconds)))
+    return None
+
+
+def too_many_requests(user_id, method):
+    """The 429 response to send if the user is over their limit, or None"""
+    retry_after = take_token(user_id, method)
+    if retry_after is None:
+        return None
+    response = HttpResponse(status=429)
+    response['Retry-After'] = retry_after
+    return response
+
+
+def rate_limited(view_func):
+    """
+    Answers with 429 and a `Retry-After` header when the user is over their limit
+
+    Meant to wrap a view *before* `login_required`, so that rejected requests
+    never load the user or touch the database beyond the session.
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        user_id = _user_id(request)
+        if user_id is not None:
+            response = too_many_requests(user_id, request.method)
+            if response is not None:
+                return response
+        return view_func(request, *args, **kwargs)
+    return _wrapped_view
@@ -0,0 +1,17 @@
+from __future__ import absolute_import, unicode_literals, division
+
+__all__ = ('release_locks_on_deactivation', 'release_locks_on_logout')
+
+
+def release_locks_on_logout(sender, request, user, **kwargs):
+    """Releases the locks of a user who logged out, as their forms can't renew them anymore"""
+    from .models import Lock
+    if user is not None:
+        Lock.objects.release_all_for_user(user)
+
+
+def release_locks_on_deactivation(sender, instance, created, **kwargs):
+    """Releases the locks of a user who was deactivated"""
+    from .models import Lock
+    if not created and not getattr(instance, 'is_active', True):
+        Lock.objects.release_all_for_user(instance)
@@ -0,0 +1,85 @@
+from __future__ import absolute_import, unicode_literals, division
+
+from django.conf import settings
+from django.db import router
+
+from .cache import pin_reads, reads_pinned
+from .settings import DEFAULT_DATABASE, DEFAULT_READ_DATABASE, DEFAULT_READ_PIN_SECONDS
+
+__all__ = ('LockingRouter', 'delete_user_locks', 'lock_database', 'pin_user_reads',
+           'read_database')
+
+
+def lock_database():
+    """The alias of the database locks are kept in, or None for the default routing"""
+    return getattr(settings, 'LOCKING_DATABASE', DEFAULT_DATABASE)
+
+
+# The models kept in `LOCKING_DATABASE`
+_MODELS = ('lock', 'lockevent')
+
+
+def _is_lock(model_or_instance):
+    return model_or_instance._meta.label_lower in ('locking.%s' % name for name in _MODELS)
+
+
+def read_database(user):
+    """
+    The alias to read lock lists shown to `user` from, or None for the default routing
+
+    That's `LOCKING_READ_DATABASE`, unless the user changed a lock in the last
+    `LOCKING_READ_PIN_SECONDS`, so that users always see their own changes.
+    """
+    alias = getattr(settings, 'LOCKING_READ_DATABASE', DEFAULT_READ_DATABASE)
+    if alias is None or reads_pinned(user.pk):
+        return None
+    return alias
+
+
+def pin_user_reads(user):
+    """Read the lock lists shown to `user` from the primary for a while"""
+    if getattr(settings, 'LOCKING_READ_DATABASE', DEFAULT_READ_DATABASE) is not None:
+        pin_reads(user.pk, getattr(settings, 'LOCKING_READ_PIN_SECONDS',
+                                   DEFAULT_READ_PIN_SECONDS))
+
+
+def delete_user_locks(sender, instance, **kwargs):
+    """Deletes a deleted user's locks, as Django can't cascade across databases"""
+    from .models import Lock
+    Lock.objects.filter(locked_by=instance.pk).delete()
+
+
+class LockingRouter(object):
+    """
+    Sends all queries for locks and their audit log to the `LOCKING_DATABASE` database
+
+    Locks are written on every ping of every open change form. Keeping these
+    small, disposable writes away from the database holding your content takes
+    them off its primary. Without `LOCKING_DATABASE` this router does nothing.
+    """
+
+    def _related_db(self, db_for, model, hints):
+        if _is_lock(model):
+            return lock_database()
+        # Django falls back to the database of the `instance` hint, which would
+        # look for a lock's user or content type in the locking database
+        instance = hints.get('instance')
+        if instance is not None and _is_lock(instance) and lock_database() is not None:
+            return db_for(model)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._related_db(router.db_for_read, model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._related_db(router.db_for_write, model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if lock_database() is not None and (_is_lock(obj1) or _is_lock(obj2)):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == 'locking' and model_name in _MODELS and lock_database() is not None:
+            return db == lock_database()
+        return None
@@ -1,9 +1,42 @@
 from __future__ import absolute_import, unicode_literals, division
 
-__all__ = ('DEFAULT_DELETE_TIMEOUT_SECONDS', 'DEFAULT_EXPIRATION_SECONDS',
-           'DEFAULT_PING_SECONDS', 'DEFAULT_SHARE_ADMIN_JQUERY')
+__all__ = ('DEFAULT_AUDIT_BUFFER_SIZE', 'DEFAULT_AUDIT_ENABLED', 'DEFAULT_AUDIT_FLUSH_SECONDS',
+           'DEFAULT_AUDIT_RETENTION_DAYS', 'DEFAULT_BREAKER_FAILURES',
+           'DEFAULT_BREAKER_RESET_SECONDS', 'DEFAULT_BREAKER_SLOW_SECONDS', 'DEFAULT_CACHE',
+           'DEFAULT_DATABASE', 'DEFAULT_DELETE_TIMEOUT_SECONDS', 'DEFAULT_EXPIRATION_SECONDS',
+           'DEFAULT_JSON_ENCODER', 'DEFAULT_LEASE_SECONDS', 'DEFAULT_LIST_CACHE_SECONDS',
+           'DEFAULT_MAX_EXPIRATION_SECONDS', 'DEFAULT_MAX_PAGE_SIZE', 'DEFAULT_MAX_WAIT_SECONDS',
+           'DEFAULT_METRICS_ENABLED', 'DEFAULT_PING_SECONDS', 'DEFAULT_RATE_LIMITS',
+           'DEFAULT_READ_DATABASE', 'DEFAULT_READ_PIN_SECONDS', 'DEFAULT_RELEASE_ON_LOGOUT',
+           'DEFAULT_SERVER_TIMING', 'DEFAULT_SHARE_ADMIN_JQUERY',
+           'DEFAULT_STATEMENT_TIMEOUT_SECONDS', 'DEFAULT_STREAM_LISTS',
+           'DEFAULT_WAIT_POLL_SECONDS')
 
+DEFAULT_AUDIT_BUFFER_SIZE = 100
+DEFAULT_AUDIT_ENABLED = False
+DEFAULT_AUDIT_FLUSH_SECONDS = 10
+DEFAULT_AUDIT_RETENTION_DAYS = 90
+DEFAULT_BREAKER_FAILURES = 0
+DEFAULT_BREAKER_RESET_SECONDS = 30
+DEFAULT_BREAKER_SLOW_SECONDS = 2
+DEFAULT_CACHE = 'default'
+DEFAULT_DATABASE = None
 DEFAULT_DELETE_TIMEOUT_SECONDS = 0
 DEFAULT_EXPIRATION_SECONDS = 180
+DEFAULT_JSON_ENCODER = 'django.core.serializers.json.DjangoJSONEncoder'
+DEFAULT_LEASE_SECONDS = 120
+DEFAULT_LIST_CACHE_SECONDS = 0
+DEFAULT_MAX_EXPIRATION_SECONDS = 3600
+DEFAULT_MAX_PAGE_SIZE = 1000
+DEFAULT_MAX_WAIT_SECONDS = 0
+DEFAULT_METRICS_ENABLED = False
 DEFAULT_PING_SECONDS = 15
+DEFAULT_RATE_LIMITS = {}
+DEFAULT_READ_DATABASE = None
+DEFAULT_READ_PIN_SECONDS = 5
+DEFAULT_RELEASE_ON_LOGOUT = True
+DEFAULT_SERVER_TIMING = False
 DEFAULT_SHARE_ADMIN_JQUERY = True
+DEFAULT_STATEMENT_TIMEOUT_SECONDS = 0
+DEFAULT_STREAM_LISTS = False
+DEFAULT_WAIT_POLL_SECONDS = 0.1
@@ -0,0 +1,30 @@
+from __future__ import absolute_import, unicode_literals, division
+
+from django.dispatch import Signal
+
+__all__ = ('lock_acquired', 'lock_renewed', 'lock_contended', 'lock_forced', 'lock_released',
+           'lock_expired', 'locks_expired')
+
+# All signals are sent with `sender=Lock`
+
+# A user gained a lock that was free or had expired. Arguments: `lock`, `user`
+lock_acquired = Signal()
+
+# A user extended a lock they already held. Arguments: `lock`, `user`
+lock_renewed = Signal()
+
+# A user asked for a lock held by someone else. Arguments: `lock` (the existing lock), `user`
+lock_contended = Signal()
+
+# A user took over an existing lock with `force_lock_for_user`. Arguments: `lock`, `user`
+lock_forced = Signal()
+
+# A user released their lock. Arguments: `content_type`, `object_id`, `user`
+lock_released = Signal()
+
+# A lock expired without being released, and was taken by another request or deleted by
+# `delete_expired`. Arguments: `lock` (as it was when it expired)
+lock_expired = Signal()
+
+# Expired locks were deleted by `delete_expired`. Arguments: `count`
+locks_expired = Signal()
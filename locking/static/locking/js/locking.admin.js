@@ -46,7 +46,8 @@
                     }
                     lockedClass = "locked";
                 }
-                $('#locking-' + data[i]['object_id'])
+                // Not a selector, object ids may contain any character
+                $(document.getElementById('locking-' + data[i]['object_id']))
                     .removeClass('locked editing')
                     .addClass(lockedClass)
                     .attr('title', lockedMessage)
@@ -63,6 +64,9 @@
      * Extends LockingForm with logic specific to Django admin forms
      */
     var LockingAdminForm = function($form, opts) {
+        // Set before `init`, which may already disable the form
+        this.takeLockText = opts.messages.takeLockText;
+        this.formIsLockedByText = opts.messages.formIsLockedByText;
         this.init($form, opts);
 
         var cookieName = opts.appLabel + opts.modelName + 'unlock';
@@ -77,8 +81,6 @@
         $('input[type=submit][name="_continue"]').click(function() {
             self.removeLockOnUnload = false;
         });
-        self.takeLockText = opts.messages.takeLockText;
-        self.formIsLockedByText = opts.messages.formIsLockedByText;
     };
     $.extend(LockingAdminForm.prototype, locking.LockingForm.prototype);
     $.extend(LockingAdminForm.prototype, {
@@ -25,6 +25,8 @@
         this.lockWasTakenByUserText = messages.lockWasTakenByUserText;
         this.confirmTakeLockText = messages.confirmTakeLockText;
         this.networkWarningText = messages.networkWarningText;
+        this.retryAt = 0;
+        this.lease = null;
     };
     locking.ajax = {
         num_pending: 0,
@@ -40,6 +42,16 @@
                 cache: false
             };
             var self = this;
+            // The server asked us to slow down, so skip polling until it said to retry
+            var type = (opts.type || 'GET').toUpperCase();
+            if ((type === 'GET' || type === 'POST') && this.isBackingOff()) {
+                return;
+            }
+            // Renewals and releases present the lease of the last lock we were
+            // given, so the server can skip the session and user lookups
+            if (this.lease && (type === 'POST' || type === 'DELETE')) {
+                opts.headers = $.extend({'X-Locking-Lease': this.lease}, opts.headers);
+            }
             this._onAjaxStart();
             if ('complete' in opts) {
                 if (!$.isArray(opts.complete)) {
@@ -49,8 +61,14 @@
                 opts.complete = [];
             }
             opts.complete.push(self._onAjaxEnd);
+            opts.complete.push(function(XMLHttpRequest) {
+                self._onAjaxComplete(XMLHttpRequest);
+            });
             $.ajax($.extend(defaults, opts));
         },
+        isBackingOff: function() {
+            return new Date().getTime() < this.retryAt;
+        },
         lock: function(opts) {
             this.ajax($.extend({'type': 'POST'}, opts));
         },
@@ -65,6 +83,18 @@
         },
         _onAjaxEnd: function() {
             locking.ajax.num_pending--;
+        },
+        _onAjaxComplete: function(XMLHttpRequest) {
+            var lease = XMLHttpRequest.getResponseHeader('X-Locking-Lease');
+            if (lease) {
+                this.lease = lease;
+            }
+            // Rate limited, or the server is shedding lock requests
+            var retryAfter = XMLHttpRequest.getResponseHeader('Retry-After');
+            if (XMLHttpRequest.status === 429 || (XMLHttpRequest.status === 503 && retryAfter)) {
+                var seconds = parseInt(retryAfter, 10);
+                this.retryAt = new Date().getTime() + (isNaN(seconds) ? 60 : seconds) * 1000;
+            }
         }
     });
 
@@ -133,17 +163,24 @@
         formDisabled: false,
         numFailedConnections: 0,
         removeLockOnUnload: true,
+        isWaiting: false,
         init: function(form, opts) {
             var self = this;
             this.ping = opts.ping;
+            this.wait = opts.wait || 0;
             this.$form = $(form);
             this.api = new locking.API(opts.apiURL, opts.messages);
             this.confirmTakeLockText = opts.messages.confirmTakeLockText;
             this.networkWarningText = opts.messages.networkWarningText;
             this.lockWasTakenByUserText = opts.messages.lockWasTakenByUserText;
 
-            // Attempt to get a lock
-            this.getLock();
+            // The server took the lock, or found someone else's, when it rendered
+            // the form, so start in that state rather than asking for the lock
+            if (opts.initialLock) {
+                this.startWith(opts.initialLock);
+            } else {
+                this.getLock();
+            }
 
             // Attempt to get / maintain a lock ever ping number of seconds
             setInterval(function() { self.getLock(); }, self.ping * 1000);
@@ -166,12 +203,27 @@
          */
         getLock: function() {
             var self = this;
-            this.api.lock({
+            // A request waiting for the lock is still open, or we were rate limited
+            if (this.isWaiting || this.api.isBackingOff()) {
+                return;
+            }
+            var opts = {
                 success: function() {
                     self.enableForm();
                 },
                 error: function(XMLHttpRequest) {
+                    // Rate limited, the API will hold off until `Retry-After`
+                    if (XMLHttpRequest.status === 429) {
+                        return;
+                    }
                     if (XMLHttpRequest.status < 200 || XMLHttpRequest.status >= 500) {
+                        // The server said it can't keep locks for now, so warn right
+                        // away instead of after a second failure
+                        if (XMLHttpRequest.status === 503 &&
+                                XMLHttpRequest.getResponseHeader('Retry-After') &&
+                                !self.numFailedConnections) {
+                            self.numFailedConnections = 1;
+                        }
                         if (self.hasLock && self.numFailedConnections == 1) {
                             window.alert(self.networkWarningText);
                         }
@@ -183,7 +235,33 @@
                         self.disableForm($.parseJSON(XMLHttpRequest.responseText));
                     }
                 }
-            });
+            };
+            // Someone else has the lock, so ask the server to hold the request
+            // until it is released rather than polling for it every ping
+            if (this.formDisabled && this.wait) {
+                this.isWaiting = true;
+                opts.data = {'wait': this.wait};
+                opts.timeout = (this.wait + this.ping) * 1000;
+                opts.complete = function() {
+                    self.isWaiting = false;
+                };
+            }
+            this.api.lock(opts);
+        },
+
+        /**
+         * Enable or disable the form according to the lock state the server
+         * rendered it with
+         */
+        startWith: function(initialLock) {
+            if (initialLock.lockedByMe) {
+                if (initialLock.lease) {
+                    this.api.lease = initialLock.lease;
+                }
+                this.enableForm();
+            } else {
+                this.disableForm(initialLock.locks);
+            }
         },
 
         preventFormSubmission: function(event) {
@@ -11,6 +11,8 @@
             appLabel: options.appLabel,
             modelName: options.modelName,
             ping: options.ping,
+            wait: options.wait,
+            initialLock: options.initialLock,
             messages: options.messages
         });
     });
@@ -0,0 +1,63 @@
+from __future__ import absolute_import, unicode_literals, division
+
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .settings import DEFAULT_STATEMENT_TIMEOUT_SECONDS
+
+__all__ = ('after_commit', 'bounded', 'statement_timeout')
+
+# Databases whose queries run in a transaction opened by `statement_timeout`, with
+# how many blocks are open on each
+_local = threading.local()
+
+
+@contextmanager
+def statement_timeout(using):
+    """
+    Cancel queries made to database `using` in the block that run longer than
+    `LOCKING_STATEMENT_TIMEOUT_SECONDS`, raising a `DatabaseError`
+
+    Only PostgreSQL can cancel a statement on its own. There, the block runs in a
+    transaction (or a savepoint of the current one) so that the timeout is set
+    with `SET LOCAL` and doesn't outlive it. Elsewhere this does nothing.
+    """
+    seconds = getattr(settings, 'LOCKING_STATEMENT_TIMEOUT_SECONDS',
+                      DEFAULT_STATEMENT_TIMEOUT_SECONDS)
+    if not seconds or connections[using].vendor != 'postgresql':
+        yield
+        return
+    if not hasattr(_local, 'open'):
+        _local.open = {}
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute('SET LOCAL statement_timeout = %s', [int(seconds * 1000)])
+        _local.open[using] = _local.open.get(using, 0) + 1
+        try:
+            yield
+        finally:
+            _local.open[using] -= 1
+
+
+def after_commit(using, func):
+    """
+    Run `func` once the transaction `statement_timeout` opened on database `using`
+    commits, or right away outside of `statement_timeout`
+    """
+    if getattr(_local, 'open', {}).get(using):
+        transaction.on_commit(func, using=using)
+    else:
+        func()
+
+
+def bounded(method):
+    """Runs a `LockingManager` method under the `statement_timeout` of its database"""
+    @wraps(method)
+    def _wrapped(manager, *args, **kwargs):
+        with statement_timeout(manager._write_db):
+            return method(manager, *args, **kwargs)
+    return _wrapped
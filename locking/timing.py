@@ -0,0 +1,112 @@
+from __future__ import absolute_import, unicode_literals, division
+
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from .settings import DEFAULT_SERVER_TIMING
+
+__all__ = ('ServerTiming', 'request_timing')
+
+
+def enabled():
+    return getattr(settings, 'LOCKING_SERVER_TIMING', DEFAULT_SERVER_TIMING)
+
+
+class ServerTiming(object):
+    """
+    Collects the database time, query count and other durations spent by locking
+    code, and reports them in `Server-Timing` and `X-Locking-Query-Count` headers.
+
+    Queries are counted with `execute_wrapper`, which needs Django 2.0 or later;
+    on older versions only the durations are reported.
+    """
+
+    def __init__(self, name='locking'):
+        self.name = name
+        self.queries = 0
+        self.db_time = 0.0
+        self.total_time = 0.0
+        self.durations = []
+        self._depth = 0
+
+    def _execute_wrapper(self, execute, sql, params, many, context):
+        start = time.time()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.time() - start
+            self.queries += 1
+
+    @contextmanager
+    def measure(self):
+        """Time the block and the queries it issues. Nested blocks are only counted once"""
+        self._depth += 1
+        if self._depth > 1:
+            try:
+                yield
+            finally:
+                self._depth -= 1
+            return
+
+        wrapped = [c for c in connections.all() if hasattr(c, 'execute_wrappers')]
+        for connection in wrapped:
+            connection.execute_wrappers.append(self._execute_wrapper)
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.total_time += time.time() - start
+            for connection in wrapped:
+                connection.execute_wrappers.remove(self._execute_wrapper)
+            self._depth -= 1
+
+    def record(self, metric, seconds):
+        self.durations.append((metric, seconds))
+
+    def header_value(self):
+        db_time = self.db_time * 1000
+        metrics = ['%s-db;dur=%.2f;desc="%d queries"' % (self.name, db_time, self.queries)]
+        for metric, seconds in self.durations:
+            metrics.append('%s-%s;dur=%.2f' % (self.name, metric, seconds * 1000))
+        metrics.append('%s-total;dur=%.2f' % (self.name, self.total_time * 1000))
+        return ', '.join(metrics)
+
+    def apply(self, response):
+        """Add this timing's headers to `response`, keeping any existing Server-Timing"""
+        value = self.header_value()
+        if response.has_header('Server-Timing'):
+            value = '%s, %s' % (response['Server-Timing'], value)
+        response['Server-Timing'] = value
+        response['X-Locking-Query-Count'] = self.queries
+        return response
+
+
+class NullTiming(object):
+    """Stands in for `ServerTiming` when it is disabled"""
+
+    @contextmanager
+    def measure(self):
+        yield
+
+    def record(self, metric, seconds):
+        pass
+
+    def apply(self, response):
+        return response
+
+
+NULL_TIMING = NullTiming()
+
+
+def request_timing(request, name='locking'):
+    """The `ServerTiming` collecting locking overhead for this request, or a no-op
+    stand-in when `LOCKING_SERVER_TIMING` is off"""
+    if not enabled():
+        return NULL_TIMING
+    timings = request.__dict__.setdefault('_locking_timings', {})
+    if name not in timings:
+        timings[name] = ServerTiming(name)
+    return timings[name]
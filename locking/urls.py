@@ -2,14 +2,19 @@ from __future__ import absolute_import, unicode_literals, division
 
 from django.conf.urls import url
 
-from .api import LockAPIView
+from .api import LockAPIView, LockListAPIView
+from .views import lock_dashboard
 
 __all__ = ('urlpatterns', )
 
 urlpatterns = [
+    url(r'api/lock/$', LockListAPIView.as_view(), name='locking-api-list'),
+
     url(r'api/lock/(?P<app>[\w-]+)/(?P<model>[\w-]+)/$',
         LockAPIView.as_view(), name='locking-api'),
 
-    url(r'api/lock/(?P<app>[\w-]+)/(?P<model>[\w-]+)/(?P<object_id>\d+)/$',
+    url(r'api/lock/(?P<app>[\w-]+)/(?P<model>[\w-]+)/(?P<object_id>[^/]+)/$',
         LockAPIView.as_view(), name='locking-api'),
+
+    url(r'dashboard/$', lock_dashboard, name='locking-dashboard'),
 ]
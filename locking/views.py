@@ -0,0 +1,33 @@
+from __future__ import absolute_import, unicode_literals, division
+
+from django.contrib import admin
+from django.contrib.admin.utils import quote
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.contenttypes.models import ContentType
+from django.shortcuts import render
+from django.urls import NoReverseMatch, reverse
+from django.utils.translation import ugettext as _
+
+from .admin import _display_name
+from .api import _for_reading
+from .models import Lock
+
+__all__ = ('lock_dashboard', )
+
+
+@staff_member_required
+def lock_dashboard(request):
+    """Who is editing what: the locks of all the models the user may change, in one query"""
+    locks = _for_reading(Lock.objects.visible_to(request.user), request.user)
+    rows = []
+    for lock in locks.order_by('content_type', 'date_expires'):
+        content_type = ContentType.objects.get_for_id(lock.content_type_id)
+        try:
+            url = reverse('admin:%s_%s_change' % (content_type.app_label, content_type.model),
+                          args=(quote(lock.object_id), ))
+        except NoReverseMatch:
+            url = None
+        rows.append({'lock': lock, 'content_type': content_type, 'url': url,
+                     'locked_by': _display_name(lock.locked_by)})
+    context = dict(admin.site.each_context(request), title=_('Locked objects'), rows=rows)
+    return render(request, 'locking/dashboard.html', context)
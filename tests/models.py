@@ -1,6 +1,7 @@
 from __future__ import absolute_import, unicode_literals, division
 
 import sys
+import uuid
 
 import django
 from django import forms
@@ -8,9 +9,11 @@ from django.conf import settings
 from django.contrib import admin
 from django.db import models
 
-from locking.admin import LockingAdminMixin
+from locking.admin import OPTIMISTIC, LockingAdminMixin
+from locking.hierarchy import register_parent
 
-__all__ = ('BlogArticle', 'BlogArticleAdmin')
+__all__ = ('BlogArticle', 'BlogArticleAdmin', 'Book', 'BookAdmin', 'Chapter', 'Note',
+           'NoteAdmin', 'Paragraph', 'Snippet', 'SnippetAdmin', 'Tag')
 
 # Test only models currently incompatible with Django migrations
 if 'test' in sys.argv or 'runtests.py' in sys.argv:
@@ -41,3 +44,84 @@ class BlogArticleAdmin(LockingAdminMixin, admin.ModelAdmin):
         return forms.Media(js=('locking/js/test.js', )) + media
 
 admin.site.register(BlogArticle, BlogArticleAdmin)
+
+
+class Snippet(models.Model):
+    """A model with a UUID primary key"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    content = models.TextField()
+
+    class Meta:
+        app_label = 'locking'
+
+
+class Tag(models.Model):
+    """A model with a string primary key"""
+    name = models.CharField(max_length=100, primary_key=True)
+
+    class Meta:
+        app_label = 'locking'
+
+
+class PlainLockingAdmin(LockingAdminMixin, admin.ModelAdmin):
+    pass
+
+admin.site.register(Tag, PlainLockingAdmin)
+
+
+class SnippetAdmin(LockingAdminMixin, admin.ModelAdmin):
+    locking_expiration_seconds = 600
+    locking_ping_seconds = 120
+
+admin.site.register(Snippet, SnippetAdmin)
+
+
+class Note(models.Model):
+    title = models.CharField(max_length=200)
+    content = models.TextField()
+
+    class Meta:
+        app_label = 'locking'
+
+
+class NoteAdmin(LockingAdminMixin, admin.ModelAdmin):
+    locking_mode = OPTIMISTIC
+    fieldsets = ((None, {'fields': ('title', 'content')}), )
+
+admin.site.register(Note, NoteAdmin)
+
+
+class Book(models.Model):
+    title = models.CharField(max_length=200)
+
+    class Meta:
+        app_label = 'locking'
+
+
+class Chapter(models.Model):
+    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    title = models.CharField(max_length=200)
+
+    class Meta:
+        app_label = 'locking'
+
+
+class Paragraph(models.Model):
+    chapter = models.ForeignKey(Chapter, on_delete=models.CASCADE)
+    content = models.TextField()
+
+    class Meta:
+        app_label = 'locking'
+
+
+class ChapterInline(admin.TabularInline):
+    model = Chapter
+
+
+class BookAdmin(LockingAdminMixin, admin.ModelAdmin):
+    inlines = [ChapterInline]
+    locking_cover_inlines = True
+
+admin.site.register(Book, BookAdmin)
+admin.site.register(Chapter, PlainLockingAdmin)
+register_parent(Paragraph, 'chapter')
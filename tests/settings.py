@@ -75,10 +75,16 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': 'db.sqlite3',
-    }
+    },
+    # Only used by tests of LOCKING_DATABASE and LOCKING_READ_DATABASE
+    'locks': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'locks.sqlite3',
+    },
 }
 if 'test' in sys.argv:
     DATABASES['default']['NAME'] = ':memory:'
+    DATABASES['locks']['NAME'] = ':memory:'
 
 
 LANGUAGE_CODE = 'en-us'
@@ -1,7 +1,16 @@
 from __future__ import absolute_import, unicode_literals, division
+import json
 import os
 
-from django.test import TestCase
+from django.contrib.admin.utils import quote
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import OperationalError, connections, router
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.urls import reverse
 from django.contrib.staticfiles.testing import StaticLiveServerTestCase
 
@@ -10,11 +19,12 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.expected_conditions import staleness_of
 
-from .models import BlogArticle
+from .models import BlogArticle, Book, Chapter, Note, Snippet, Tag
 from .utils import user_factory
+from locking.admin import VERSION_FIELD
 from locking.models import Lock
 
-__all__ = ('TestAdmin', 'TestLiveAdmin')
+__all__ = ('TestAdmin', 'TestOptimisticAdmin', 'TestLockAdmin', 'TestLiveAdmin')
 
 
 class TestAdmin(TestCase):
@@ -67,6 +77,21 @@ class TestAdmin(TestCase):
         self.assertEqual(article.title, 'title')
         self.assertEqual(article.content, 'content')
 
+    def test_save_when_locks_unavailable(self):
+        """Saves should be rejected rather than let through when locks can't be read"""
+        if not hasattr(connections['default'], 'execute_wrapper'):
+            self.skipTest('Needs Django 2.0 or later')
+
+        def fail_lock_queries(execute, sql, params, many, context):
+            if 'locking_lock' in sql:
+                raise OperationalError('canceling statement due to statement timeout')
+            return execute(sql, params, many, context)
+        url = reverse('admin:locking_blogarticle_change', args=(self.blog_article.pk, ))
+        with connections[router.db_for_read(Lock)].execute_wrapper(fail_lock_queries):
+            rsp = self.client.post(url, {'title': 'updated title', 'content': 'updated content'})
+        self.assertContains(rsp, 'its lock could not be checked')
+        self.assertEqual(BlogArticle.objects.get(pk=self.blog_article.pk).title, 'title')
+
     def test_delete_unlocked(self):
         """Unlocked objects should delete correctly"""
         url = reverse('admin:locking_blogarticle_delete', args=(self.blog_article.pk, ))
@@ -88,6 +113,289 @@ class TestAdmin(TestCase):
         self.client.post(url, {'post': 'yes'})
         self.assertEqual(BlogArticle.objects.count(), 1)
 
+    @override_settings(LOCKING_SERVER_TIMING=True)
+    def test_server_timing(self):
+        """Locking JS and change forms should report locking overhead when enabled"""
+        Lock.objects.lock_object_for_user(self.blog_article, self.user)
+        urls = [
+            reverse('admin:admin_form_locking_blogarticle_js', args=(self.blog_article.pk, )),
+            reverse('admin:admin_changelist_locking_blogarticle_js'),
+        ]
+        for url in urls:
+            rsp = self.client.get(url)
+            self.assertIn('locking-serialize;dur=', rsp['Server-Timing'])
+        url = reverse('admin:locking_blogarticle_change', args=(self.blog_article.pk, ))
+        rsp = self.client.post(url, {'title': 'updated title', 'content': 'updated content'})
+        self.assertIn('locking-db;dur=', rsp['Server-Timing'])
+        self.assertGreater(int(rsp['X-Locking-Query-Count']), 0)
+
+    def test_non_integer_primary_keys(self):
+        """Change forms of objects with UUID and string primary keys should load their
+        locking JS"""
+        for obj in [Snippet.objects.create(content='content'), Tag.objects.create(name='a/b_c')]:
+            user, password = user_factory(type(obj))
+            self.client.login(username=user.username, password=password)
+            model_name = obj._meta.model_name
+            url = reverse('admin:locking_%s_change' % model_name, args=(quote(obj.pk), ))
+            js_url = reverse('admin:admin_form_locking_%s_js' % model_name,
+                             args=(quote(obj.pk), ))
+            self.assertContains(self.client.get(url), js_url)
+            rsp = self.client.get(js_url)
+            self.assertEqual(rsp.status_code, 200)
+            self.assertContains(rsp, '/%s/' % quote(obj.pk))
+
+    def test_admin_expiration_and_ping(self):
+        """Admins' own lock lifetime and ping interval should be passed to their forms"""
+        snippet = Snippet.objects.create(content='content')
+        user, password = user_factory(Snippet)
+        self.client.login(username=user.username, password=password)
+        rsp = self.client.get(reverse('admin:admin_form_locking_snippet_js', args=(snippet.pk, )))
+        self.assertContains(rsp, '"ping": 120')
+        self.assertContains(rsp, '/%s/?ttl=600"' % snippet.pk)
+        rsp = self.client.get(reverse('admin:admin_form_locking_blogarticle_js',
+                                      args=(self.blog_article.pk, )))
+        self.assertContains(rsp, '"ping": 1,')
+        self.assertNotContains(rsp, 'ttl=')
+
+    def test_changeform_takes_lock(self):
+        """Opening a change form should lock it, and hand the form script the lock's lease
+        so that it doesn't have to ask for the lock"""
+        url = reverse('admin:locking_blogarticle_change', args=(self.blog_article.pk, ))
+        self.client.get(url)
+        self.assertEqual(Lock.objects.get().locked_by, self.user)
+        rsp = self.client.get(reverse('admin:admin_form_locking_blogarticle_js',
+                                      args=(self.blog_article.pk, )))
+        initial = self.initial_lock(rsp)
+        self.assertTrue(initial['lockedByMe'])
+        self.assertTrue(initial['lease'])
+
+    def test_changeform_locked_by_other_user(self):
+        """A form locked by someone else should start disabled, showing who holds the lock"""
+        other_user, _ = user_factory()
+        Lock.objects.lock_object_for_user(self.blog_article, other_user)
+        self.client.get(reverse('admin:locking_blogarticle_change', args=(self.blog_article.pk, )))
+        self.assertEqual(Lock.objects.get().locked_by, other_user)
+        with self.assertNumQueries(3):
+            rsp = self.client.get(reverse('admin:admin_form_locking_blogarticle_js',
+                                          args=(self.blog_article.pk, )))
+        initial = self.initial_lock(rsp)
+        self.assertFalse(initial['lockedByMe'])
+        self.assertEqual(initial['locks'][0]['locked_by']['username'], other_user.username)
+
+    def test_changeform_unlocked_script(self):
+        """Without a lock, the form script should ask for one as before"""
+        rsp = self.client.get(reverse('admin:admin_form_locking_blogarticle_js',
+                                      args=(self.blog_article.pk, )))
+        self.assertIsNone(self.initial_lock(rsp))
+
+    def test_changeform_when_locks_unavailable(self):
+        """A change form whose lock can't be taken should load without its delete link,
+        and its script should ask the lock API"""
+        if not hasattr(connections['default'], 'execute_wrapper'):
+            self.skipTest('Needs Django 2.0 or later')
+
+        def fail_lock_writes(execute, sql, params, many, context):
+            if sql.startswith(('UPDATE "locking_lock"', 'INSERT INTO "locking_lock"')):
+                raise OperationalError('canceling statement due to statement timeout')
+            return execute(sql, params, many, context)
+
+        def fail_lock_queries(execute, sql, params, many, context):
+            if 'locking_lock' in sql:
+                raise OperationalError('canceling statement due to statement timeout')
+            return execute(sql, params, many, context)
+        url = reverse('admin:locking_blogarticle_change', args=(self.blog_article.pk, ))
+        with connections[router.db_for_write(Lock)].execute_wrapper(fail_lock_writes):
+            rsp = self.client.get(url)
+        self.assertEqual(rsp.status_code, 200)
+        self.assertNotContains(rsp, 'class="deletelink"')
+        self.assertFalse(Lock.objects.exists())
+        script_url = reverse('admin:admin_form_locking_blogarticle_js',
+                             args=(self.blog_article.pk, ))
+        with connections[router.db_for_read(Lock)].execute_wrapper(fail_lock_queries):
+            rsp = self.client.get(script_url)
+        self.assertIsNone(self.initial_lock(rsp))
+
+    def initial_lock(self, rsp):
+        content = rsp.content.decode('utf-8')
+        options = content[content.index('var options = ') + len('var options = '):]
+        return json.loads(options[:options.index('; // jshint')])['initialLock']
+
+    def test_save_child_of_locked_parent(self):
+        """Objects edited as an inline of an admin covering its inlines should be locked
+        with their parent"""
+        book = Book.objects.create(title='title')
+        chapter = Chapter.objects.create(book=book, title='title')
+        other_user, _ = user_factory(Book)
+        Lock.objects.lock_object_for_user(book, other_user)
+        user, password = user_factory(Chapter)
+        self.client.login(username=user.username, password=password)
+        url = reverse('admin:locking_chapter_change', args=(chapter.pk, ))
+        rsp = self.client.post(url, {'book': book.pk, 'title': 'new title'})
+        self.assertContains(rsp, 'locked by')
+        self.assertEqual(Chapter.objects.get().title, 'title')
+
+
+class TestOptimisticAdmin(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.note = Note.objects.create(title="title", content="content")
+        self.user, password = user_factory(Note)
+        self.client.login(username=self.user.username, password=password)
+        self.url = reverse('admin:locking_note_change', args=(self.note.pk, ))
+
+    def get_version(self):
+        rsp = self.client.get(self.url)
+        return rsp.context['adminform'].form[VERSION_FIELD].value()
+
+    def test_no_locking_javascript(self):
+        """Optimistic admins shouldn't load any locking JS, which would make requests"""
+        rsp = self.client.get(self.url)
+        self.assertNotContains(rsp, 'locking/js/')
+        self.assertNotContains(rsp, 'locking_form')
+        self.assertContains(rsp, 'name="%s"' % VERSION_FIELD)
+        rsp = self.client.get(reverse('admin:locking_note_changelist'))
+        self.assertNotContains(rsp, 'locking/js/')
+        self.assertNotContains(rsp, 'locking-status')
+
+    def test_save_current(self):
+        """Forms of an object that wasn't changed since they were opened should save"""
+        version = self.get_version()
+        self.client.post(self.url, {'title': 'new title', 'content': 'content',
+                                    VERSION_FIELD: version})
+        self.assertEqual(Note.objects.get().title, 'new title')
+
+    def test_save_stale(self):
+        """Forms of an object that was changed since they were opened should be rejected"""
+        version = self.get_version()
+        Note.objects.update(content='changed by someone else')
+        for data in [{VERSION_FIELD: version}, {}]:
+            data.update({'title': 'new title', 'content': 'content'})
+            rsp = self.client.post(self.url, data)
+            self.assertEqual(rsp.status_code, 200)
+            self.assertContains(rsp, 'someone else changed it')
+        self.assertEqual(Note.objects.get().title, 'title')
+
+    def test_other_editor_warning(self):
+        """Users should be told when someone else opened the form recently"""
+        self.client.get(self.url)
+        other_user, password = user_factory(Note)
+        self.client.login(username=other_user.username, password=password)
+        rsp = self.client.get(self.url)
+        self.assertIn('opened this form recently', str(list(get_messages(rsp.wsgi_request))[0]))
+        # Which doesn't stop them from saving or deleting it
+        self.client.post(self.url, {'title': 'new title', 'content': 'content',
+                                    VERSION_FIELD: self.get_version()})
+        self.assertEqual(Note.objects.get().title, 'new title')
+        self.client.post(reverse('admin:locking_note_delete', args=(self.note.pk, )),
+                         {'post': 'yes'})
+        self.assertEqual(Note.objects.count(), 0)
+
+    def test_opening_takes_no_lock(self):
+        """Opening a form shouldn't lock the object, which would stop others from
+        locking it, and reopening it shouldn't warn about oneself"""
+        self.client.get(self.url)
+        self.assertFalse(Lock.objects.exists())
+        self.assertFalse(Lock.is_locked(self.note))
+        other_user, _ = user_factory(Note)
+        Lock.objects.lock_object_for_user(self.note, other_user)
+        Lock.objects.all().delete()
+        rsp = self.client.get(self.url)
+        self.assertEqual(list(get_messages(rsp.wsgi_request)), [])
+
+    @override_settings(LOCKING_CACHE='broken', CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'broken': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                   'LOCATION': 'missing_cache_table'},
+    })
+    def test_cache_unavailable(self):
+        """Forms should open without a warning when the cache fails, whose queries run in
+        a savepoint so as not to break the view's transaction"""
+        with CaptureQueriesContext(connections['default']) as queries:
+            rsp = self.client.get(self.url)
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(list(get_messages(rsp.wsgi_request)), [])
+        sql = [query['sql'] for query in queries.captured_queries]
+        cache_query = next(i for i, q in enumerate(sql) if 'missing_cache_table' in q)
+        self.assertTrue(sql[cache_query - 1].startswith('SAVEPOINT'))
+
+
+class TestLockAdmin(TestCase):
+
+    def setUp(self):
+        self.user, password = user_factory(Lock)
+        self.user.user_permissions.add(Permission.objects.get(codename='can_unlock'))
+        self.client.login(username=self.user.username, password=password)
+        self.other_user, _ = user_factory()
+        self.url = reverse('admin:locking_lock_changelist')
+        self.articles = [BlogArticle.objects.create(title="title", content="content")
+                         for _ in range(3)]
+        self.locks = [Lock.objects.lock_object_for_user(article, self.other_user)
+                      for article in self.articles]
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        return len(queries)
+
+    def test_changelist(self):
+        """The lock list should take the same number of queries however many locks it shows"""
+        queries = self.changelist_queries()
+        Lock.objects.lock_object_for_user(Snippet.objects.create(content="content"), self.user)
+        self.assertEqual(self.changelist_queries(), queries)
+        rsp = self.client.get(self.url)
+        change_url = reverse('admin:locking_blogarticle_change', args=(self.articles[0].pk, ))
+        self.assertContains(rsp, '<a href="%s">locking.blogarticle</a>' % change_url, html=True)
+
+    def test_expired_filter(self):
+        Lock.objects.filter(pk=self.locks[0].pk).update(
+            date_expires=timezone.now() - timezone.timedelta(minutes=1))
+        rsp = self.client.get(self.url, {'expired': 'yes'})
+        self.assertEqual(list(rsp.context['cl'].result_list), [self.locks[0]])
+        rsp = self.client.get(self.url, {'expired': 'no'})
+        self.assertEqual(len(rsp.context['cl'].result_list), 2)
+
+    def test_related_filters(self):
+        """Only the users and models holding locks should be offered as filters"""
+        user_factory()
+        Lock.objects.lock_object_for_user(Snippet.objects.create(content="content"), self.user)
+        rsp = self.client.get(self.url, {'locked_by__id__exact': self.other_user.pk})
+        self.assertEqual(len(rsp.context['cl'].result_list), 3)
+        filters = dict((spec.title, spec) for spec in rsp.context['cl'].filter_specs)
+        self.assertEqual(sorted(pk for pk, _ in filters['locked by'].lookup_choices),
+                         [self.user.pk, self.other_user.pk])
+        self.assertEqual(sorted(pk for pk, _ in filters['content type'].lookup_choices),
+                         sorted([ContentType.objects.get_for_model(BlogArticle).pk,
+                                 ContentType.objects.get_for_model(Snippet).pk]))
+
+    def test_expire_now(self):
+        """Expiring the selected locks should take a single UPDATE"""
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.client.post(self.url, {'action': 'expire_now',
+                                        '_selected_action': [lock.pk for lock in self.locks[:2]]})
+        self.assertEqual(len([query for query in queries
+                              if query['sql'].startswith('UPDATE "locking_lock"')]), 1)
+        self.assertEqual(Lock.objects.unexpired().get(), self.locks[2])
+        self.assertEqual(Lock.objects.count(), 3)
+
+    def test_release(self):
+        """Releasing the selected locks should take a single DELETE"""
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.client.post(self.url, {'action': 'release',
+                                        '_selected_action': [lock.pk for lock in self.locks[:2]]})
+        self.assertEqual(len([query for query in queries
+                              if query['sql'].startswith('DELETE FROM "locking_lock"')]), 1)
+        self.assertEqual(Lock.objects.get(), self.locks[2])
+
+    def test_actions_need_can_unlock(self):
+        """Users without the `can_unlock` permission should get no actions"""
+        self.user.user_permissions.remove(Permission.objects.get(codename='can_unlock'))
+        rsp = self.client.get(self.url)
+        self.assertIsNone(rsp.context['action_form'])
+        self.client.post(self.url, {'action': 'release',
+                                    '_selected_action': [lock.pk for lock in self.locks]})
+        self.assertEqual(Lock.objects.count(), 3)
+
 
 class TestLiveAdmin(StaticLiveServerTestCase):
 
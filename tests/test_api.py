@@ -1,13 +1,19 @@
 from __future__ import absolute_import, unicode_literals, division
 
 import json
+import time
 
 from django import test
+from django.core.cache import cache
+from django.db import OperationalError, connections, router
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.contrib.contenttypes.models import ContentType
+from django.urls import reverse
 
-from .models import BlogArticle
+from .models import BlogArticle, Snippet, Tag
 from .utils import LockingClient, user_factory
+from locking.breaker import breaker
 from locking.models import Lock
 from locking.settings import DEFAULT_EXPIRATION_SECONDS
 
@@ -68,7 +74,7 @@ class TestAPI(test.TestCase):
         self.assertEqual(Lock.objects.count(), 1)
         self.assertEqual(
             Lock.objects.values_list('content_type', 'object_id', 'locked_by')[0],
-            (self.article_content_type.pk, self.blog_article.pk, client.user.pk))
+            (self.article_content_type.pk, str(self.blog_article.pk), client.user.pk))
 
     def test_post_extends_lock(self):
         """POST request to API should extend expiration date of existing lock by that user"""
@@ -155,3 +161,350 @@ class TestAPI(test.TestCase):
         lock_expiration = Lock.objects.filter(pk=lock.pk).values_list('date_expires', flat=True)[0]
         expected_expiration = timezone.now() + timezone.timedelta(seconds=5)     
         self.assertAlmostEqual(lock_expiration, expected_expiration, delta=timezone.timedelta(seconds=0.5))
+
+    @test.override_settings(LOCKING_MAX_WAIT_SECONDS=5)
+    def test_post_wait_gets_lock_on_expiry(self):
+        """POST with `wait` should hold the request and take the lock once it expires"""
+        user, _ = user_factory(self.blog_article)
+        lock = Lock.objects.create(locked_by=user,
+                                   content_type=self.article_content_type,
+                                   object_id=self.blog_article.pk)
+        lock.expire(seconds=0.3)
+        client = LockingClient(self.blog_article)
+        client.login_new_user()
+        self.assertEqual(client.post({'wait': 5}).status_code, 200)
+        locked_by = Lock.objects.values_list('locked_by', flat=True)[0]
+        self.assertEqual(locked_by, client.user.pk)
+
+    @test.override_settings(LOCKING_MAX_WAIT_SECONDS=0.3)
+    def test_post_wait_is_capped(self):
+        """POST with `wait` should give up after `LOCKING_MAX_WAIT_SECONDS`"""
+        user, _ = user_factory(self.blog_article)
+        Lock.objects.create(locked_by=user,
+                            content_type=self.article_content_type,
+                            object_id=self.blog_article.pk)
+        client = LockingClient(self.blog_article)
+        client.login_new_user()
+        start = time.time()
+        self.assertEqual(client.post({'wait': 30}).status_code, 409)
+        self.assertLess(time.time() - start, 5)
+
+    def test_post_wait_disabled_by_default(self):
+        """POST with `wait` should not hold the request unless waiting is enabled"""
+        user, _ = user_factory(self.blog_article)
+        Lock.objects.create(locked_by=user,
+                            content_type=self.article_content_type,
+                            object_id=self.blog_article.pk)
+        client = LockingClient(self.blog_article)
+        client.login_new_user()
+        start = time.time()
+        self.assertEqual(client.post({'wait': 30}).status_code, 409)
+        self.assertLess(time.time() - start, 1)
+
+    def test_post_invalid_wait(self):
+        """POST with a non-numeric `wait` should be rejected"""
+        client = LockingClient(self.blog_article)
+        client.login_new_user()
+        self.assertEqual(client.post({'wait': 'soon'}).status_code, 400)
+
+    @test.override_settings(LOCKING_RATE_LIMITS={'POST': (2, 60)})
+    def test_rate_limit(self):
+        """Requests over the rate limit should get a 429 with `Retry-After`"""
+        cache.clear()
+        client = LockingClient(self.blog_article)
+        client.login_new_user()
+        self.assertEqual(client.post().status_code, 200)
+        self.assertEqual(client.post().status_code, 200)
+        rsp = client.post()
+        self.assertEqual(rsp.status_code, 429)
+        self.assertGreaterEqual(int(rsp['Retry-After']), 1)
+        # Limits are per method
+        self.assertEqual(client.get().status_code, 200)
+
+    @test.override_settings(LOCKING_RATE_LIMITS={'POST': (1, 60)})
+    def test_rate_limit_is_per_user(self):
+        """Rate limits should not be shared between users"""
+        cache.clear()
+        client = LockingClient(self.blog_article)
+        client.login_new_user()
+        self.assertEqual(client.post().status_code, 200)
+        self.assertEqual(client.post().status_code, 429)
+        other_client = LockingClient(self.blog_article_2)
+        other_client.login_new_user()
+        self.assertEqual(other_client.post().status_code, 200)
+
+    @test.override_settings(LOCKING_RATE_LIMITS={'POST': (1, 60)})
+    def test_rate_limit_rejects_before_queries(self):
+        """Rejected requests should only read the session"""
+        cache.clear()
+        client = LockingClient(self.blog_article)
+        client.login_new_user()
+        client.post()
+        with self.assertNumQueries(1):
+            self.assertEqual(client.post().status_code, 429)
+
+    @test.override_settings(LOCKING_BREAKER_FAILURES=2, LOCKING_BREAKER_SLOW_SECONDS=0,
+                            LOCKING_BREAKER_RESET_SECONDS=30)
+    def test_circuit_breaker(self):
+        """Repeatedly slow requests should open the breaker, which answers with a 503 and
+        `Retry-After` without querying locks, until a probe succeeds"""
+        breaker.reset()
+        self.addCleanup(breaker.reset)
+        client = LockingClient(self.blog_article)
+        client.login_new_user()
+        self.assertEqual(client.post().status_code, 200)
+        self.assertEqual(client.post().status_code, 200)
+        with CaptureQueriesContext(connections[router.db_for_write(Lock)]) as queries:
+            rsp = client.post()
+        self.assertEqual(rsp.status_code, 503)
+        self.assertEqual(rsp['Retry-After'], '30')
+        self.assertFalse([query for query in queries if 'locking_lock' in query['sql']])
+        breaker.opened_at -= 30
+        with self.settings(LOCKING_BREAKER_SLOW_SECONDS=10):
+            self.assertEqual(client.post().status_code, 200)
+            self.assertEqual(client.get().status_code, 200)
+
+    @test.override_settings(LOCKING_BREAKER_FAILURES=5, LOCKING_BREAKER_RESET_SECONDS=30)
+    def test_circuit_breaker_database_error(self):
+        """Database errors should be answered with a 503 and count towards the breaker"""
+        if not hasattr(connections['default'], 'execute_wrapper'):
+            self.skipTest('Needs Django 2.0 or later')
+        breaker.reset()
+        self.addCleanup(breaker.reset)
+        client = LockingClient(self.blog_article)
+        client.login_new_user()
+
+        def fail_lock_queries(execute, sql, params, many, context):
+            if 'locking_lock' in sql:
+                raise OperationalError('canceling statement due to statement timeout')
+            return execute(sql, params, many, context)
+        with connections[router.db_for_write(Lock)].execute_wrapper(fail_lock_queries):
+            rsp = client.post()
+        self.assertEqual(rsp.status_code, 503)
+        self.assertEqual(rsp['Retry-After'], '30')
+        self.assertEqual(breaker.failures, 1)
+
+    @test.override_settings(LOCKING_SERVER_TIMING=True)
+    def test_server_timing(self):
+        """API responses should report locking's DB time and query count when enabled"""
+        client = LockingClient(self.blog_article)
+        client.login_new_user()
+        rsp = client.post()
+        self.assertIn('locking-db;dur=', rsp['Server-Timing'])
+        self.assertIn('locking-serialize;dur=', rsp['Server-Timing'])
+        self.assertGreater(int(rsp['X-Locking-Query-Count']), 0)
+
+    def test_server_timing_disabled(self):
+        """API responses should not have timing headers by default"""
+        client = LockingClient(self.blog_article)
+        client.login_new_user()
+        rsp = client.post()
+        self.assertFalse(rsp.has_header('Server-Timing'))
+        self.assertFalse(rsp.has_header('X-Locking-Query-Count'))
+
+    def test_uuid_primary_key(self):
+        """The API should lock objects with UUID primary keys"""
+        snippet = Snippet.objects.create(content="content")
+        client = LockingClient(snippet)
+        client.login_new_user()
+        self.assertEqual(client.post().status_code, 200)
+        result = json.loads(client.get().content.decode())
+        self.assertEqual(result[0]['object_id'], str(snippet.pk))
+        other_client = LockingClient(snippet)
+        other_client.login_new_user()
+        self.assertEqual(other_client.post().status_code, 409)
+        self.assertEqual(client.delete().status_code, 204)
+        self.assertEqual(Lock.objects.count(), 0)
+
+    def test_string_primary_key(self):
+        """The API should lock objects with string primary keys, quoted like admin URLs"""
+        tag = Tag.objects.create(name="a/b_c")
+        client = LockingClient(tag)
+        client.login_new_user()
+        self.assertEqual(client.post().status_code, 200)
+        self.assertEqual(Lock.objects.get().object_id, "a/b_c")
+        self.assertEqual(client.delete().status_code, 204)
+
+    def test_invalid_object_id(self):
+        """Object ids that aren't valid for the model's primary key should 404"""
+        for instance, object_id in [(self.blog_article, 'abc'),
+                                    (Snippet.objects.create(content="content"), '1')]:
+            client = LockingClient(instance)
+            client.login_new_user()
+            client.url = reverse('locking-api', kwargs={
+                'app': 'locking', 'model': instance._meta.model_name, 'object_id': object_id})
+            self.assertEqual(client.post().status_code, 404)
+
+    @test.override_settings(LOCKING_MAX_EXPIRATION_SECONDS=1800)
+    def test_ttl(self):
+        """Locks should last `ttl` seconds, up to LOCKING_MAX_EXPIRATION_SECONDS"""
+        client = LockingClient(self.blog_article)
+        client.login_new_user()
+        url = client.url
+        for ttl, seconds in [('600', 600), ('3600', 1800)]:
+            for method in ('post', 'put'):
+                client.url = url + '?ttl=' + ttl
+                self.assertEqual(getattr(client, method)().status_code, 200)
+                self.assertAlmostEqual(
+                    Lock.objects.get().date_expires,
+                    timezone.now() + timezone.timedelta(seconds=seconds),
+                    delta=timezone.timedelta(seconds=5))
+        for ttl in ('abc', '0', '-1', 'nan'):
+            client.url = url + '?ttl=' + ttl
+            self.assertEqual(client.post().status_code, 400)
+            self.assertEqual(client.put().status_code, 400)
+
+    def test_get_all(self):
+        """The lock list of all models should only show locks on models the user may change"""
+        owner, _ = user_factory()
+        snippet = Snippet.objects.create(content="content")
+        Lock.objects.lock_object_for_user(self.blog_article, owner)
+        Lock.objects.lock_object_for_user(snippet, owner)
+        Lock.objects.lock_object_for_user(self.blog_article_2, owner, seconds=-1)
+        url = reverse('locking-api-list')
+
+        user, password = user_factory(BlogArticle)
+        self.client.login(username=user.username, password=password)
+        result = self.client.get(url).json()
+        self.assertEqual([(lock['model'], lock['object_id']) for lock in result],
+                         [('blogarticle', self.blog_article.pk)])
+
+        user.is_superuser = True
+        user.save()
+        result = self.client.get(url).json()
+        self.assertEqual(sorted(lock['model'] for lock in result), ['blogarticle', 'snippet'])
+
+        user, password = user_factory()
+        self.client.login(username=user.username, password=password)
+        self.assertEqual(self.client.get(url).json(), [])
+        self.assertEqual(self.client.post(url).status_code, 405)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+    def test_dashboard(self):
+        """The dashboard should list the visible locks, linked to their change forms"""
+        owner, _ = user_factory()
+        Lock.objects.lock_object_for_user(self.blog_article, owner)
+        Lock.objects.lock_object_for_user(Snippet.objects.create(content="content"), owner)
+        user, password = user_factory(BlogArticle)
+        self.client.login(username=user.username, password=password)
+        rsp = self.client.get(reverse('locking-dashboard'))
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(len(rsp.context['rows']), 1)
+        self.assertContains(rsp, reverse('admin:locking_blogarticle_change',
+                                         args=(self.blog_article.pk, )))
+        self.assertContains(rsp, owner.username)
+
+    def test_lease(self):
+        """Renewals and releases presenting a lease shouldn't need a login"""
+        client = LockingClient(self.blog_article)
+        client.login_new_user()
+        rsp = client.post()
+        lease = rsp['X-Locking-Lease']
+        self.assertEqual(client.put()['X-Locking-Lease'], lease)
+        # Logging out would release the lock
+        client.client = test.Client()
+
+        self.assertEqual(client.post().status_code, 302)
+        with self.assertNumQueries(1):
+            rsp = client.post(HTTP_X_LOCKING_LEASE=lease)
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(rsp.json()['locked_by']['username'], client.user.username)
+        self.assertNotIn('X-Locking-Lease', rsp)
+        self.assertEqual(client.delete(HTTP_X_LOCKING_LEASE=lease).status_code, 204)
+        self.assertFalse(Lock.objects.exists())
+        # Leases can't create locks
+        self.assertEqual(client.post(HTTP_X_LOCKING_LEASE=lease).status_code, 302)
+
+    def test_lease_invalid(self):
+        """Requests with leases that don't apply should need a login"""
+        client = LockingClient(self.blog_article)
+        client.login_new_user()
+        lease = client.post()['X-Locking-Lease']
+        other_client = LockingClient(self.blog_article_2)
+        other_client.client = client.client
+        other_client.post()
+        client.client = other_client.client = test.Client()
+        for client_, token in [(client, lease[:-1] + ('a' if lease[-1] != 'a' else 'b')),
+                               (other_client, lease)]:
+            self.assertEqual(client_.post(HTTP_X_LOCKING_LEASE=token).status_code, 302)
+            self.assertEqual(client_.delete(HTTP_X_LOCKING_LEASE=token).status_code, 302)
+        with test.override_settings(LOCKING_LEASE_SECONDS=0):
+            self.assertEqual(client.post(HTTP_X_LOCKING_LEASE=lease).status_code, 302)
+
+        # Taken over by another user
+        Lock.objects.force_lock_object_for_user(self.blog_article, user_factory()[0])
+        self.assertEqual(client.post(HTTP_X_LOCKING_LEASE=lease).status_code, 302)
+        self.assertEqual(client.delete(HTTP_X_LOCKING_LEASE=lease).status_code, 302)
+
+    @test.override_settings(LOCKING_LEASE_SECONDS=0)
+    def test_lease_disabled(self):
+        client = LockingClient(self.blog_article)
+        client.login_new_user()
+        self.assertNotIn('X-Locking-Lease', client.post())
+
+    def test_get_paginated(self):
+        """Lists should be paginated with a `limit`, and a cursor in the `Link` header"""
+        owner, _ = user_factory()
+        articles = [BlogArticle.objects.create(title="title", content="content")
+                    for _ in range(3)]
+        for article in [self.blog_article, self.blog_article_2] + articles:
+            Lock.objects.lock_object_for_user(article, owner)
+        client = LockingClient(self.blog_article)
+        client.login_new_user()
+        for url in (reverse('locking-api', kwargs={'app': 'locking', 'model': 'blogarticle'}),
+                    reverse('locking-api-list')):
+            url += '?limit=2'
+            object_ids = []
+            while url:
+                rsp = client.client.get(url)
+                self.assertEqual(rsp.status_code, 200)
+                self.assertLessEqual(len(rsp.json()), 2)
+                object_ids.extend(lock['object_id'] for lock in rsp.json())
+                link = rsp.get('Link')
+                url = link[1:link.index('>')] if link else None
+            self.assertEqual(object_ids, sorted(object_ids))
+            self.assertEqual(len(object_ids), 5)
+        client.url = reverse('locking-api', kwargs={'app': 'locking', 'model': 'blogarticle'})
+        for query in ('?limit=0', '?limit=a', '?limit=2&cursor=a'):
+            self.assertEqual(client.client.get(client.url + query).status_code, 400)
+
+    @test.override_settings(LOCKING_STREAM_LISTS=True)
+    def test_get_streamed(self):
+        """With LOCKING_STREAM_LISTS, lists should be streamed a page at a time"""
+        owner, _ = user_factory()
+        Lock.objects.lock_object_for_user(self.blog_article, owner)
+        Lock.objects.lock_object_for_user(self.blog_article_2, owner)
+        client = LockingClient(self.blog_article)
+        client.login_new_user()
+        url = reverse('locking-api', kwargs={'app': 'locking', 'model': 'blogarticle'})
+        rsp = client.client.get(url)
+        self.assertTrue(rsp.streaming)
+        self.assertEqual(rsp['Content-Type'], 'application/json')
+        result = json.loads(b''.join(rsp.streaming_content).decode())
+        self.assertEqual([lock['object_id'] for lock in result],
+                         [self.blog_article.pk, self.blog_article_2.pk])
+        self.assertEqual(result[0]['locked_by']['username'], owner.username)
+        Lock.objects.all().delete()
+        rsp = client.client.get(url)
+        self.assertEqual(json.loads(b''.join(rsp.streaming_content).decode()), [])
+
+    @test.override_settings(LOCKING_JSON_ENCODER='tests.utils.TimestampJSONEncoder')
+    def test_json_encoder(self):
+        """Responses should be encoded with LOCKING_JSON_ENCODER"""
+        client = LockingClient(self.blog_article)
+        client.login_new_user()
+        lock = client.post().json()
+        self.assertIsInstance(lock['date_expires'], float)
+
+    def test_delete_all(self):
+        """DELETE on the list of all models should release all the user's locks"""
+        client = LockingClient(self.blog_article)
+        client.login_new_user()
+        client.post()
+        other_client = LockingClient(self.blog_article_2)
+        other_client.login_new_user()
+        other_client.post()
+        Lock.objects.lock_object_for_user(Snippet.objects.create(content="content"), client.user)
+        self.assertEqual(client.client.delete(reverse('locking-api-list')).status_code, 204)
+        self.assertEqual(Lock.objects.get().locked_by, other_client.user)
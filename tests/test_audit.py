@@ -0,0 +1,197 @@
+from __future__ import absolute_import, unicode_literals, division
+
+import time
+
+from django import test
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import router
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from .models import BlogArticle
+from .utils import user_factory
+from locking import audit
+from locking.models import Lock, LockEvent
+
+__all__ = ('TestAuditLog', 'TestAuditFlushThread', 'TestAuditCommands')
+
+
+@test.override_settings(LOCKING_AUDIT_ENABLED=True, LOCKING_AUDIT_BUFFER_SIZE=100,
+                        LOCKING_AUDIT_FLUSH_SECONDS=60)
+class TestAuditLog(test.TestCase):
+
+    def setUp(self):
+        self.user, _ = user_factory()
+        self.other_user, _ = user_factory()
+        self.article = BlogArticle.objects.create(title="Test", content="Test")
+        self.article_ct = ContentType.objects.get_for_model(BlogArticle)
+        # Flushed by the test itself rather than the background thread
+        audit.buffer.stop()
+        self.addCleanup(audit.buffer.flush)
+
+    def actions(self):
+        audit.buffer.flush()
+        return list(LockEvent.objects.order_by('pk').values_list('action', 'user'))
+
+    def test_buffered(self):
+        """Events should only be written when the buffer is flushed"""
+        Lock.objects.lock_for_user(self.article_ct, self.article.pk, self.user)
+        self.assertEqual(LockEvent.objects.count(), 0)
+        self.assertEqual(len(audit.buffer), 1)
+        # A single INSERT, in a savepoint
+        with self.assertNumQueries(3):
+            self.assertEqual(audit.buffer.flush(), 1)
+        self.assertEqual(len(audit.buffer), 0)
+
+    def test_flush_when_full(self):
+        """A full buffer should be written with a single query"""
+        with self.settings(LOCKING_AUDIT_BUFFER_SIZE=3):
+            for _ in range(2):
+                Lock.objects.lock_for_user(self.article_ct, self.article.pk, self.user)
+                Lock.objects.release_for_user(self.article_ct, self.article.pk, self.user)
+        self.assertEqual(LockEvent.objects.count(), 3)
+        self.assertEqual(len(audit.buffer), 1)
+
+    def test_transitions(self):
+        """Acquiring, contending, forcing and releasing a lock should be recorded, but
+        not renewing it"""
+        Lock.objects.lock_for_user(self.article_ct, self.article.pk, self.user)
+        Lock.objects.lock_for_user(self.article_ct, self.article.pk, self.user)
+        with self.assertRaises(Lock.ObjectLockedError):
+            Lock.objects.lock_for_user(self.article_ct, self.article.pk, self.other_user)
+        Lock.objects.force_lock_for_user(self.article_ct, self.article.pk, self.other_user)
+        Lock.objects.release_for_user(self.article_ct, self.article.pk, self.other_user)
+        self.assertEqual(self.actions(), [
+            (LockEvent.ACQUIRED, self.user.pk),
+            (LockEvent.CONTENDED, self.other_user.pk),
+            (LockEvent.FORCED, self.other_user.pk),
+            (LockEvent.RELEASED, self.other_user.pk),
+        ])
+        event = LockEvent.objects.first()
+        self.assertEqual((event.content_type, event.object_id),
+                         (self.article_ct, str(self.article.pk)))
+
+    def test_expired(self):
+        """Expired locks should be recorded as of their expiration, whether they are
+        deleted or taken over"""
+        past = timezone.now() - timezone.timedelta(minutes=10)
+        lock = Lock.objects.lock_for_user(self.article_ct, self.article.pk, self.user)
+        Lock.objects.filter(pk=lock.pk).update(date_expires=past)
+        Lock.objects.delete_expired()
+        lock = Lock.objects.lock_for_user(self.article_ct, self.article.pk, self.user)
+        Lock.objects.filter(pk=lock.pk).update(date_expires=past)
+        Lock.objects.lock_for_user(self.article_ct, self.article.pk, self.other_user)
+        self.assertEqual(self.actions(), [
+            (LockEvent.ACQUIRED, self.user.pk),
+            (LockEvent.EXPIRED, self.user.pk),
+            (LockEvent.ACQUIRED, self.user.pk),
+            (LockEvent.EXPIRED, self.user.pk),
+            (LockEvent.ACQUIRED, self.other_user.pk),
+        ])
+        expired = LockEvent.objects.filter(action=LockEvent.EXPIRED).first()
+        self.assertAlmostEqual(expired.date, past, delta=timezone.timedelta(seconds=1))
+
+    def test_expired_queries(self):
+        """Expired locks should be recorded from a single SELECT before their DELETE"""
+        past = timezone.now() - timezone.timedelta(minutes=10)
+        for pk in range(1, 4):
+            Lock.objects.create(locked_by=self.user, content_type=self.article_ct, object_id=pk)
+        Lock.objects.update(date_expires=past)
+        with self.assertNumQueries(2):
+            self.assertEqual(Lock.objects.delete_expired(), 3)
+        self.assertEqual(len(audit.buffer), 3)
+
+    def test_disabled(self):
+        """Nothing should be recorded while the audit log is disabled"""
+        with self.settings(LOCKING_AUDIT_ENABLED=False):
+            Lock.objects.lock_for_user(self.article_ct, self.article.pk, self.user)
+        self.assertEqual(self.actions(), [])
+
+
+@test.override_settings(LOCKING_AUDIT_ENABLED=True, LOCKING_AUDIT_FLUSH_SECONDS=0.1)
+class TestAuditFlushThread(test.TransactionTestCase):
+
+    def test_flushed_periodically(self):
+        """Events should be written every LOCKING_AUDIT_FLUSH_SECONDS by a background
+        thread, without waiting for another event"""
+        user, _ = user_factory()
+        article = BlogArticle.objects.create(title="Test", content="Test")
+        Lock.objects.lock_object_for_user(article, user)
+        deadline = time.time() + 5
+        while not LockEvent.objects.exists() and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(LockEvent.objects.get().action, LockEvent.ACQUIRED)
+        self.assertEqual(len(audit.buffer), 0)
+
+    @test.override_settings(LOCKING_AUDIT_FLUSH_SECONDS=60, LOCKING_AUDIT_BUFFER_SIZE=1)
+    def test_full_buffer_wakes_thread(self):
+        """A full buffer should be written by the background thread, not the request"""
+        user, _ = user_factory()
+        article = BlogArticle.objects.create(title="Test", content="Test")
+        event = LockEvent(action=LockEvent.ACQUIRED, object_id=article.pk, user=user,
+                          content_type=ContentType.objects.get_for_model(article),
+                          date=timezone.now())
+        with self.assertNumQueries(0, using=router.db_for_write(LockEvent)):
+            audit.buffer.add(event)
+        deadline = time.time() + 5
+        while not LockEvent.objects.exists() and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(LockEvent.objects.count(), 1)
+
+    def test_stopped_on_disconnect(self):
+        """Disabling the audit log should stop the thread"""
+        self.assertTrue(audit.buffer._thread.is_alive())
+        thread = audit.buffer._thread
+        with self.settings(LOCKING_AUDIT_ENABLED=False):
+            self.assertFalse(thread.is_alive())
+            self.assertIsNone(audit.buffer._thread)
+
+
+class TestAuditCommands(test.TestCase):
+
+    def setUp(self):
+        self.user, _ = user_factory()
+        self.other_user, _ = user_factory()
+        self.article_ct = ContentType.objects.get_for_model(BlogArticle)
+        self.now = timezone.now()
+
+    def event(self, action, user, minutes_ago, object_id='1'):
+        return LockEvent(content_type=self.article_ct, object_id=object_id, action=action,
+                         user=user, date=self.now - timezone.timedelta(minutes=minutes_ago))
+
+    def test_delete_old_lock_events(self):
+        """Events older than the retention period should be deleted in batches"""
+        days = 24 * 60
+        LockEvent.objects.bulk_create(
+            [self.event(LockEvent.ACQUIRED, self.user, 100 * days) for _ in range(5)] +
+            [self.event(LockEvent.ACQUIRED, self.user, 10 * days)])
+        out = StringIO()
+        with self.settings(LOCKING_AUDIT_RETENTION_DAYS=30):
+            call_command('delete_old_lock_events', batch_size=2, stdout=out)
+        self.assertIn('Deleted 5 lock events', out.getvalue())
+        self.assertEqual(LockEvent.objects.count(), 1)
+        call_command('delete_old_lock_events', days=5, stdout=out)
+        self.assertEqual(LockEvent.objects.count(), 0)
+
+    def test_lock_events_report(self):
+        """The report should count transitions per model, hold times and contended objects"""
+        LockEvent.objects.bulk_create([
+            self.event(LockEvent.ACQUIRED, self.user, 60),
+            self.event(LockEvent.CONTENDED, self.other_user, 50),
+            self.event(LockEvent.FORCED, self.other_user, 40),
+            self.event(LockEvent.RELEASED, self.other_user, 30),
+            self.event(LockEvent.ACQUIRED, self.user, 60, object_id='2'),
+            self.event(LockEvent.EXPIRED, self.user, 50, object_id='2'),
+            self.event(LockEvent.ACQUIRED, self.user, 30 * 24 * 60, object_id='3'),
+        ])
+        out = StringIO()
+        call_command('lock_events_report', days=7, stdout=out)
+        lines = out.getvalue().splitlines()
+        row = next(line for line in lines if line.startswith('locking.blogarticle'))
+        # Held for 20, 10 and 10 minutes
+        self.assertEqual(row.split(), ['locking.blogarticle', '2', '1', '1', '1', '1',
+                                       '800s', '1200s'])
+        contended = lines[lines.index(
+            'Most contended objects (refused lock requests and takeovers):') + 1]
+        self.assertEqual(contended.split(), ['locking.blogarticle', '1', '2', '1', 'forced'])
@@ -0,0 +1,113 @@
+from __future__ import absolute_import, unicode_literals, division
+
+import threading
+import time
+
+from django import test
+from django.db import OperationalError
+from django.core.cache import cache
+from django.urls import reverse
+
+from .models import BlogArticle
+from .utils import LockingClient, user_factory
+from locking.cache import cached_lock_list, invalidate_lock_list
+
+__all__ = ('TestLockListCache', )
+
+
+@test.override_settings(LOCKING_LIST_CACHE_SECONDS=60)
+class TestLockListCache(test.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.article = BlogArticle.objects.create(title="title", content="content")
+        self.client_1 = LockingClient(self.article)
+        self.client_1.login_new_user()
+        self.client_2 = LockingClient(self.article)
+        self.client_2.login_new_user()
+        self.list_url = reverse('locking-api', kwargs={'app': 'locking',
+                                                       'model': 'blogarticle'})
+
+    def get_list(self, client):
+        return client.client.get(self.list_url).json()
+
+    def test_cached(self):
+        """Lists should be computed once, until they are invalidated"""
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return [len(calls)]
+
+        self.assertEqual(cached_lock_list(1, compute), [1])
+        self.assertEqual(cached_lock_list(1, compute), [1])
+        self.assertEqual(cached_lock_list(2, compute), [2])
+        invalidate_lock_list(1)
+        self.assertEqual(cached_lock_list(1, compute), [3])
+        with self.settings(LOCKING_LIST_CACHE_SECONDS=0):
+            self.assertEqual(cached_lock_list(2, compute), [4])
+
+    def test_single_flight(self):
+        """Requests that miss while another one computes the list should wait for it"""
+        calls = []
+        results = []
+        started = threading.Event()
+
+        def slow_compute():
+            started.set()
+            # Lets the other request miss the cache while this one is computing
+            threading.Event().wait(0.3)
+            calls.append(1)
+            return ['slow']
+
+        def compute():
+            calls.append(1)
+            return ['fast']
+
+        thread = threading.Thread(target=lambda: results.append(cached_lock_list(1, slow_compute)))
+        thread.start()
+        started.wait()
+        results.append(cached_lock_list(1, compute))
+        thread.join()
+        self.assertEqual(results, [['slow'], ['slow']])
+        self.assertEqual(len(calls), 1)
+
+    def test_failed_compute(self):
+        """A list that couldn't be computed shouldn't keep other requests waiting"""
+        def fail():
+            raise OperationalError('canceling statement due to statement timeout')
+
+        self.assertRaises(OperationalError, cached_lock_list, 1, fail)
+        start = time.time()
+        self.assertEqual(cached_lock_list(1, lambda: ['computed']), ['computed'])
+        self.assertLess(time.time() - start, 0.1)
+
+    @test.override_settings(LOCKING_WAIT_POLL_SECONDS=0.01)
+    def test_wait_capped(self):
+        """Requests should only wait a few polls for a list another request computes"""
+        cache.add('locking:list:1:0:filling', True, 60)
+        start = time.time()
+        self.assertEqual(cached_lock_list(1, lambda: ['computed']), ['computed'])
+        self.assertLess(time.time() - start, 1)
+
+    def test_api_invalidated_by_writes(self):
+        """Gaining and losing locks should show in cached lists right away"""
+        self.assertEqual(self.get_list(self.client_1), [])
+        self.client_2.post()
+        self.assertEqual([lock['locked_by']['username'] for lock in self.get_list(self.client_1)],
+                         [self.client_2.user.username])
+        self.client_1.put()
+        self.assertEqual([lock['locked_by']['username'] for lock in self.get_list(self.client_2)],
+                         [self.client_1.user.username])
+        self.client_1.delete()
+        self.assertEqual(self.get_list(self.client_2), [])
+
+    def test_api_permissions(self):
+        """Permissions should still be checked on every request"""
+        self.get_list(self.client_1)
+        client = LockingClient(self.article)
+        client.login_new_user(has_perm=False)
+        self.assertEqual(client.client.get(self.list_url).status_code, 401)
+        user, password = user_factory()
+        self.client_1.client.login(username=user.username, password=password)
+        self.assertEqual(self.client_1.client.get(self.list_url).status_code, 401)
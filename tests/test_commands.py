@@ -0,0 +1,92 @@
+from __future__ import absolute_import, unicode_literals, division
+
+import json
+
+from django import test
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from .models import BlogArticle, Book
+from .utils import user_factory
+from locking.management.commands.locking_stats import suggest_reaper
+from locking.models import Lock
+
+__all__ = ('TestLoadTestCommand', 'TestDeleteExpiredLocksCommand', 'TestStatsCommand')
+
+
+class TestLoadTestCommand(test.TransactionTestCase):
+
+    def test_loadtest(self):
+        """`locking_loadtest` should report on the requests it made and clean up after itself"""
+        out = StringIO()
+        call_command('locking_loadtest', 'locking.BlogArticle', editors=3, objects=2,
+                     duration=1, ping=0.05, stdout=out)
+        output = out.getvalue()
+        self.assertIn('Requests:', output)
+        self.assertIn('409 rate:', output)
+        self.assertNotIn('editors failed', output)
+        self.assertEqual(Lock.objects.count(), 0)
+
+
+class TestDeleteExpiredLocksCommand(test.TestCase):
+
+    def test_batches(self):
+        """`delete_expired_locks` should delete expired locks a batch at a time"""
+        user, _ = user_factory()
+        article_ct = ContentType.objects.get_for_model(BlogArticle)
+        for object_id in range(5):
+            Lock.objects.create(locked_by=user, content_type=article_ct, object_id=object_id)
+        Lock.objects.exclude(object_id='4').update(
+            date_expires=timezone.now() - timezone.timedelta(minutes=1))
+        out = StringIO()
+        # A SELECT and a DELETE per batch of 2, and a final SELECT
+        with self.assertNumQueries(5):
+            call_command('delete_expired_locks', batch_size=2, verbosity=2, stdout=out)
+        self.assertIn('Deleted 4 expired locks', out.getvalue())
+        self.assertEqual(list(Lock.objects.values_list('object_id', flat=True)), ['4'])
+
+
+class TestStatsCommand(test.TestCase):
+
+    def setUp(self):
+        user, _ = user_factory()
+        article_ct = ContentType.objects.get_for_model(BlogArticle)
+        book_ct = ContentType.objects.get_for_model(Book)
+        self.now = timezone.now()
+        for object_id in range(4):
+            Lock.objects.create(locked_by=user, content_type=article_ct, object_id=object_id)
+        Lock.objects.create(locked_by=user, content_type=book_ct, object_id=1)
+        Lock.objects.filter(content_type=article_ct, object_id__in=['0', '1']).update(
+            date_expires=self.now - timezone.timedelta(minutes=10))
+
+    def test_json(self):
+        """`locking_stats` should aggregate the lock table without loading its rows"""
+        out = StringIO()
+        with self.assertNumQueries(4):
+            call_command('locking_stats', format='json', stdout=out)
+        stats = json.loads(out.getvalue())
+        self.assertEqual((stats['total'], stats['live'], stats['expired']), (5, 3, 2))
+        self.assertAlmostEqual(stats['expired_ratio'], 0.4)
+        self.assertAlmostEqual(stats['mean_ttl_seconds'], 180, delta=5)
+        self.assertEqual(stats['oldest_live']['object_id'], '2')
+        self.assertEqual(stats['models'], [
+            {'model': 'locking.blogarticle', 'locks': 4, 'expired': 2},
+            {'model': 'locking.book', 'locks': 1, 'expired': 0},
+        ])
+        self.assertAlmostEqual(stats['expiry_rate_per_minute'], 0.2, delta=0.01)
+
+    def test_table(self):
+        out = StringIO()
+        call_command('locking_stats', stdout=out)
+        output = out.getvalue()
+        self.assertIn('expired:            2 (40.0%)', output)
+        self.assertIn('delete_expired_locks --batch-size 100, every 180 seconds', output)
+
+    def test_suggest_reaper(self):
+        """A fast expiry rate should shorten the interval rather than grow the batch size"""
+        ago = self.now - timezone.timedelta(seconds=100)
+        self.assertEqual(suggest_reaper(0, None, self.now, 180), (0.0, 100, 180))
+        self.assertEqual(suggest_reaper(1000, ago, self.now, 180), (10.0, 3600, 180))
+        self.assertEqual(suggest_reaper(10000, ago, self.now, 180), (100.0, 10000, 50))
@@ -0,0 +1,105 @@
+from __future__ import absolute_import, unicode_literals, division
+
+from django import test
+from django.contrib.contenttypes.models import ContentType
+from django.http import Http404
+
+from .models import BlogArticle
+from .utils import LockingClient, user_factory
+from locking import signals
+from locking.metrics import prometheus_metrics, registry
+from locking.models import Lock
+
+__all__ = ('TestSignals', 'TestMetrics')
+
+
+class TestSignals(test.TestCase):
+
+    def setUp(self):
+        self.user, _ = user_factory()
+        self.other_user, _ = user_factory()
+        self.article = BlogArticle.objects.create(title="Test", content="Test")
+        self.article_ct = ContentType.objects.get_for_model(BlogArticle)
+        self.received = []
+
+    def _listen(self, signal):
+        def handler(sender, **kwargs):
+            self.received.append(signal)
+        signal.connect(handler, weak=False)
+        self.addCleanup(signal.disconnect, handler)
+
+    def test_lock_lifecycle_signals(self):
+        """Lock operations should send a signal for each state transition"""
+        for signal in (signals.lock_acquired, signals.lock_renewed, signals.lock_contended,
+                       signals.lock_forced, signals.lock_released):
+            self._listen(signal)
+        Lock.objects.lock_object_for_user(self.article, self.user)
+        Lock.objects.lock_object_for_user(self.article, self.user)
+        self.assertRaises(Lock.ObjectLockedError, Lock.objects.lock_object_for_user,
+                          self.article, self.other_user)
+        Lock.objects.force_lock_object_for_user(self.article, self.other_user)
+        Lock.objects.release_for_user(self.article_ct, self.article.pk, self.other_user)
+        self.assertEqual(self.received, [signals.lock_acquired, signals.lock_renewed,
+                                         signals.lock_contended, signals.lock_forced,
+                                         signals.lock_released])
+
+    def test_locks_expired_signal(self):
+        """`delete_expired` should report how many locks it deleted"""
+        counts = []
+
+        def handler(sender, count, **kwargs):
+            counts.append(count)
+        signals.locks_expired.connect(handler, weak=False)
+        self.addCleanup(signals.locks_expired.disconnect, handler)
+        lock = Lock.objects.lock_object_for_user(self.article, self.user)
+        lock.expire(-10)
+        self.assertEqual(Lock.objects.delete_expired(), 1)
+        self.assertEqual(counts, [1])
+
+
+@test.override_settings(LOCKING_METRICS_ENABLED=True)
+class TestMetrics(test.TestCase):
+
+    def setUp(self):
+        registry.reset()
+        self.article = BlogArticle.objects.create(title="Test", content="Test")
+
+    def test_counters(self):
+        """Lock signals should be counted per model"""
+        client = LockingClient(self.article)
+        client.login_new_user()
+        client.post()
+        client.post()
+        other_client = LockingClient(self.article)
+        other_client.login_new_user()
+        other_client.post()
+        other_client.put()
+        other_client.delete()
+        output = registry.render()
+        for name in ('acquisitions', 'renewals', 'contentions', 'takeovers', 'releases'):
+            self.assertIn('locking_%s_total{model="locking.blogarticle"} 1' % name, output)
+
+    def test_timings(self):
+        """Manager operations and API requests should be timed"""
+        client = LockingClient(self.article)
+        client.login_new_user()
+        client.post()
+        output = registry.render()
+        self.assertIn('locking_operation_seconds_count{operation="lock_for_user"} 1', output)
+        self.assertIn('locking_api_request_seconds_count{method="POST"} 1', output)
+        self.assertIn('# TYPE locking_operation_seconds histogram', output)
+
+    def test_prometheus_view(self):
+        """The exposition view should render the registry as text"""
+        registry.inc('locking_releases_total', {'model': 'locking.blogarticle'})
+        rsp = prometheus_metrics(test.RequestFactory().get('/metrics'))
+        self.assertEqual(rsp['Content-Type'], 'text/plain; version=0.0.4')
+        self.assertIn(b'locking_releases_total{model="locking.blogarticle"} 1', rsp.content)
+
+    @test.override_settings(LOCKING_METRICS_ENABLED=False)
+    def test_disabled(self):
+        """Nothing should be recorded and the view should 404 when metrics are disabled"""
+        user, _ = user_factory()
+        Lock.objects.lock_object_for_user(self.article, user)
+        self.assertEqual(registry.render(), '\n')
+        self.assertRaises(Http404, prometheus_metrics, test.RequestFactory().get('/metrics'))
@@ -1,14 +1,21 @@
 from __future__ import absolute_import, unicode_literals, division
 
+import threading
+import time
+
 from django import test
+from django.db import router, transaction
 from django.utils import timezone
 from django.contrib.contenttypes.models import ContentType
 
-from .models import BlogArticle
+from .models import BlogArticle, Book, Chapter, Paragraph, Snippet, Tag
 from .utils import user_factory
-from locking.models import Lock
+from locking import signals, timeouts
+from locking.cache import release_version
+from locking.models import Lock, _object_key
 
-__all__ = ('TestLock', )
+__all__ = ('TestLock', 'TestLockHierarchy', 'TestLockWait', 'TestLockHold', 'TestLockHoldRenewal',
+           'TestStatementTimeoutCommit')
 
 
 class TestLock(test.TestCase):
@@ -92,7 +99,7 @@ class TestLock(test.TestCase):
         Lock.objects.lock_object_for_user(self.article1, self.user)
         lock = Lock.objects.first()
         self.assertEqual(lock.locked_by_id, self.user.pk)
-        self.assertEqual(lock.object_id, self.article1.pk)
+        self.assertEqual(lock.object_id, str(self.article1.pk))
         self.assertEqual(lock.content_type, self.article_ct)
 
     def test_force_lock_object_for_user(self):
@@ -109,3 +116,467 @@ class TestLock(test.TestCase):
             object_id=self.article1.pk)
         updated_lock = Lock.objects.force_lock_object_for_user(self.article1, self.user)
         self.assertGreater(updated_lock.date_expires, lock.date_expires)
+
+    def test_lock_seconds(self):
+        """Locks should last `seconds` when given, including when renewed or taken over"""
+        in_an_hour = timezone.now() + timezone.timedelta(hours=1)
+        lock = Lock.objects.lock_object_for_user(self.article1, self.user, seconds=3600)
+        self.assertAlmostEqual(lock.date_expires, in_an_hour, delta=timezone.timedelta(seconds=5))
+        Lock.objects.lock_object_for_user(self.article1, self.user, seconds=3600)
+        lock = Lock.objects.get()
+        self.assertAlmostEqual(lock.date_expires, in_an_hour, delta=timezone.timedelta(seconds=5))
+        new_user, _ = user_factory()
+        for obj in (self.article1, self.article2):
+            Lock.objects.force_lock_object_for_user(obj, new_user, seconds=3600)
+            lock = Lock.objects.for_object(obj).get()
+            self.assertAlmostEqual(lock.date_expires, in_an_hour,
+                                   delta=timezone.timedelta(seconds=5))
+            self.assertEqual(lock.locked_by, new_user)
+
+    def test_lock_for_user_renewal_is_single_query(self):
+        """Renewing a lock the user already holds should only issue one UPDATE, and its
+        pk should only be read when asked for"""
+        lock = Lock.objects.lock_object_for_user(self.article1, self.user)
+        Lock.objects.filter(pk=lock.pk).update(date_expires=timezone.now())
+        with self.assertNumQueries(1):
+            renewed = Lock.objects.lock_for_user(self.article_ct, self.article1.pk, self.user)
+            renewed.to_dict()
+        self.assertGreater(Lock.objects.get(pk=lock.pk).date_expires, timezone.now())
+        self.assertEqual(renewed.locked_by, self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(renewed.pk, lock.pk)
+            self.assertEqual(renewed.pk, lock.pk)
+
+    def test_release_for_user(self):
+        """`release_for_user` should remove the user's own lock"""
+        Lock.objects.lock_object_for_user(self.article1, self.user)
+        self.assertTrue(Lock.objects.release_for_user(self.article_ct, self.article1.pk, self.user))
+        self.assertFalse(Lock.is_locked(self.article1))
+
+    def test_release_for_other_user(self):
+        """`release_for_user` should not remove a lock held by someone else"""
+        Lock.objects.lock_object_for_user(self.article1, self.user)
+        new_user, _ = user_factory()
+        self.assertFalse(Lock.objects.release_for_user(self.article_ct, self.article1.pk, new_user))
+        self.assertTrue(Lock.is_locked(self.article1))
+
+    def test_release_all_for_user(self):
+        """All of a user's locks should be released at once, waking up waiting requests"""
+        other_user, _ = user_factory()
+        Lock.objects.lock_object_for_user(self.article1, self.user)
+        Lock.objects.lock_object_for_user(Snippet.objects.create(content="Test"), self.user)
+        Lock.objects.lock_object_for_user(self.article2, other_user)
+        version = release_version(self.article_ct.pk, self.article1.pk)
+        released = []
+        signals.lock_released.connect(lambda **kwargs: released.append(kwargs), weak=False,
+                                      dispatch_uid='test_release_all_for_user')
+        try:
+            # The locks to announce as released, and the DELETE
+            with self.assertNumQueries(2):
+                self.assertEqual(Lock.objects.release_all_for_user(self.user), 2)
+        finally:
+            signals.lock_released.disconnect(dispatch_uid='test_release_all_for_user')
+        self.assertEqual(Lock.objects.get().locked_by, other_user)
+        self.assertNotEqual(release_version(self.article_ct.pk, self.article1.pk), version)
+        self.assertEqual(sorted(kwargs['content_type'].model for kwargs in released),
+                         ['blogarticle', 'snippet'])
+        with self.assertNumQueries(1):
+            self.assertEqual(Lock.objects.release_all_for_user(self.user), 0)
+
+    def test_release_on_logout_and_deactivation(self):
+        """Users' locks should be released when they log out or are deactivated"""
+        user, password = user_factory()
+        client = test.Client()
+        client.login(username=user.username, password=password)
+        Lock.objects.lock_object_for_user(self.article1, user)
+        client.logout()
+        self.assertFalse(Lock.objects.exists())
+        Lock.objects.lock_object_for_user(self.article1, user)
+        user.save()
+        self.assertTrue(Lock.objects.exists())
+        user.is_active = False
+        user.save()
+        self.assertFalse(Lock.objects.exists())
+
+    def test_expire_renewed(self):
+        """`expire` should work on locks returned by a renewal"""
+        Lock.objects.lock_object_for_user(self.article1, self.user)
+        renewed = Lock.objects.lock_object_for_user(self.article1, self.user)
+        renewed.expire(seconds=-10)
+        self.assertFalse(Lock.is_locked(self.article1))
+
+    def test_delete_and_save_renewed(self):
+        """Locks returned by a renewal or a takeover should have their pk, and be saved
+        and deleted like any other"""
+        lock = Lock.objects.lock_object_for_user(self.article1, self.user)
+        renewed = Lock.objects.lock_object_for_user(self.article1, self.user)
+        self.assertEqual(renewed.pk, lock.pk)
+        renewed.save(seconds=3600)
+        self.assertEqual(Lock.objects.get().date_expires, renewed.date_expires)
+        renewed.delete()
+        self.assertFalse(Lock.objects.exists())
+
+        new_user, _ = user_factory()
+        Lock.objects.lock_object_for_user(self.article1, self.user)
+        forced = Lock.objects.force_lock_object_for_user(self.article1, new_user)
+        self.assertEqual(forced.pk, Lock.objects.get().pk)
+        forced.delete()
+        self.assertFalse(Lock.is_locked(self.article1))
+
+    def test_large_object_id(self):
+        """Locks should work for object ids that don't fit a "ct.objid" string of 15 chars"""
+        lock = Lock.objects.create(locked_by=self.user, content_type=self.article_ct,
+                                   object_id=2147483647)
+        self.assertIsInstance(lock.pk, int)
+        self.assertEqual(Lock.objects.get(content_type=self.article_ct,
+                                          object_id=2147483647).pk, lock.pk)
+
+    def test_uuid_primary_key(self):
+        """Objects with UUID primary keys should be lockable, whatever the form of their id"""
+        snippet = Snippet.objects.create(content="Test")
+        snippet_ct = ContentType.objects.get_for_model(Snippet)
+        other_user, _ = user_factory()
+        lock = Lock.objects.lock_object_for_user(snippet, self.user)
+        self.assertEqual(lock.object_id, str(snippet.pk))
+        self.assertEqual(lock.content_object, snippet)
+        self.assertTrue(Lock.is_locked(snippet, for_user=other_user))
+        self.assertRaises(Lock.ObjectLockedError, Lock.objects.lock_for_user,
+                          snippet_ct, snippet.pk.hex.upper(), other_user)
+        self.assertEqual(lock.to_dict()['object_id'], snippet.pk)
+        self.assertTrue(Lock.objects.release_for_user(snippet_ct, snippet.pk.hex, self.user))
+        self.assertFalse(Lock.is_locked(snippet))
+
+    def test_string_primary_key(self):
+        """Objects with string primary keys should be lockable"""
+        tag = Tag.objects.create(name="a/b c")
+        other_tag = Tag.objects.create(name="a/b")
+        Lock.objects.lock_object_for_user(tag, self.user)
+        self.assertTrue(Lock.is_locked(tag))
+        self.assertFalse(Lock.is_locked(other_tag))
+        Lock.objects.lock_object_for_user(other_tag, self.user)
+        self.assertEqual(Lock.objects.count(), 2)
+
+    def test_object_key_collision(self):
+        """Locks on objects whose ids share a key should not be confused with each other"""
+        tag = Tag.objects.create(name="a")
+        other_tag = Tag.objects.create(name="b")
+        tag_ct = ContentType.objects.get_for_model(Tag)
+        lock = Lock.objects.lock_object_for_user(tag, self.user)
+        # Pretend that "b" hashes to the same key as "a"
+        Lock.objects.filter(pk=lock.pk).update(object_id="b")
+        self.assertFalse(Lock.is_locked(tag))
+        self.assertTrue(Lock.objects.release_for_user(tag_ct, tag.pk, self.user))
+        self.assertEqual(Lock.objects.count(), 1)
+        # The key is taken, so "a" can't be locked until the lock of "b" is released
+        other_user, _ = user_factory()
+        self.assertRaises(Lock.ObjectLockedError,
+                          Lock.objects.lock_object_for_user, tag, other_user)
+        lock = Lock.objects.get(pk=lock.pk)
+        lock.expire(seconds=-10)
+        self.assertEqual(Lock.objects.lock_object_for_user(tag, other_user).object_id, "a")
+        self.assertFalse(Lock.is_locked(other_tag))
+
+    def test_locked_map(self):
+        """Locks of instances of several models should be fetched with a single query"""
+        other_user, _ = user_factory()
+        snippet = Snippet.objects.create(content="Test")
+        tag = Tag.objects.create(name="a")
+        expired_tag = Tag.objects.create(name="b")
+        article_lock = Lock.objects.lock_object_for_user(self.article1, other_user)
+        snippet_lock = Lock.objects.lock_object_for_user(snippet, other_user)
+        tag_lock = Lock.objects.lock_object_for_user(tag, self.user)
+        Lock.objects.lock_object_for_user(expired_tag, other_user, seconds=-1)
+        instances = [self.article1, self.article2, snippet, tag, expired_tag,
+                     BlogArticle(title="Unsaved")]
+        with self.assertNumQueries(1):
+            locks = Lock.objects.locked_map(instances)
+        self.assertEqual(dict((obj, lock.pk) for obj, lock in locks.items()),
+                         {self.article1: article_lock.pk, snippet: snippet_lock.pk,
+                          tag: tag_lock.pk})
+        self.assertEqual(locks[self.article1].locked_by.username, other_user.username)
+        locks = Lock.objects.locked_map(instances, for_user=self.user)
+        self.assertEqual(set(locks), {self.article1, snippet})
+        with self.assertNumQueries(0):
+            self.assertEqual(Lock.objects.locked_map([]), {})
+
+    def test_prefetch_for(self):
+        """Instances should get their lock, or None, as an attribute"""
+        other_user, _ = user_factory()
+        lock = Lock.objects.lock_object_for_user(self.article1, other_user)
+        # The articles, and their locks
+        with self.assertNumQueries(2):
+            articles = Lock.objects.prefetch_for(BlogArticle.objects.order_by('pk'),
+                                                 to_attr='current_lock')
+        self.assertEqual(articles[0].current_lock.pk, lock.pk)
+        self.assertIsNone(articles[1].current_lock)
+        self.assertIsNone(Lock.objects.prefetch_for([self.article1], for_user=other_user)[0].lock)
+
+
+class TestLockHierarchy(test.TestCase):
+    """Books cover their chapters (as an inline of BookAdmin), chapters their paragraphs"""
+
+    def setUp(self):
+        self.user, _ = user_factory()
+        self.other_user, _ = user_factory()
+        self.book = Book.objects.create(title="Book")
+        self.chapter = Chapter.objects.create(book=self.book, title="Chapter")
+        self.paragraph = Paragraph.objects.create(chapter=self.chapter, content="Paragraph")
+        self.chapter_ct = ContentType.objects.get_for_model(Chapter)
+
+    def test_parent_lock_covers_children(self):
+        """Locking a book should lock its chapters and their paragraphs, with a single row"""
+        Lock.objects.lock_object_for_user(self.book, self.user)
+        for obj in (self.book, self.chapter, self.paragraph):
+            self.assertTrue(Lock.is_locked(obj, for_user=self.other_user))
+            self.assertFalse(Lock.is_locked(obj, for_user=self.user))
+        self.assertEqual(Lock.objects.count(), 1)
+        other_book = Book.objects.create(title="Other book")
+        self.assertFalse(Lock.is_locked(Chapter.objects.create(book=other_book, title="Other")))
+
+    def test_child_lock_doesnt_cover_parent(self):
+        """Locking a chapter should not lock its book"""
+        Lock.objects.lock_object_for_user(self.chapter, self.user)
+        self.assertFalse(Lock.is_locked(self.book))
+        self.assertTrue(Lock.is_locked(self.paragraph))
+
+    def test_lock_child_of_locked_parent(self):
+        """Other users shouldn't be able to lock a child of a locked parent"""
+        lock = Lock.objects.lock_object_for_user(self.book, self.user)
+        for obj in (self.chapter, self.paragraph):
+            with self.assertRaises(Lock.ObjectLockedError) as cm:
+                Lock.objects.lock_object_for_user(obj, self.other_user)
+            self.assertEqual(cm.exception.lock.pk, lock.pk)
+        # The chapter's own lock covers the paragraph once the book's is gone
+        Lock.objects.lock_object_for_user(self.chapter, self.user)
+        lock.expire(seconds=-10)
+        self.assertRaises(Lock.ObjectLockedError, Lock.objects.lock_object_for_user,
+                          self.paragraph, self.other_user)
+        self.assertFalse(Lock.is_locked(self.paragraph, for_user=self.user))
+
+    def test_lock_parent_of_locked_child(self):
+        """Other users shouldn't be able to lock a parent while a child or grandchild of
+        it is locked, but its holder should"""
+        for obj in (self.chapter, self.paragraph):
+            lock = Lock.objects.lock_object_for_user(obj, self.user)
+            with self.assertRaises(Lock.ObjectLockedError) as cm:
+                Lock.objects.lock_object_for_user(self.book, self.other_user)
+            self.assertEqual(cm.exception.lock.pk, lock.pk)
+            self.assertFalse(Lock.is_locked(self.book))
+            lock.delete()
+        Lock.objects.lock_object_for_user(self.paragraph, self.user)
+        Lock.objects.lock_object_for_user(self.book, self.user)
+        other_book = Book.objects.create(title="Other book")
+        Lock.objects.lock_object_for_user(other_book, self.other_user)
+
+    def test_lock_parent_queries(self):
+        """Locks of children with integer keys should be checked with a subquery per child
+        model, however many children there are"""
+        for i in range(50):
+            Chapter.objects.create(book=self.book, title="Chapter %s" % i)
+        # Failed renewal, lookup of chapters' and paragraphs' locks, lookup, insert in
+        # a savepoint
+        with self.assertNumQueries(7):
+            Lock.objects.lock_object_for_user(self.book, self.user)
+
+    def test_hashed_object_keys(self):
+        """Keys of objects with other primary keys should be computed in batches"""
+        snippets = [Snippet.objects.create(content="Snippet") for _ in range(3)]
+        snippet_type = ContentType.objects.get_for_model(Snippet)
+        batches = list(Lock.objects._object_keys(snippet_type, Snippet.objects.all()))
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(sorted(batches[0]),
+                         sorted(_object_key(snippet_type, s.pk)[0] for s in snippets))
+
+    def test_locked_map(self):
+        """Locks of ancestors should cover instances, with one more query for all of
+        their grandparents"""
+        lock = Lock.objects.lock_object_for_user(self.book, self.user)
+        other_chapter = Chapter.objects.create(book=Book.objects.create(title="Other"),
+                                               title="Other")
+        paragraphs = [self.paragraph,
+                      Paragraph.objects.create(chapter=self.chapter, content="Paragraph 2"),
+                      Paragraph.objects.create(chapter=other_chapter, content="Other")]
+        with self.assertNumQueries(2):
+            locks = Lock.objects.locked_map([self.book, self.chapter, other_chapter] +
+                                            paragraphs)
+        self.assertEqual(set(locks), {self.book, self.chapter, paragraphs[0], paragraphs[1]})
+        self.assertTrue(all(covering.pk == lock.pk for covering in locks.values()))
+        self.assertEqual(Lock.objects.locked_map(paragraphs, for_user=self.user), {})
+
+    def test_single_query(self):
+        """Finding the locks covering an object should take one query, plus one to find
+        ancestors beyond its parents"""
+        with self.assertNumQueries(1):
+            Lock.is_locked(self.chapter)
+        with self.assertNumQueries(2):
+            Lock.is_locked(self.paragraph)
+        with self.assertNumQueries(2):
+            list(Lock.objects.covering(self.chapter_ct, self.chapter.pk))
+
+
+class TestLockWait(test.TransactionTestCase):
+
+    def setUp(self):
+        self.user, _ = user_factory()
+        self.article = BlogArticle.objects.create(title="Test", content="Test")
+        self.article_ct = ContentType.objects.get_for_model(BlogArticle)
+
+    @test.override_settings(LOCKING_MAX_WAIT_SECONDS=5)
+    def test_wait_lock_for_user_wakes_on_release(self):
+        """`wait_lock_for_user` should take the lock as soon as its release is announced"""
+        Lock.objects.lock_object_for_user(self.article, self.user)
+        new_user, _ = user_factory()
+        released = []
+
+        def release():
+            Lock.objects.release_for_user(self.article_ct, self.article.pk, self.user)
+            released.append(time.time())
+
+        timer = threading.Timer(0.2, release)
+        timer.start()
+        lock = Lock.objects.wait_lock_for_user(self.article_ct, self.article.pk, new_user,
+                                               timeout=5)
+        timer.join()
+        self.assertEqual(lock.locked_by_id, new_user.pk)
+        self.assertLess(time.time() - released[0], 1)
+
+
+class TestLockHold(test.TestCase):
+
+    def setUp(self):
+        self.owner, _ = user_factory()
+        self.user, _ = user_factory()
+        for i in range(5):
+            BlogArticle.objects.create(title="Test %s" % i, content="Test")
+        self.articles = BlogArticle.objects.all()
+        self.article_ct = ContentType.objects.get_for_model(BlogArticle)
+
+    def test_hold_queryset(self):
+        """Holding a queryset locks all of its objects until the block exits"""
+        with Lock.objects.hold(self.articles, owner=self.owner) as hold:
+            self.assertEqual(Lock.objects.filter(locked_by=self.owner).count(), 5)
+            for article in self.articles:
+                self.assertTrue(Lock.is_locked(article, for_user=self.user))
+                self.assertRaises(Lock.ObjectLockedError, Lock.objects.lock_object_for_user,
+                                  article, self.user)
+            self.assertEqual(hold.renew(), 5)
+            self.assertEqual(hold.lost, 0)
+        self.assertFalse(Lock.objects.exists())
+
+    def test_hold_instances(self):
+        """Single objects and lists of objects can be held too"""
+        article = self.articles[0]
+        with Lock.objects.hold(article, owner=self.owner, ttl=600):
+            lock = Lock.objects.get()
+            self.assertEqual(lock.object_id, str(article.pk))
+            self.assertGreater(lock.date_expires, timezone.now() + timezone.timedelta(seconds=590))
+        with Lock.objects.hold(list(self.articles[:2]), owner=self.owner):
+            self.assertEqual(Lock.objects.count(), 2)
+        with Lock.objects.hold([], owner=self.owner):
+            self.assertFalse(Lock.objects.exists())
+        self.assertFalse(Lock.objects.exists())
+        self.assertRaises(ValueError, Lock.objects.hold, [article, Tag.objects.create(name="x")],
+                          owner=self.owner)
+
+    def test_hold_locked(self):
+        """Nothing is locked if another user holds the lock of any of the objects"""
+        article = self.articles[3]
+        Lock.objects.lock_object_for_user(article, self.user)
+        with self.assertRaises(Lock.ObjectLockedError) as cm:
+            with Lock.objects.hold(self.articles, owner=self.owner):
+                pass
+        self.assertEqual(cm.exception.lock.locked_by, self.user)
+        self.assertEqual(Lock.objects.get().locked_by, self.user)
+
+    def test_hold_locked_meanwhile(self):
+        """Locks other users gain between the check and the DELETE aren't deleted, and
+        stop the hold too"""
+        hold = Lock.objects.hold(self.articles, owner=self.owner)
+        raise_locked = hold._raise_locked
+
+        def lock_after_check():
+            raise_locked()
+            if not Lock.objects.exists():
+                Lock.objects.lock_object_for_user(self.articles[2], self.user)
+        hold._raise_locked = lock_after_check
+        with self.assertRaises(Lock.ObjectLockedError) as cm:
+            hold.acquire()
+        self.assertEqual(cm.exception.lock.locked_by, self.user)
+        # The other user's lock was taken in the hold's transaction, which is rolled back
+        self.assertFalse(Lock.objects.exists())
+
+    def test_hold_takes_over_expired_and_own_locks(self):
+        """Expired locks and the owner's own locks don't stop a hold"""
+        Lock.objects.lock_object_for_user(self.articles[0], self.user, seconds=-1)
+        Lock.objects.lock_object_for_user(self.articles[1], self.owner)
+        with Lock.objects.hold(self.articles, owner=self.owner):
+            self.assertEqual(Lock.objects.filter(locked_by=self.owner).count(), 5)
+        self.assertFalse(Lock.objects.exists())
+
+    def test_hold_lost(self):
+        """Locks taken over by other users are counted, and not released"""
+        article = self.articles[0]
+        with Lock.objects.hold(self.articles, owner=self.owner) as hold:
+            Lock.objects.force_lock_object_for_user(article, self.user)
+            self.assertEqual(hold.renew(), 4)
+            self.assertEqual(hold.lost, 1)
+        self.assertEqual(Lock.objects.get().locked_by, self.user)
+
+    def test_hold_queries(self):
+        """Holding takes the same number of queries however many objects are held"""
+        for n in (5, 100):
+            while BlogArticle.objects.count() < n:
+                BlogArticle.objects.create(title="Test", content="Test")
+            # pks, SELECT, DELETE and INSERT in savepoints
+            with self.assertNumQueries(8):
+                hold = Lock.objects.hold(self.articles, owner=self.owner)
+                hold.acquire()
+            with self.assertNumQueries(1):
+                hold.renew()
+            hold._stop.set()
+            with self.assertNumQueries(1):
+                hold.release()
+            self.assertFalse(Lock.objects.exists())
+
+
+class TestLockHoldRenewal(test.TransactionTestCase):
+
+    def test_hold_renews(self):
+        """Locks are renewed from a background thread until the block exits"""
+        owner, _ = user_factory()
+        article = BlogArticle.objects.create(title="Test", content="Test")
+        with Lock.objects.hold(article, owner=owner, ttl=0.3):
+            time.sleep(0.5)
+            lock = Lock.objects.get()
+            self.assertFalse(lock.has_expired)
+        self.assertFalse(Lock.objects.exists())
+
+
+class TestStatementTimeoutCommit(test.TransactionTestCase):
+
+    def test_announced_after_commit(self):
+        """Under a statement timeout, which runs lock changes in a transaction, waiters
+        and lock lists should only hear of a change once it's committed"""
+        user, _ = user_factory()
+        article = BlogArticle.objects.create(title="Test", content="Test")
+        content_type = ContentType.objects.get_for_model(BlogArticle)
+        Lock.objects.lock_object_for_user(article, user)
+        released = []
+
+        def on_released(sender, **kwargs):
+            released.append(Lock.objects.exists())
+        signals.lock_released.connect(on_released)
+        self.addCleanup(signals.lock_released.disconnect, on_released)
+        version = release_version(content_type.pk, article.pk)
+        using = router.db_for_write(Lock)
+        # What `statement_timeout` does on PostgreSQL, short of the SET LOCAL
+        with transaction.atomic(using=using):
+            timeouts._local.open = {using: 1}
+            try:
+                Lock.objects.release_for_user(content_type, article.pk, user)
+            finally:
+                timeouts._local.open = {}
+            self.assertEqual(released, [])
+            self.assertEqual(release_version(content_type.pk, article.pk), version)
+        self.assertEqual(released, [False])
+        self.assertNotEqual(release_version(content_type.pk, article.pk), version)
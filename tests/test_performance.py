@@ -0,0 +1,282 @@
+from __future__ import absolute_import, unicode_literals, division
+
+import os
+import sqlite3
+import time
+import unittest
+import uuid
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from django import test
+from django.contrib.admin.sites import site
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import BlogArticle, Snippet
+from .utils import LockingClient, user_factory
+from locking.api import (LockingJsonResponse, LockingStreamingJsonResponse, _for_reading,
+                         _list_response)
+from locking.models import Lock
+
+__all__ = ('TestQueryBudgets', 'TestAdminQueryBudgets', 'TestBenchmarks')
+
+# Every lock API request from a regular staff user loads the session, the user,
+# and the user's and groups' permissions before any locking code runs
+AUTH_QUERIES = 4
+
+
+class TestQueryBudgets(test.TestCase):
+    """
+    The exact number of queries each locking code path issues.
+
+    If one of these fails because a change legitimately needs another query,
+    update the budget in the same change, so the cost is a deliberate decision.
+    """
+
+    def setUp(self):
+        self.article = BlogArticle.objects.create(title="title", content="content")
+        self.article_ct = ContentType.objects.get_for_model(BlogArticle)
+        self.client_1 = LockingClient(self.article)
+        self.client_1.login_new_user()
+        self.client_2 = LockingClient(self.article)
+        self.client_2.login_new_user()
+        self.list_url = reverse('locking-api', kwargs={'app': 'locking',
+                                                       'model': 'blogarticle'})
+        # Warm the ContentType cache like a running server would have
+        ContentType.objects.get_by_natural_key('locking', 'blogarticle')
+
+    def test_post_acquire(self):
+        """Acquiring a free lock: failed renew, lookup, and insert in a savepoint"""
+        with self.assertNumQueries(AUTH_QUERIES + 5):
+            self.assertEqual(self.client_1.post().status_code, 200)
+
+    def test_post_renew(self):
+        """Renewing a held lock is a single UPDATE"""
+        self.client_1.post()
+        with self.assertNumQueries(AUTH_QUERIES + 1):
+            self.assertEqual(self.client_1.post().status_code, 200)
+
+    def test_post_renew_lease(self):
+        """Renewing a held lock with a lease skips the session and the user"""
+        lease = self.client_1.post()['X-Locking-Lease']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client_1.post(HTTP_X_LOCKING_LEASE=lease).status_code, 200)
+
+    def test_post_contended(self):
+        """Asking for someone else's lock: failed renew, then lookup with its owner"""
+        self.client_1.post()
+        with self.assertNumQueries(AUTH_QUERIES + 2):
+            self.assertEqual(self.client_2.post().status_code, 409)
+
+    def test_put_take(self):
+        """Taking over a lock is a single UPDATE"""
+        self.client_1.post()
+        with self.assertNumQueries(AUTH_QUERIES + 1):
+            self.assertEqual(self.client_2.put().status_code, 200)
+
+    def test_delete(self):
+        """Releasing a held lock is a single DELETE"""
+        self.client_1.post()
+        with self.assertNumQueries(AUTH_QUERIES + 1):
+            self.assertEqual(self.client_1.delete().status_code, 204)
+
+    def test_delete_lease(self):
+        """Releasing a held lock with a lease is a single DELETE, and nothing else"""
+        lease = self.client_1.post()['X-Locking-Lease']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client_1.delete(HTTP_X_LOCKING_LEASE=lease).status_code, 204)
+
+    def test_get_list(self):
+        """Listing locks is one query, however many locks there are"""
+        for n in (1, 10, 50):
+            Lock.objects.all().delete()
+            for i in range(n):
+                Lock.objects.create(locked_by=self.client_2.user, content_type=self.article_ct,
+                                    object_id=i + 1)
+            with self.assertNumQueries(AUTH_QUERIES + 1):
+                rsp = self.client_1.client.get(self.list_url)
+            self.assertEqual(len(rsp.json()), n)
+
+    @test.override_settings(LOCKING_LIST_CACHE_SECONDS=5)
+    def test_get_list_cached(self):
+        """With LOCKING_LIST_CACHE_SECONDS, only the first of many editors polling the
+        same list queries the locks"""
+        cache.clear()
+        self.client_2.post()
+        with self.assertNumQueries(AUTH_QUERIES + 1):
+            self.client_1.client.get(self.list_url)
+        with self.assertNumQueries(AUTH_QUERIES):
+            rsp = self.client_2.client.get(self.list_url)
+        self.assertEqual(len(rsp.json()), 1)
+        # Renewals don't change who holds which lock
+        self.client_2.post()
+        with self.assertNumQueries(AUTH_QUERIES):
+            self.client_1.client.get(self.list_url)
+
+    def test_get_list_all_models(self):
+        """Listing the locks of all models is one query too, with the permissions
+        turned into content types from the ContentType cache"""
+        snippet_ct = ContentType.objects.get_for_model(Snippet)
+        for i in range(10):
+            Lock.objects.create(locked_by=self.client_2.user, content_type=self.article_ct,
+                                object_id=i + 1)
+            Lock.objects.create(locked_by=self.client_2.user, content_type=snippet_ct,
+                                object_id=uuid.uuid4())
+        with self.assertNumQueries(AUTH_QUERIES + 1):
+            rsp = self.client_1.client.get(reverse('locking-api-list'))
+        # client_1 may only change articles
+        self.assertEqual(len(rsp.json()), 10)
+
+    def test_has_delete_permission(self):
+        """The lock check of has_delete_permission is one query (in a savepoint), and is
+        only made once per request"""
+        request = test.RequestFactory().get('/')
+        request.user = self.client_1.user
+        admin = site._registry[BlogArticle]
+        self.client_2.post()
+        with self.assertNumQueries(3):
+            self.assertFalse(admin.get_other_users_lock(request, self.article) is None)
+        with self.assertNumQueries(0):
+            admin.has_delete_permission(request, self.article)
+
+
+class TestAdminQueryBudgets(test.TestCase):
+    """The exact number of queries issued by the views of a locking admin"""
+
+    def setUp(self):
+        self.article = BlogArticle.objects.create(title="title", content="content")
+        user, password = user_factory(BlogArticle)
+        self.client.login(username=user.username, password=password)
+        self.change_url = reverse('admin:locking_blogarticle_change', args=(self.article.pk, ))
+        self.changelist_url = reverse('admin:locking_blogarticle_changelist')
+
+    def test_changeform_get(self):
+        """Change forms take the lock, which tells whether to show the delete link"""
+        # session, user, savepoint, article, 2 * permissions, savepoint, renewal, lock,
+        # savepoint, insert, 3 * release savepoint
+        with self.assertNumQueries(14):
+            self.client.get(self.change_url)
+        # session, user, savepoint, article, 2 * permissions, savepoint, renewal,
+        # 2 * release savepoint
+        with self.assertNumQueries(10):
+            self.client.get(self.change_url)
+
+    def test_changeform_post(self):
+        """Saving a change form checks the lock once"""
+        # session, user, savepoint, article, 2 * permissions, savepoint, lock,
+        # release savepoint, update, log entry, release savepoint
+        with self.assertNumQueries(12):
+            self.client.post(self.change_url, {'title': 'new title', 'content': 'content'})
+
+    def test_changelist(self):
+        """Changelists don't query locks, they are fetched by the browser"""
+        # session, user, 2 * permissions, 2 * count, page of articles
+        with self.assertNumQueries(7):
+            self.client.get(self.changelist_url)
+
+
+def benchmark(func, rounds=200):
+    """Run `func` `rounds` times and return the fastest and the mean time in ms"""
+    times = []
+    for _ in range(rounds):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times) * 1000, sum(times) / len(times) * 1000
+
+
+@unittest.skipUnless(os.environ.get('LOCKING_BENCHMARK'),
+                     'Set LOCKING_BENCHMARK=1 to run the LockingManager benchmarks')
+class TestBenchmarks(test.TestCase):
+    """Micro-benchmarks of the LockingManager hot paths, reported on stdout"""
+
+    def setUp(self):
+        self.user, _ = user_factory()
+        self.other_user, _ = user_factory()
+        self.article = BlogArticle.objects.create(title="title", content="content")
+        self.article_ct = ContentType.objects.get_for_model(BlogArticle)
+        for i in range(1000):
+            Lock.objects.create(locked_by=self.other_user, content_type=self.article_ct,
+                                object_id=self.article.pk + i + 1)
+
+    def report(self, name, func):
+        fastest, mean = benchmark(func)
+        print('\n%-30s min %.3f ms, mean %.3f ms' % (name, fastest, mean))
+
+    def test_lock_for_user(self):
+        Lock.objects.lock_object_for_user(self.article, self.user)
+        self.report('lock_for_user (renew)', lambda: Lock.objects.lock_for_user(
+            self.article_ct, self.article.pk, self.user))
+
+    def test_force_lock_for_user(self):
+        self.report('force_lock_for_user', lambda: Lock.objects.force_lock_for_user(
+            self.article_ct, self.article.pk, self.user))
+
+    def test_is_locked(self):
+        self.report('is_locked', lambda: Lock.is_locked(self.article, for_user=self.user))
+
+    def test_to_dict(self):
+        locks = list(Lock.objects.select_related('locked_by'))
+        self.report('to_dict x 1000', lambda: [lock.to_dict() for lock in locks])
+
+    def test_primary_keys(self):
+        """Size and lookup time of 100k locks keyed by "ct.objid" strings and by integers"""
+        columns = ('locked_by_id integer NOT NULL, date_expires datetime NOT NULL, '
+                   'content_type_id integer NOT NULL, object_id varchar(255) NOT NULL, '
+                   'object_key bigint NOT NULL')
+        schemas = [
+            # name, primary key, unique index, lookup, key of object i (also its id)
+            ('"ct.objid" key', 'id varchar(15) NOT NULL PRIMARY KEY',
+             'content_type_id, object_id', 'id = ?', lambda i: '9.%d' % i),
+            ('integer key', 'id integer NOT NULL PRIMARY KEY AUTOINCREMENT',
+             'content_type_id, object_key', 'content_type_id = 9 AND object_key = ?',
+             lambda i: i),
+        ]
+        for name, primary_key, unique, lookup, key in schemas:
+            db = sqlite3.connect(':memory:')
+            db.execute('CREATE TABLE locking_lock (%s, %s, UNIQUE (%s))'
+                       % (primary_key, columns, unique))
+            db.executemany('INSERT INTO locking_lock VALUES (?, 1, ?, 9, ?, ?)',
+                           ((key(i), '2100-01-01', str(i), i) for i in range(100000)))
+            pages, = db.execute('PRAGMA page_count').fetchone()
+            page_size, = db.execute('PRAGMA page_size').fetchone()
+            query = 'SELECT id FROM locking_lock WHERE %s' % lookup
+            fastest, mean = benchmark(lambda: [
+                db.execute(query, (key(i), )).fetchone() for i in range(0, 100000, 100)])
+            print('\n%-30s %.1f MB, 1000 lookups min %.3f ms, mean %.3f ms'
+                  % (name, pages * page_size / 2 ** 20, fastest, mean))
+            db.close()
+
+    @unittest.skipIf(tracemalloc is None, 'Needs tracemalloc (Python 3.4+)')
+    def test_list_responses(self):
+        """Time and peak memory of whole, streamed and paginated lists of 10k and 100k locks"""
+        locks = _for_reading(Lock.objects.filter(content_type=self.article_ct), self.user)
+        request = test.RequestFactory().get('/', {'limit': 1000})
+        responses = [
+            ('whole', lambda: LockingJsonResponse(locks.all()).content),
+            # Chunks are dropped as they are sent to the client
+            ('streamed', lambda: [None for _ in LockingStreamingJsonResponse(locks)]),
+            ('page of 1000', lambda: _list_response(request, locks).content),
+        ]
+        created = Lock.objects.count()
+        for n in (10000, 100000):
+            Lock.objects.bulk_create(
+                Lock(locked_by=self.other_user, content_type=self.article_ct, object_id=i,
+                     object_key=i, date_expires=timezone.now() + timezone.timedelta(hours=1))
+                for i in range(10 ** 6 + created, 10 ** 6 + n))
+            created = n
+            for name, func in responses:
+                tracemalloc.start()
+                start = time.time()
+                func()
+                elapsed = time.time() - start
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print('\n%-30s %.3f s, peak %.1f MB' % ('%s list x %d' % (name, n), elapsed,
+                                                        peak / 2 ** 20))
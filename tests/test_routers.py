@@ -0,0 +1,97 @@
+from __future__ import absolute_import, unicode_literals, division
+
+import time
+
+from django import test
+from django.core.cache import cache
+from django.contrib.contenttypes.models import ContentType
+
+from .models import BlogArticle
+from .utils import LockingClient, user_factory
+from locking.models import Lock
+from locking.routers import LockingRouter, read_database
+
+__all__ = ('TestLockingRouter', 'TestReadDatabase')
+
+
+@test.override_settings(DATABASE_ROUTERS=['locking.routers.LockingRouter'],
+                        LOCKING_DATABASE='locks')
+class TestLockingRouter(test.TestCase):
+    multi_db = True
+
+    def setUp(self):
+        self.user, _ = user_factory()
+        self.article = BlogArticle.objects.create(title="title", content="content")
+        self.article_ct = ContentType.objects.get_for_model(BlogArticle)
+
+    def test_locks_use_locking_database(self):
+        """Locks should be read from and written to LOCKING_DATABASE only"""
+        Lock.objects.lock_object_for_user(self.article, self.user)
+        Lock.objects.lock_object_for_user(self.article, self.user)
+        self.assertEqual(Lock.objects.using('default').count(), 0)
+        self.assertEqual(Lock.objects.using('locks').count(), 1)
+        self.assertTrue(Lock.is_locked(self.article))
+        other_user, _ = user_factory()
+        with self.assertRaises(Lock.ObjectLockedError) as cm:
+            Lock.objects.lock_object_for_user(self.article, other_user)
+        self.assertEqual(cm.exception.lock.locked_by, self.user)
+        self.assertTrue(Lock.objects.release_for_user(self.article_ct, self.article.pk, self.user))
+        self.assertEqual(Lock.objects.using('locks').count(), 0)
+
+    def test_owner_is_read_from_users_database(self):
+        """Lock owners live in another database, so they should be prefetched"""
+        Lock.objects.lock_object_for_user(self.article, self.user)
+        with self.assertNumQueries(1, using='locks'), self.assertNumQueries(1, using='default'):
+            lock = Lock.objects.with_owner().get()
+            self.assertEqual(lock.locked_by, self.user)
+
+    def test_api(self):
+        """The lock API should work with locks in their own database"""
+        client = LockingClient(self.article)
+        client.login_new_user()
+        self.assertEqual(client.post().status_code, 200)
+        self.assertEqual(client.get().json()[0]['locked_by']['username'], client.user.username)
+        self.assertEqual(client.delete().status_code, 204)
+
+    def test_allow_migrate(self):
+        """Only the locking database should have a lock table"""
+        router = LockingRouter()
+        self.assertTrue(router.allow_migrate('locks', 'locking', 'lock'))
+        self.assertFalse(router.allow_migrate('default', 'locking', 'lock'))
+        self.assertIsNone(router.allow_migrate('default', 'locking', 'blogarticle'))
+        with self.settings(LOCKING_DATABASE=None):
+            self.assertIsNone(router.allow_migrate('default', 'locking', 'lock'))
+
+
+@test.override_settings(LOCKING_READ_DATABASE='locks')
+class TestReadDatabase(test.TestCase):
+    """The 'locks' database stands in for a replica that hasn't seen any writes yet"""
+    multi_db = True
+
+    def setUp(self):
+        cache.clear()
+        self.article = BlogArticle.objects.create(title="title", content="content")
+        self.client_1 = LockingClient(self.article)
+        self.client_1.login_new_user()
+        self.client_2 = LockingClient(self.article)
+        self.client_2.login_new_user()
+
+    def test_lists_read_from_replica(self):
+        """Lock lists should come from LOCKING_READ_DATABASE"""
+        self.assertEqual(read_database(self.client_1.user), 'locks')
+        Lock.objects.lock_object_for_user(self.article, self.client_2.user)
+        self.assertEqual(self.client_1.get().json(), [])
+
+    def test_own_changes_read_from_primary(self):
+        """Users should see their own lock changes right away"""
+        self.assertEqual(self.client_1.post().status_code, 200)
+        self.assertIsNone(read_database(self.client_1.user))
+        self.assertEqual(len(self.client_1.get().json()), 1)
+        self.assertEqual(self.client_2.get().json(), [])
+
+    @test.override_settings(LOCKING_READ_PIN_SECONDS=0.1)
+    def test_pin_expires(self):
+        """Reads should go back to LOCKING_READ_DATABASE after LOCKING_READ_PIN_SECONDS"""
+        self.client_1.post()
+        time.sleep(0.2)
+        self.assertEqual(read_database(self.client_1.user), 'locks')
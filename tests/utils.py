@@ -1,13 +1,15 @@
 from __future__ import absolute_import, unicode_literals, division
 
 from django import test
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
+from django.contrib.admin.utils import quote
 from django.contrib.contenttypes.models import ContentType
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
 
-__all__ = ('LockingClient', 'user_factory')
+__all__ = ('LockingClient', 'TimestampJSONEncoder', 'user_factory')
 
 
 def user_factory(model=None):
@@ -26,6 +28,15 @@ def user_factory(model=None):
     return user, password
 
 
+class TimestampJSONEncoder(DjangoJSONEncoder):
+    """Encodes dates as POSIX timestamps, to test `LOCKING_JSON_ENCODER`"""
+
+    def default(self, o):
+        if isinstance(o, timezone.datetime):
+            return (o - timezone.datetime(1970, 1, 1, tzinfo=timezone.utc)).total_seconds()
+        return super(TimestampJSONEncoder, self).default(o)
+
+
 class LockingClient(object):
 
     def __init__(self, instance):
@@ -33,7 +44,7 @@ class LockingClient(object):
         self.url = reverse('locking-api', kwargs={
             'app': instance._meta.app_label,
             'model': instance._meta.object_name,
-            'object_id': instance.pk,
+            'object_id': quote(instance.pk),
         })
         self.client = test.Client()
         self.user = None